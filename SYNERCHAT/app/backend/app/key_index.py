@@ -0,0 +1,431 @@
+"""Local mirror of the KeyRegistry contract, fed by its events.
+
+The indexer follows DeviceKeyRegistered / Rotated / Revoked logs from
+KEY_INDEX_START_BLOCK (the deployment block) and applies them to a SQLite
+table together with the checkpoint, in one transaction per batch. Only blocks
+with KEY_INDEX_CONFIRMATIONS confirmations are indexed, so the mirror lags the
+chain by that many blocks and an ordinary reorg never reaches it. A deeper one
+is caught by the block hashes recorded at each batch: the index rewinds to the
+newest of them still on the chain and replays its event journal from there.
+
+Run one indexer per deployment, next to the uvicorn workers:
+
+    python -m app.key_index
+
+or set KEY_INDEX_IN_PROCESS=1 to run it inside the app (single worker).
+Workers only read the mirror, and only once the indexer reports being caught up.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from web3 import Web3
+
+from .utils.chain import get_web3, close_web3
+
+
+logger = logging.getLogger(__name__)
+
+KEYREGISTRY_ADDRESS = os.getenv("KEYREGISTRY_ADDRESS", "")
+KEY_INDEX_DB = os.getenv("KEY_INDEX_DB", "key_index.db")
+KEY_INDEX_START_BLOCK = int(os.getenv("KEY_INDEX_START_BLOCK", "0"))
+KEY_INDEX_CONFIRMATIONS = int(os.getenv("KEY_INDEX_CONFIRMATIONS", "64"))
+KEY_INDEX_BATCH_BLOCKS = int(os.getenv("KEY_INDEX_BATCH_BLOCKS", "2000"))
+KEY_INDEX_POLL_SECONDS = float(os.getenv("KEY_INDEX_POLL_SECONDS", "5"))
+# Readers stop trusting the mirror when the indexer hasn't reported for this long
+KEY_INDEX_STALE_SECONDS = float(os.getenv("KEY_INDEX_STALE_SECONDS", "120"))
+KEY_INDEX_IN_PROCESS = os.getenv("KEY_INDEX_IN_PROCESS", "0") == "1"
+# Batch-end block hashes kept for reorg detection
+KEY_INDEX_HASHES_KEPT = 128
+
+_DEVICE_KEY = {
+    "components": [
+        {"internalType": "bytes32", "name": "deviceId", "type": "bytes32"},
+        {"internalType": "bytes", "name": "pubEncKey", "type": "bytes"},
+        {"internalType": "bytes", "name": "pubSigKey", "type": "bytes"},
+        {"internalType": "uint256", "name": "registeredAt", "type": "uint256"},
+        {"internalType": "bool", "name": "active", "type": "bool"}
+    ],
+    "internalType": "struct KeyRegistry.DeviceKey",
+    "name": "",
+    "type": "tuple"
+}
+
+
+def _event(name: str, key_fields: Tuple[str, str] = ()) -> dict:
+    inputs = [
+        {"indexed": True, "internalType": "address", "name": "owner", "type": "address"},
+        {"indexed": True, "internalType": "bytes32", "name": "deviceId", "type": "bytes32"},
+    ]
+    inputs += [{"indexed": False, "internalType": "bytes", "name": field, "type": "bytes"} for field in key_fields]
+    return {"anonymous": False, "inputs": inputs, "name": name, "type": "event"}
+
+
+ABI_KEYREGISTRY = [
+    {
+        "inputs": [
+            {"internalType": "address", "name": "owner", "type": "address"},
+            {"internalType": "bytes32", "name": "deviceId", "type": "bytes32"},
+        ],
+        "name": "getDeviceKey",
+        "outputs": [_DEVICE_KEY],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    _event("DeviceKeyRegistered", ("pubEncKey", "pubSigKey")),
+    _event("DeviceKeyRotated", ("newPubEncKey", "newPubSigKey")),
+    _event("DeviceKeyRevoked"),
+]
+
+# topic0 -> event name
+EVENT_TOPICS = {
+    Web3.to_hex(Web3.keccak(text=f"{item['name']}({','.join(i['type'] for i in item['inputs'])})")): item["name"]
+    for item in ABI_KEYREGISTRY if item["type"] == "event"
+}
+
+EMPTY_KEY = {"deviceId": "0x" + "00" * 32, "pubEncKey": "0x", "pubSigKey": "0x", "registeredAt": 0, "active": False}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_keys (
+    owner TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    pub_enc_key TEXT NOT NULL,
+    pub_sig_key TEXT NOT NULL,
+    registered_at INTEGER NOT NULL,
+    active INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    PRIMARY KEY (owner, device_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS index_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    contract TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    caught_up INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS key_events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    pub_enc_key TEXT,
+    pub_sig_key TEXT,
+    registered_at INTEGER,
+    PRIMARY KEY (block_number, log_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_key_events_owner_device ON key_events (owner, device_id);
+CREATE TABLE IF NOT EXISTS indexed_blocks (
+    block_number INTEGER PRIMARY KEY,
+    block_hash TEXT NOT NULL
+);
+"""
+
+
+class KeyIndex:
+    """SQLite mirror of device keys; owners are checksum addresses, ids 0x-hex"""
+
+    def __init__(self, path: str = KEY_INDEX_DB) -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._ready_checked_at = 0.0
+        self._ready = False
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def state(self) -> Optional[dict]:
+        row = self.conn.execute(
+            "SELECT contract, block_number, caught_up, updated_at FROM index_state WHERE id = 1"
+        ).fetchone()
+        if row is None:
+            return None
+        return {"contract": row[0], "block_number": row[1], "caught_up": bool(row[2]), "updated_at": row[3]}
+
+    def is_ready(self) -> bool:
+        """True when the indexer is caught up and alive (re-checked at most once a second)"""
+        now = time.time()
+        if now - self._ready_checked_at >= 1:
+            state = self.state()
+            self._ready = bool(
+                state
+                and state["contract"] == KEYREGISTRY_ADDRESS.lower()
+                and state["caught_up"]
+                and now - state["updated_at"] < KEY_INDEX_STALE_SECONDS
+            )
+            self._ready_checked_at = now
+        return self._ready
+
+    @staticmethod
+    def _row_to_key(row: tuple) -> dict:
+        return {"deviceId": row[0], "pubEncKey": row[1], "pubSigKey": row[2], "registeredAt": row[3], "active": bool(row[4])}
+
+    def get(self, owner: str, device_id: str) -> dict:
+        row = self.conn.execute(
+            "SELECT device_id, pub_enc_key, pub_sig_key, registered_at, active FROM device_keys "
+            "WHERE owner = ? AND device_id = ?",
+            (owner, device_id)
+        ).fetchone()
+        return self._row_to_key(row) if row else dict(EMPTY_KEY)
+
+    def get_many(self, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], dict]:
+        """Keys of many (owner, device_id) pairs in one query; unknown pairs map to the empty key"""
+        result = {pair: dict(EMPTY_KEY) for pair in pairs}
+        unique = list(result)
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 400):
+            chunk = unique[start:start + 400]
+            rows = self.conn.execute(
+                "SELECT owner, device_id, pub_enc_key, pub_sig_key, registered_at, active FROM device_keys "
+                f"WHERE (owner, device_id) IN (VALUES {', '.join('(?, ?)' for _ in chunk)})",
+                [value for pair in chunk for value in pair]
+            ).fetchall()
+            for row in rows:
+                result[(row[0], row[1])] = self._row_to_key(row[1:])
+        return result
+
+    @staticmethod
+    def _apply_event(conn: sqlite3.Connection, event: dict) -> None:
+        owner, device_id = event["owner"], event["deviceId"]
+        if event["event"] == "DeviceKeyRegistered":
+            conn.execute(
+                "INSERT OR REPLACE INTO device_keys "
+                "(owner, device_id, pub_enc_key, pub_sig_key, registered_at, active, block_number) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?)",
+                (owner, device_id, event["pubEncKey"], event["pubSigKey"], event["timestamp"], event["blockNumber"])
+            )
+        elif event["event"] == "DeviceKeyRotated":
+            conn.execute(
+                "UPDATE device_keys SET pub_enc_key = ?, pub_sig_key = ?, block_number = ? "
+                "WHERE owner = ? AND device_id = ?",
+                (event["pubEncKey"], event["pubSigKey"], event["blockNumber"], owner, device_id)
+            )
+        elif event["event"] == "DeviceKeyRevoked":
+            conn.execute(
+                "UPDATE device_keys SET active = 0, block_number = ? WHERE owner = ? AND device_id = ?",
+                (event["blockNumber"], owner, device_id)
+            )
+
+    @staticmethod
+    def _set_state(conn: sqlite3.Connection, block_number: int, caught_up: bool) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO index_state (id, contract, block_number, caught_up, updated_at) "
+            "VALUES (1, ?, ?, ?, ?)",
+            (KEYREGISTRY_ADDRESS.lower(), block_number, int(caught_up), time.time())
+        )
+
+    def apply(self, events: Iterable[dict], block_number: int, caught_up: bool,
+              block_hash: Optional[str] = None) -> None:
+        """Apply decoded events (in chain order) and move the checkpoint, atomically
+
+        `block_hash` is the hash of `block_number`, recorded to detect a reorg
+        of the indexed range later on.
+        """
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for event in events:
+                self._apply_event(conn, event)
+                conn.execute(
+                    "INSERT OR REPLACE INTO key_events "
+                    "(block_number, log_index, event, owner, device_id, pub_enc_key, pub_sig_key, registered_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (event["blockNumber"], event["logIndex"], event["event"], event["owner"], event["deviceId"],
+                     event.get("pubEncKey"), event.get("pubSigKey"), event.get("timestamp"))
+                )
+            if block_hash is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO indexed_blocks (block_number, block_hash) VALUES (?, ?)",
+                    (block_number, block_hash)
+                )
+                conn.execute(
+                    "DELETE FROM indexed_blocks WHERE block_number NOT IN "
+                    "(SELECT block_number FROM indexed_blocks ORDER BY block_number DESC LIMIT ?)",
+                    (KEY_INDEX_HASHES_KEPT,)
+                )
+            self._set_state(conn, block_number, caught_up)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def indexed_blocks(self) -> List[Tuple[int, str]]:
+        """Recorded (block_number, block_hash) pairs, newest first"""
+        return self.conn.execute(
+            "SELECT block_number, block_hash FROM indexed_blocks ORDER BY block_number DESC"
+        ).fetchall()
+
+    def rewind(self, block_number: int) -> None:
+        """Forget everything indexed after block_number and rebuild the keys it touched from the journal"""
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            pairs = conn.execute(
+                "SELECT DISTINCT owner, device_id FROM key_events WHERE block_number > ?", (block_number,)
+            ).fetchall()
+            conn.execute("DELETE FROM key_events WHERE block_number > ?", (block_number,))
+            conn.execute("DELETE FROM indexed_blocks WHERE block_number > ?", (block_number,))
+            for owner, device_id in pairs:
+                conn.execute("DELETE FROM device_keys WHERE owner = ? AND device_id = ?", (owner, device_id))
+                rows = conn.execute(
+                    "SELECT block_number, event, pub_enc_key, pub_sig_key, registered_at FROM key_events "
+                    "WHERE owner = ? AND device_id = ? ORDER BY block_number, log_index",
+                    (owner, device_id)
+                ).fetchall()
+                for row in rows:
+                    self._apply_event(conn, {
+                        "blockNumber": row[0], "event": row[1], "owner": owner, "deviceId": device_id,
+                        "pubEncKey": row[2], "pubSigKey": row[3], "timestamp": row[4]
+                    })
+            self._set_state(conn, block_number, caught_up=False)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+key_index = KeyIndex()
+
+
+class KeyIndexer:
+    """Follows KeyRegistry events into a KeyIndex"""
+
+    def __init__(self, index: KeyIndex = key_index) -> None:
+        self.index = index
+        self._task: Optional[asyncio.Task] = None
+
+    async def _contract(self):
+        w3 = await get_web3()
+        return w3, w3.eth.contract(address=Web3.to_checksum_address(KEYREGISTRY_ADDRESS), abi=ABI_KEYREGISTRY)
+
+    async def _fetch(self, w3, contract, from_block: int, to_block: int) -> List[dict]:
+        logs = await w3.eth.get_logs({
+            "address": contract.address,
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "topics": [list(EVENT_TOPICS)]
+        })
+        logs = sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"]))
+
+        events = []
+        timestamps: Dict[int, int] = {}
+        for log in logs:
+            name = EVENT_TOPICS[Web3.to_hex(log["topics"][0])]
+            args = contract.events[name]().process_log(log)["args"]
+            event = {
+                "event": name,
+                "owner": Web3.to_checksum_address(args["owner"]),
+                "deviceId": "0x" + bytes(args["deviceId"]).hex(),
+                "blockNumber": log["blockNumber"],
+                "logIndex": log["logIndex"]
+            }
+            if name == "DeviceKeyRegistered":
+                # registeredAt is the block timestamp, as stored by the contract
+                if log["blockNumber"] not in timestamps:
+                    block = await w3.eth.get_block(log["blockNumber"])
+                    timestamps[log["blockNumber"]] = int(block["timestamp"])
+                event["timestamp"] = timestamps[log["blockNumber"]]
+            if name != "DeviceKeyRevoked":
+                enc, sig = (("pubEncKey", "pubSigKey") if name == "DeviceKeyRegistered"
+                            else ("newPubEncKey", "newPubSigKey"))
+                event["pubEncKey"] = "0x" + bytes(args[enc]).hex()
+                event["pubSigKey"] = "0x" + bytes(args[sig]).hex()
+            events.append(event)
+        return events
+
+    async def _block_hash(self, w3, block_number: int) -> str:
+        return Web3.to_hex((await w3.eth.get_block(block_number))["hash"])
+
+    async def _check_reorg(self, w3) -> bool:
+        """Rewind when the chain no longer contains the indexed blocks; True if it did"""
+        recorded = self.index.indexed_blocks()
+        if not recorded or await self._block_hash(w3, recorded[0][0]) == recorded[0][1]:
+            return False
+        rewind_to = KEY_INDEX_START_BLOCK - 1
+        for block_number, block_hash in recorded[1:]:
+            if await self._block_hash(w3, block_number) == block_hash:
+                rewind_to = block_number
+                break
+        logger.warning("Reorg below the confirmation depth at block %d: rewinding to %d", recorded[0][0], rewind_to)
+        self.index.rewind(rewind_to)
+        return True
+
+    async def sync_once(self) -> bool:
+        """Index confirmed blocks up to the current head; True when caught up"""
+        w3, contract = await self._contract()
+        confirmed = await w3.eth.block_number - KEY_INDEX_CONFIRMATIONS
+        state = self.index.state()
+        if state and state["contract"] == KEYREGISTRY_ADDRESS.lower():
+            if await self._check_reorg(w3):
+                return False
+            next_block = state["block_number"] + 1
+        else:
+            next_block = KEY_INDEX_START_BLOCK
+        if next_block > confirmed:
+            # Nothing new: refresh the heartbeat only
+            self.index.apply([], next_block - 1, caught_up=True)
+            return True
+
+        to_block = min(confirmed, next_block + KEY_INDEX_BATCH_BLOCKS - 1)
+        events = await self._fetch(w3, contract, next_block, to_block)
+        block_hash = await self._block_hash(w3, to_block)
+        self.index.apply(events, to_block, caught_up=to_block >= confirmed, block_hash=block_hash)
+        if events:
+            logger.info("Indexed %d key events up to block %d", len(events), to_block)
+        return to_block >= confirmed
+
+    async def run(self) -> None:
+        while True:
+            try:
+                caught_up = await self.sync_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Key indexer error: %s", exc)
+                caught_up = True
+            # Keep going without pause while catching up
+            if caught_up:
+                await asyncio.sleep(KEY_INDEX_POLL_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+key_indexer = KeyIndexer()
+
+
+async def _main() -> None:
+    if not KEYREGISTRY_ADDRESS:
+        raise SystemExit("KEYREGISTRY_ADDRESS not configured")
+    try:
+        await key_indexer.run()
+    finally:
+        await close_web3()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -2,19 +2,27 @@ import os
 from datetime import timedelta
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.middleware import SlowAPIMiddleware
 
+from .key_index import KEY_INDEX_IN_PROCESS, KEYREGISTRY_ADDRESS, key_indexer
 from .routers import auth, keys, payments, ws
+from .utils.chain import close_web3
+from .utils.limiter import limiter
+from .utils.signatures import signature_verifier
 
 
 JWT_TTL_SECONDS = int(os.getenv("JWT_TTL_SECONDS", "600"))
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
 
-limiter = Limiter(key_func=get_remote_address)
-
 app = FastAPI(title="Synerchat Backend", version="0.1.0")
 
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Inside CORS, so 429 responses still carry the CORS headers
+app.add_middleware(SlowAPIMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS,
@@ -30,4 +38,20 @@ app.include_router(ws.router, tags=["ws"])  # includes /ws/{conversationId}
 
 @app.get("/healthz")
 async def healthz():
-    return {"ok": True, "ttl": JWT_TTL_SECONDS}
\ No newline at end of file
+    return {"ok": True, "ttl": JWT_TTL_SECONDS}
+
+
+@app.on_event("startup")
+async def startup() -> None:
+    await auth.nonce_store.start()
+    signature_verifier.start()
+    if KEY_INDEX_IN_PROCESS and KEYREGISTRY_ADDRESS:
+        key_indexer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await key_indexer.stop()
+    await auth.nonce_store.close()
+    signature_verifier.shutdown()
+    await close_web3()
@@ -1,17 +1,24 @@
 import os
 import time
 import secrets
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from eth_account import Account
-from eth_account.messages import encode_defunct
 
+from ..utils.cache import AsyncTTLCache
 from ..utils.jwt import issue_jwt
+from ..utils.limiter import RATE_LIMIT_SIWE, limiter
+from ..utils.nonces import create_nonce_store
+from ..utils.signatures import SIGNATURE_CACHE_TTL_SECONDS, SignerBusy, signature_digest, signature_verifier
 
 
 router = APIRouter()
 
-NONCES: dict[str, str] = {}
+# Shared by all workers, so siwe-start and siwe-verify may hit different ones;
+# opened on startup
+nonce_store = create_nonce_store()
+# (message, signature) digest -> response, so a client retrying a verify whose
+# response it lost gets the same token instead of a consumed-nonce error
+verified_logins = AsyncTTLCache(ttl=SIGNATURE_CACHE_TTL_SECONDS, maxsize=10000)
 
 
 class SiweStartResponse(BaseModel):
@@ -37,12 +44,13 @@ class SiweVerifyResponse(BaseModel):
 
 
 @router.get("/siwe-start", response_model=SiweStartResponse)
-async def siwe_start(address: str, deviceId: str, chainId: int = 137):
+@limiter.limit(RATE_LIMIT_SIWE)
+async def siwe_start(request: Request, address: str, deviceId: str, chainId: int = 137):
     issued_at = int(time.time())
     ttl = int(os.getenv("JWT_TTL_SECONDS", "600"))
     expires_at = issued_at + ttl
     nonce = secrets.token_hex(16)
-    NONCES[f"{address.lower()}:{deviceId}"] = nonce
+    await nonce_store.put(f"{address.lower()}:{deviceId}", nonce)
     message = (
         f"Synerchat Login\naddress:{address.lower()}\n"
         f"deviceId:{deviceId}\nnonce:{nonce}\nissuedAt:{issued_at}\n"
@@ -52,19 +60,29 @@ async def siwe_start(address: str, deviceId: str, chainId: int = 137):
 
 
 @router.post("/siwe-verify", response_model=SiweVerifyResponse)
-async def siwe_verify(req: SiweVerifyRequest):
-    key = f"{req.address.lower()}:{req.deviceId}"
-    expected_nonce = NONCES.get(key)
-    if not expected_nonce or expected_nonce != req.nonce:
-        raise HTTPException(status_code=400, detail="Invalid nonce")
-
+@limiter.limit(RATE_LIMIT_SIWE)
+async def siwe_verify(request: Request, req: SiweVerifyRequest):
     message = (
         f"Synerchat Login\naddress:{req.address.lower()}\n"
         f"deviceId:{req.deviceId}\nnonce:{req.nonce}\nissuedAt:{req.issuedAt}\n"
         f"expiresAt:{req.expiresAt}\nchainId:{req.chainId}"
     )
+    digest = signature_digest(message, req.signature)
+    previous = verified_logins.get(digest)
+    if previous is not None and previous.expiresAt > int(time.time()):
+        return previous
 
-    recovered = Account.recover_message(encode_defunct(text=message), signature=req.signature)
+    key = f"{req.address.lower()}:{req.deviceId}"
+    expected_nonce = await nonce_store.peek(key)
+    if not expected_nonce or expected_nonce != req.nonce:
+        raise HTTPException(status_code=400, detail="Invalid nonce")
+
+    try:
+        recovered = await signature_verifier.recover(message, req.signature)
+    except SignerBusy:
+        raise HTTPException(status_code=503, detail="Too many logins in progress", headers={"Retry-After": "1"})
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid signature")
     if recovered.lower() != req.address.lower():
         raise HTTPException(status_code=400, detail="Signature mismatch")
 
@@ -72,7 +90,11 @@ async def siwe_verify(req: SiweVerifyRequest):
     if req.expiresAt <= now:
         raise HTTPException(status_code=400, detail="Expired payload")
 
-    del NONCES[key]
+    # Single use: of two concurrent verifies of the same login only one wins
+    if not await nonce_store.take(key, req.nonce):
+        raise HTTPException(status_code=400, detail="Invalid nonce")
 
     token = issue_jwt(subject=req.address.lower(), device_id=req.deviceId, expires_at=req.expiresAt)
-    return SiweVerifyResponse(token=token, expiresAt=req.expiresAt)
\ No newline at end of file
+    response = SiweVerifyResponse(token=token, expiresAt=req.expiresAt)
+    verified_logins.set(digest, response)
+    return response
@@ -1,39 +1,26 @@
+import asyncio
 import os
+from typing import List, Optional
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from web3 import Web3
 
+from ..key_index import ABI_KEYREGISTRY, KEYREGISTRY_ADDRESS, key_index
+from ..utils.cache import AsyncTTLCache
+from ..utils.chain import POLYGON_RPC, get_web3
+
 
 router = APIRouter()
 
-POLYGON_RPC = os.getenv("POLYGON_RPC") or os.getenv("AMOY_RPC") or ""
-KEYREGISTRY_ADDRESS = os.getenv("KEYREGISTRY_ADDRESS", "")
-
-ABI_KEYREGISTRY = [
-    {
-        "inputs": [
-            {"internalType": "address", "name": "owner", "type": "address"},
-            {"internalType": "bytes32", "name": "deviceId", "type": "bytes32"},
-        ],
-        "name": "getDeviceKey",
-        "outputs": [
-            {
-                "components": [
-                    {"internalType": "bytes32", "name": "deviceId", "type": "bytes32"},
-                    {"internalType": "bytes", "name": "pubEncKey", "type": "bytes"},
-                    {"internalType": "bytes", "name": "pubSigKey", "type": "bytes"},
-                    {"internalType": "uint256", "name": "registeredAt", "type": "uint256"},
-                    {"internalType": "bool", "name": "active", "type": "bool"}
-                ],
-                "internalType": "struct KeyRegistry.DeviceKey",
-                "name": "",
-                "type": "tuple"
-            }
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    }
-]
+# Rotations and revocations become visible after at most this long
+KEY_CACHE_TTL_SECONDS = float(os.getenv("KEY_CACHE_TTL_SECONDS", "60"))
+KEY_CACHE_MAX_ENTRIES = int(os.getenv("KEY_CACHE_MAX_ENTRIES", "50000"))
+KEY_BULK_MAX_PAIRS = int(os.getenv("KEY_BULK_MAX_PAIRS", "500"))
+# Concurrent RPC lookups per bulk request while the index is not ready
+KEY_BULK_RPC_CONCURRENCY = 16
+
+# (checksum owner, deviceId bytes) -> DeviceKeyResponse
+device_key_cache = AsyncTTLCache(ttl=KEY_CACHE_TTL_SECONDS, maxsize=KEY_CACHE_MAX_ENTRIES)
 
 
 class DeviceKeyResponse(BaseModel):
@@ -44,18 +31,112 @@ class DeviceKeyResponse(BaseModel):
     active: bool
 
 
-@router.get("/{address}", response_model=DeviceKeyResponse)
-async def get_device_key(address: str, deviceId: str):
-    if not POLYGON_RPC or not KEYREGISTRY_ADDRESS:
-        raise HTTPException(status_code=500, detail="RPC or contract address not configured")
-    w3 = Web3(Web3.HTTPProvider(POLYGON_RPC))
-    contract = w3.eth.contract(address=Web3.to_checksum_address(KEYREGISTRY_ADDRESS), abi=ABI_KEYREGISTRY)
-    device_id_bytes32 = bytes.fromhex(deviceId[2:]) if deviceId.startswith("0x") else bytes.fromhex(deviceId)
-    res = contract.functions.getDeviceKey(Web3.to_checksum_address(address), device_id_bytes32).call()
+def parse_device_id(device_id: str) -> bytes:
+    try:
+        raw = bytes.fromhex(device_id[2:] if device_id.startswith("0x") else device_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid deviceId")
+    if len(raw) != 32:
+        raise HTTPException(status_code=400, detail="Invalid deviceId")
+    return raw
+
+
+_registry = None
+
+
+async def registry_contract():
+    global _registry
+    if _registry is None:
+        w3 = await get_web3()
+        _registry = w3.eth.contract(address=Web3.to_checksum_address(KEYREGISTRY_ADDRESS), abi=ABI_KEYREGISTRY)
+    return _registry
+
+
+async def fetch_device_key(owner: str, device_id: bytes) -> DeviceKeyResponse:
+    contract = await registry_contract()
+    res = await contract.functions.getDeviceKey(owner, device_id).call()
     return DeviceKeyResponse(
         deviceId="0x" + res[0].hex(),
         pubEncKey="0x" + res[1].hex(),
         pubSigKey="0x" + res[2].hex(),
         registeredAt=int(res[3]),
         active=bool(res[4])
-    )
\ No newline at end of file
+    )
+
+
+class KeyPair(BaseModel):
+    address: str
+    deviceId: str
+
+
+class BulkKeysRequest(BaseModel):
+    keys: List[KeyPair] = Field(..., max_length=KEY_BULK_MAX_PAIRS)
+
+
+class BulkKeyResult(BaseModel):
+    address: str
+    deviceId: str
+    key: Optional[DeviceKeyResponse] = None
+    error: Optional[str] = None
+
+
+def require_config() -> None:
+    if not KEYREGISTRY_ADDRESS or (not POLYGON_RPC and not key_index.is_ready()):
+        raise HTTPException(status_code=500, detail="RPC or contract address not configured")
+
+
+def parse_pair(address: str, device_id: str):
+    if not Web3.is_address(address):
+        raise HTTPException(status_code=400, detail="Invalid address")
+    return Web3.to_checksum_address(address), parse_device_id(device_id)
+
+
+async def load_device_key(owner: str, device_id: bytes) -> DeviceKeyResponse:
+    return await device_key_cache.get_or_load(
+        (owner, device_id), lambda: fetch_device_key(owner, device_id)
+    )
+
+
+@router.get("/{address}", response_model=DeviceKeyResponse)
+async def get_device_key(address: str, deviceId: str):
+    require_config()
+    owner, device_id = parse_pair(address, deviceId)
+    # The mirror lags the chain by KEY_INDEX_CONFIRMATIONS blocks; until the
+    # indexer has caught up, fall back to the cached RPC read
+    if key_index.is_ready():
+        return DeviceKeyResponse(**key_index.get(owner, "0x" + device_id.hex()))
+    return await load_device_key(owner, device_id)
+
+
+@router.post("/bulk", response_model=List[BulkKeyResult])
+async def get_device_keys(body: BulkKeysRequest):
+    """Resolve many (address, deviceId) pairs; results keep the request order"""
+    require_config()
+    results: List[BulkKeyResult] = []
+    pairs = []
+    for item in body.keys:
+        result = BulkKeyResult(address=item.address, deviceId=item.deviceId)
+        try:
+            owner, device_id = parse_pair(item.address, item.deviceId)
+            pairs.append((result, owner, device_id))
+        except HTTPException as exc:
+            result.error = exc.detail
+        results.append(result)
+
+    if key_index.is_ready():
+        found = key_index.get_many([(owner, "0x" + device_id.hex()) for _, owner, device_id in pairs])
+        for result, owner, device_id in pairs:
+            result.key = DeviceKeyResponse(**found[(owner, "0x" + device_id.hex())])
+        return results
+
+    semaphore = asyncio.Semaphore(KEY_BULK_RPC_CONCURRENCY)
+
+    async def resolve(result: BulkKeyResult, owner: str, device_id: bytes) -> None:
+        async with semaphore:
+            try:
+                result.key = await load_device_key(owner, device_id)
+            except Exception:
+                result.error = "Lookup failed"
+
+    await asyncio.gather(*(resolve(*pair) for pair in pairs))
+    return results
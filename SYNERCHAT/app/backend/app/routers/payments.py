@@ -1,18 +1,19 @@
 import os
+from typing import List, Optional
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from web3 import Web3
 
+from ..erc20 import ERC20Reader
+from ..utils.chain import POLYGON_RPC
+
 router = APIRouter()
 
-POLYGON_RPC = os.getenv("POLYGON_RPC") or os.getenv("AMOY_RPC") or ""
 FTS_ADDRESS = os.getenv("FTS_ADDRESS", "0xCc12Ea927F6E8d3919010498Ef8736d4612FD83e")
+# Sub-calls per Multicall3 request stay well under the eth_call gas cap
+PAYMENTS_BATCH_MAX_ADDRESSES = int(os.getenv("PAYMENTS_BATCH_MAX_ADDRESSES", "200"))
 
-ABI_ERC20 = [
-    {"constant": True, "inputs": [{"name": "account", "type": "address"}], "name": "balanceOf", "outputs": [{"name": "", "type": "uint256"}], "type": "function"},
-    {"constant": True, "inputs": [{"name": "owner", "type": "address"}, {"name": "spender", "type": "address"}], "name": "allowance", "outputs": [{"name": "", "type": "uint256"}], "type": "function"},
-    {"constant": True, "inputs": [], "name": "decimals", "outputs": [{"name": "", "type": "uint8"}], "type": "function"}
-]
+fts = ERC20Reader(FTS_ADDRESS)
 
 
 class BalanceResponse(BaseModel):
@@ -29,22 +30,88 @@ class AllowanceResponse(BaseModel):
     allowance: str
 
 
-@router.get("/balance/{address}", response_model=BalanceResponse)
-async def balance(address: str):
+class BatchRequest(BaseModel):
+    addresses: List[str] = Field(..., max_length=PAYMENTS_BATCH_MAX_ADDRESSES)
+    spender: Optional[str] = None
+
+
+class BatchEntry(BaseModel):
+    address: str
+    balance: Optional[str] = None
+    allowance: Optional[str] = None
+    blockNumber: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    token: str
+    decimals: int
+    spender: Optional[str] = None
+    entries: List[BatchEntry]
+
+
+def checksum(address: str) -> str:
+    if not Web3.is_address(address):
+        raise HTTPException(status_code=400, detail="Invalid address")
+    return Web3.to_checksum_address(address)
+
+
+def require_rpc() -> None:
     if not POLYGON_RPC:
         raise HTTPException(status_code=500, detail="RPC not configured")
-    w3 = Web3(Web3.HTTPProvider(POLYGON_RPC))
-    erc20 = w3.eth.contract(address=Web3.to_checksum_address(FTS_ADDRESS), abi=ABI_ERC20)
-    bal = erc20.functions.balanceOf(Web3.to_checksum_address(address)).call()
-    decimals = erc20.functions.decimals().call()
-    return BalanceResponse(token=FTS_ADDRESS, address=address, balance=str(bal), decimals=decimals)
+
+
+def amount(value: Optional[int]) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+@router.get("/balance/{address}", response_model=BalanceResponse)
+async def balance(address: str):
+    require_rpc()
+    key = ("balance", checksum(address))
+    values = await fts.read([key])
+    if values[key][1] is None:
+        raise HTTPException(status_code=502, detail="balanceOf reverted")
+    return BalanceResponse(token=FTS_ADDRESS, address=address, balance=str(values[key][1]), decimals=await fts.decimals())
 
 
 @router.get("/allowance/{owner}/{spender}", response_model=AllowanceResponse)
 async def allowance(owner: str, spender: str):
-    if not POLYGON_RPC:
-        raise HTTPException(status_code=500, detail="RPC not configured")
-    w3 = Web3(Web3.HTTPProvider(POLYGON_RPC))
-    erc20 = w3.eth.contract(address=Web3.to_checksum_address(FTS_ADDRESS), abi=ABI_ERC20)
-    value = erc20.functions.allowance(Web3.to_checksum_address(owner), Web3.to_checksum_address(spender)).call()
-    return AllowanceResponse(token=FTS_ADDRESS, owner=owner, spender=spender, allowance=str(value))
\ No newline at end of file
+    require_rpc()
+    key = ("allowance", checksum(owner), checksum(spender))
+    values = await fts.read([key])
+    if values[key][1] is None:
+        raise HTTPException(status_code=502, detail="allowance reverted")
+    return AllowanceResponse(token=FTS_ADDRESS, owner=owner, spender=spender, allowance=str(values[key][1]))
+
+
+@router.post("/batch", response_model=BatchResponse)
+async def batch(body: BatchRequest):
+    """Balances (and allowances towards `spender`) of many addresses in one eth_call"""
+    require_rpc()
+    spender = checksum(body.spender) if body.spender else None
+    entries: List[BatchEntry] = []
+    keys = []
+    for address in body.addresses:
+        entry = BatchEntry(address=address)
+        entries.append(entry)
+        if not Web3.is_address(address):
+            entry.error = "Invalid address"
+            continue
+        account = Web3.to_checksum_address(address)
+        keys.append(("balance", account))
+        if spender:
+            keys.append(("allowance", account, spender))
+
+    values = await fts.read(keys)
+    for entry in entries:
+        if entry.error:
+            continue
+        account = Web3.to_checksum_address(entry.address)
+        block_number, value = values[("balance", account)]
+        entry.balance, entry.blockNumber = amount(value), block_number
+        if spender:
+            allowance_block, value = values[("allowance", account, spender)]
+            entry.allowance = amount(value)
+            entry.blockNumber = min(block_number, allowance_block)
+    return BatchResponse(token=FTS_ADDRESS, decimals=await fts.decimals(), spender=spender, entries=entries)
@@ -1,41 +1,209 @@
-import json
+import asyncio
+import math
+import os
+import secrets
 import time
-from typing import Dict
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from fastapi.websockets import WebSocketState
+from typing import Dict, Optional
+from fastapi import APIRouter, Header, HTTPException, WebSocket, WebSocketDisconnect
 
 from ..utils.jwt import verify_jwt
 
 router = APIRouter()
 
+# A receiver this far behind is disconnected; it reconnects and catches up
+WS_SEND_QUEUE_FRAMES = int(os.getenv("WS_SEND_QUEUE_FRAMES", "256"))
+WS_SEND_QUEUE_BYTES = int(os.getenv("WS_SEND_QUEUE_BYTES", str(1024 * 1024)))
+# Time constant of the per-room message and byte rates
+WS_RATE_WINDOW_SECONDS = float(os.getenv("WS_RATE_WINDOW_SECONDS", "10"))
+# /ws/metrics is disabled unless this is set
+WS_METRICS_TOKEN = os.getenv("WS_METRICS_TOKEN", "")
+# Inbound frames per socket: sustained rate and burst
+WS_FRAME_RATE = float(os.getenv("WS_FRAME_RATE", "20"))
+WS_FRAME_BURST = int(os.getenv("WS_FRAME_BURST", "40"))
+
+SLOW_CONSUMER_CLOSE_CODE = 1013
+POLICY_VIOLATION_CLOSE_CODE = 1008
+
+
+class Peer:
+    """One room member: a bounded send queue drained by its own writer task"""
+
+    def __init__(self, websocket: WebSocket, echo: bool = False) -> None:
+        self.websocket = websocket
+        self.echo = echo
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_FRAMES)
+        self.queued_bytes = 0
+        self.writer = asyncio.create_task(self._write())
+
+    def offer(self, frame: bytes) -> bool:
+        """Queue a frame without waiting; False if the receiver is too far behind"""
+        if self.queued_bytes + len(frame) > WS_SEND_QUEUE_BYTES:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            return False
+        self.queued_bytes += len(frame)
+        return True
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                frame = await self.queue.get()
+                self.queued_bytes -= len(frame)
+                await self.websocket.send_bytes(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The socket is gone; its receive loop will see the disconnect
+            pass
+
+    async def close(self, code: int) -> None:
+        self.writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class FrameBudget:
+    """Token bucket for the frames one socket may relay"""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self) -> None:
+        self.tokens = float(WS_FRAME_BURST)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(WS_FRAME_BURST, self.tokens + (now - self.updated) * WS_FRAME_RATE)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RoomStats:
+    """Totals plus exponentially decayed messages/s and bytes/s"""
+
+    __slots__ = ("messages", "bytes", "deliveries", "slow_disconnects", "_message_rate", "_byte_rate", "_updated")
+
+    def __init__(self) -> None:
+        self.messages = 0
+        self.bytes = 0
+        self.deliveries = 0
+        self.slow_disconnects = 0
+        self._message_rate = 0.0
+        self._byte_rate = 0.0
+        self._updated = time.monotonic()
+
+    def _decay(self, now: float) -> None:
+        factor = math.exp(-(now - self._updated) / WS_RATE_WINDOW_SECONDS)
+        self._message_rate *= factor
+        self._byte_rate *= factor
+        self._updated = now
+
+    def record(self, size: int, deliveries: int) -> None:
+        self._decay(time.monotonic())
+        self._message_rate += 1 / WS_RATE_WINDOW_SECONDS
+        self._byte_rate += size / WS_RATE_WINDOW_SECONDS
+        self.messages += 1
+        self.bytes += size
+        self.deliveries += deliveries
+
+    def rates(self) -> tuple:
+        self._decay(time.monotonic())
+        return self._message_rate, self._byte_rate
+
 
 class ConnectionManager:
     def __init__(self) -> None:
-        self.rooms: Dict[str, set[WebSocket]] = {}
+        self.rooms: Dict[str, Dict[WebSocket, Peer]] = {}
+        self.stats: Dict[str, RoomStats] = {}
 
-    async def connect(self, room: str, websocket: WebSocket) -> None:
+    async def connect(self, room: str, websocket: WebSocket, echo: bool = False) -> None:
         await websocket.accept()
-        self.rooms.setdefault(room, set()).add(websocket)
+        self.rooms.setdefault(room, {})[websocket] = Peer(websocket, echo)
+        self.stats.setdefault(room, RoomStats())
 
-    def disconnect(self, room: str, websocket: WebSocket) -> None:
-        if room in self.rooms and websocket in self.rooms[room]:
-            self.rooms[room].remove(websocket)
-            if not self.rooms[room]:
-                del self.rooms[room]
+    def disconnect(self, room: str, websocket: WebSocket) -> Optional[Peer]:
+        peers = self.rooms.get(room)
+        if peers is None or websocket not in peers:
+            return None
+        peer = peers.pop(websocket)
+        peer.writer.cancel()
+        if not peers:
+            del self.rooms[room]
+            self.stats.pop(room, None)
+        return peer
 
-    async def broadcast(self, room: str, message: bytes) -> None:
-        if room not in self.rooms:
-            return
-        for ws in list(self.rooms[room]):
-            if ws.application_state == WebSocketState.CONNECTED:
-                await ws.send_bytes(message)
+    def broadcast(self, room: str, message: bytes, sender: Optional[WebSocket] = None) -> int:
+        """Queue `message` for every member except the sender (unless it asked for echo).
+
+        Never waits on a receiver: members whose queue is full are disconnected.
+        Returns the number of members the frame was queued for.
+        """
+        peers = self.rooms.get(room)
+        if not peers:
+            return 0
+        delivered = 0
+        slow = []
+        for websocket, peer in peers.items():
+            if websocket is sender and not peer.echo:
+                continue
+            if peer.offer(message):
+                delivered += 1
+            else:
+                slow.append(websocket)
+        stats = self.stats[room]
+        stats.record(len(message), delivered)
+        for websocket in slow:
+            stats.slow_disconnects += 1
+            asyncio.create_task(self.disconnect(room, websocket).close(SLOW_CONSUMER_CLOSE_CODE))
+        return delivered
+
+    def metrics(self, top: int = 20) -> dict:
+        rooms = []
+        message_rate = byte_rate = 0.0
+        for room, stats in self.stats.items():
+            room_messages, room_bytes = stats.rates()
+            message_rate += room_messages
+            byte_rate += room_bytes
+            rooms.append({
+                "room": room,
+                "sockets": len(self.rooms.get(room, ())),
+                "messages": stats.messages,
+                "bytes": stats.bytes,
+                "deliveries": stats.deliveries,
+                "slowDisconnects": stats.slow_disconnects,
+                "messagesPerSecond": round(room_messages, 3),
+                "bytesPerSecond": round(room_bytes, 1)
+            })
+        rooms.sort(key=lambda item: item["bytesPerSecond"], reverse=True)
+        return {
+            "rooms": len(self.rooms),
+            "sockets": sum(len(peers) for peers in self.rooms.values()),
+            "queuedBytes": sum(peer.queued_bytes for peers in self.rooms.values() for peer in peers.values()),
+            "messagesPerSecond": round(message_rate, 3),
+            "bytesPerSecond": round(byte_rate, 1),
+            "topRooms": rooms[:top]
+        }
 
 
 manager = ConnectionManager()
 
 
+@router.get("/ws/metrics")
+async def ws_metrics(top: int = 20, x_metrics_token: str = Header("")):
+    if not WS_METRICS_TOKEN or not secrets.compare_digest(x_metrics_token, WS_METRICS_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return manager.metrics(top=max(0, min(top, 200)))
+
+
 @router.websocket("/ws/{conversationId}")
-async def ws_endpoint(websocket: WebSocket, conversationId: str, token: str):
+async def ws_endpoint(websocket: WebSocket, conversationId: str, token: str, echo: bool = False):
     try:
         claims = verify_jwt(token)
         if int(claims.get("exp", 0)) <= int(time.time()):
@@ -45,10 +213,19 @@ async def ws_endpoint(websocket: WebSocket, conversationId: str, token: str):
         await websocket.close(code=4403)
         return
 
-    await manager.connect(conversationId, websocket)
+    await manager.connect(conversationId, websocket, echo=echo)
+    budget = FrameBudget()
     try:
         while True:
             data = await websocket.receive_bytes()
-            await manager.broadcast(conversationId, data)
-    except WebSocketDisconnect:
-        manager.disconnect(conversationId, websocket)
\ No newline at end of file
+            if not budget.take():
+                # Flooding: close instead of relaying to the whole room
+                manager.disconnect(conversationId, websocket)
+                await websocket.close(code=POLICY_VIOLATION_CLOSE_CODE)
+                return
+            manager.broadcast(conversationId, data, sender=websocket)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was closed as a slow consumer
+        pass
+    finally:
+        manager.disconnect(conversationId, websocket)
@@ -0,0 +1,39 @@
+import os
+from typing import Optional
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from web3 import AsyncWeb3, AsyncHTTPProvider
+
+
+POLYGON_RPC = os.getenv("POLYGON_RPC") or os.getenv("AMOY_RPC") or ""
+RPC_TIMEOUT_SECONDS = float(os.getenv("RPC_TIMEOUT_SECONDS", "10"))
+RPC_MAX_CONNECTIONS = int(os.getenv("RPC_MAX_CONNECTIONS", "20"))
+
+_w3: Optional[AsyncWeb3] = None
+_session: Optional[ClientSession] = None
+
+
+async def get_web3() -> AsyncWeb3:
+    """Process-wide async Web3 client over a pooled keep-alive HTTP session"""
+    global _w3, _session
+    if _w3 is None:
+        if not POLYGON_RPC:
+            raise RuntimeError("RPC not configured")
+        provider = AsyncHTTPProvider(POLYGON_RPC)
+        _session = ClientSession(
+            connector=TCPConnector(limit=RPC_MAX_CONNECTIONS, keepalive_timeout=60),
+            timeout=ClientTimeout(total=RPC_TIMEOUT_SECONDS),
+        )
+        await provider.cache_async_session(_session)
+        _w3 = AsyncWeb3(provider)
+        # Read-only client: the validation middleware would add an eth_chainId
+        # round trip to every eth_call
+        _w3.middleware_onion.remove("validation")
+    return _w3
+
+
+async def close_web3() -> None:
+    global _w3, _session
+    if _session is not None:
+        await _session.close()
+    _w3 = None
+    _session = None
@@ -0,0 +1,38 @@
+import os
+from fastapi import Request
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+
+# memory:// is per worker; redis://host:6379 shares the budgets between workers
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "600/minute")
+RATE_LIMIT_SIWE = os.getenv("RATE_LIMIT_SIWE", "10/minute")
+# Proxies in front of the app that append the address they saw to X-Forwarded-For
+# (1 on Heroku or behind a single load balancer). The client is the address the
+# outermost of them appended; earlier entries are whatever the client sent.
+# 0 uses the socket peer, which behind a proxy puts every client in one bucket
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUSTED_PROXIES:
+        hops = [
+            hop.strip()
+            for value in request.headers.getlist("x-forwarded-for")
+            for hop in value.split(",")
+        ]
+        if hops:
+            return hops[max(0, len(hops) - RATE_LIMIT_TRUSTED_PROXIES)]
+    return get_remote_address(request)
+
+
+# Moving window: a client can't double its budget around a window boundary
+limiter = Limiter(
+    key_func=client_ip,
+    default_limits=[RATE_LIMIT_DEFAULT],
+    strategy="moving-window",
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    # An unavailable shared store must not take the API down
+    swallow_errors=True,
+)
@@ -0,0 +1,220 @@
+"""Single-use SIWE login nonces with expiry and a hard size cap.
+
+The backend is chosen by NONCE_STORE_URL:
+
+- ``sqlite:///path.db`` (default): shared by every worker on the host
+- ``redis://host:6379/0``: shared across hosts (needs the ``redis`` extra)
+- ``memory://``: per process, for tests and single-worker development
+"""
+import asyncio
+import heapq
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+
+NONCE_STORE_URL = os.getenv("NONCE_STORE_URL", "sqlite:///siwe_nonces.db")
+NONCE_TTL_SECONDS = int(os.getenv("NONCE_TTL_SECONDS", "300"))
+NONCE_MAX_ENTRIES = int(os.getenv("NONCE_MAX_ENTRIES", "100000"))
+
+
+class NonceStore(ABC):
+    """`put` issues a nonce for a key; `take` consumes it if it matches and is unexpired"""
+
+    async def start(self) -> None:
+        """Open files or connections; called on application startup"""
+        pass
+
+    @abstractmethod
+    async def put(self, key: str, nonce: str) -> None:
+        """Issue `nonce` for `key`, replacing any earlier one"""
+
+    @abstractmethod
+    async def peek(self, key: str) -> Optional[str]:
+        """The unexpired nonce issued for `key`, without consuming it"""
+
+    @abstractmethod
+    async def take(self, key: str, nonce: str) -> bool:
+        """Consume the nonce; True only for the one caller that got a live match"""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryNonceStore(NonceStore):
+    """Dict plus an expiry heap; the soonest-expiring entries go first when full"""
+
+    def __init__(self, ttl: int = NONCE_TTL_SECONDS, maxsize: int = NONCE_MAX_ENTRIES) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict[str, Tuple[float, str]] = {}
+        self._heap: List[Tuple[float, str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float) -> None:
+        heap, entries = self._heap, self._entries
+        while heap and (heap[0][0] <= now or len(entries) > self.maxsize):
+            expires_at, key, nonce = heapq.heappop(heap)
+            # Skip heap items left behind by a re-issued or consumed nonce
+            if entries.get(key) == (expires_at, nonce):
+                del entries[key]
+        # Keep superseded heap items from piling up under re-issue churn
+        if len(heap) > 2 * len(entries) + 1024:
+            self._heap = [(expires_at, key, nonce) for key, (expires_at, nonce) in entries.items()]
+            heapq.heapify(self._heap)
+
+    async def put(self, key: str, nonce: str) -> None:
+        now = time.monotonic()
+        expires_at = now + self.ttl
+        self._entries[key] = (expires_at, nonce)
+        heapq.heappush(self._heap, (expires_at, key, nonce))
+        self._evict(now)
+
+    async def peek(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    async def take(self, key: str, nonce: str) -> bool:
+        entry = self._entries.get(key)
+        if entry is None or entry[1] != nonce:
+            return False
+        del self._entries[key]
+        return entry[0] > time.monotonic()
+
+
+class SQLiteNonceStore(NonceStore):
+    """One row per key in a WAL-mode file shared by the workers on a host.
+
+    Rows get increasing rowids, so the cap is kept by deleting everything
+    older than the newest `maxsize` rowids (an indexed range delete).
+
+    sqlite3 blocks, up to `timeout` seconds while another worker holds the write
+    lock, so every call runs on one dedicated thread: the event loop stays free
+    and calls on the connection never interleave.
+    """
+
+    def __init__(self, path: str, ttl: int = NONCE_TTL_SECONDS, maxsize: int = NONCE_MAX_ENTRIES) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nonce-store")
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS nonces ("
+                " key TEXT NOT NULL UNIQUE, nonce TEXT NOT NULL, expires_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS ix_nonces_expires_at ON nonces (expires_at);"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _put(self, key: str, nonce: str) -> None:
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM nonces WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO nonces (key, nonce, expires_at) VALUES (?, ?, ?)",
+                (key, nonce, now + self.ttl)
+            )
+            conn.execute(
+                "DELETE FROM nonces WHERE rowid <= (SELECT MAX(rowid) FROM nonces) - ?",
+                (self.maxsize,)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _peek(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT nonce FROM nonces WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _take(self, key: str, nonce: str) -> bool:
+        # The delete is the compare-and-consume: only one worker can win it
+        cursor = self._connect().execute(
+            "DELETE FROM nonces WHERE key = ? AND nonce = ? AND expires_at > ?", (key, nonce, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def start(self) -> None:
+        await self._run(self._connect)
+
+    async def put(self, key: str, nonce: str) -> None:
+        await self._run(self._put, key, nonce)
+
+    async def peek(self, key: str) -> Optional[str]:
+        return await self._run(self._peek, key)
+
+    async def take(self, key: str, nonce: str) -> bool:
+        return await self._run(self._take, key, nonce)
+
+    async def close(self) -> None:
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+
+class RedisNonceStore(NonceStore):
+    """Keys expire in Redis itself; bound memory with maxmemory + volatile-ttl"""
+
+    # Compare-and-delete, so a wrong guess cannot burn someone else's nonce
+    TAKE_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+    def __init__(self, url: str, ttl: int = NONCE_TTL_SECONDS) -> None:
+        try:
+            from redis import asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("NONCE_STORE_URL is redis:// but the redis package is not installed")
+        self.ttl = ttl
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self._take = self._redis.register_script(self.TAKE_SCRIPT)
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return f"siwe:nonce:{key}"
+
+    async def put(self, key: str, nonce: str) -> None:
+        await self._redis.set(self._key(key), nonce, ex=self.ttl)
+
+    async def peek(self, key: str) -> Optional[str]:
+        return await self._redis.get(self._key(key))
+
+    async def take(self, key: str, nonce: str) -> bool:
+        return bool(await self._take(keys=[self._key(key)], args=[nonce]))
+
+    async def close(self) -> None:
+        await self._redis.close()
+
+
+def create_nonce_store(url: str = NONCE_STORE_URL) -> NonceStore:
+    """Nothing is opened until `start()` (the SQLite file) or first use"""
+    if url.startswith("memory://"):
+        return MemoryNonceStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteNonceStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisNonceStore(url)
+    raise RuntimeError(f"Unsupported NONCE_STORE_URL: {url}")
@@ -0,0 +1,80 @@
+"""EIP-191 signer recovery off the event loop.
+
+Public-key recovery costs ~10 ms of CPU with eth-keys' pure-Python backend.
+Running it inline stalls every websocket relay on the worker for the whole
+burst, so recoveries run in a small process pool instead. At most
+SIGNATURE_MAX_PENDING may be queued or running; past that, callers are told to
+retry rather than queueing without bound. Concurrent recoveries of the same
+(message, signature) share one job, and its result is remembered briefly.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from .cache import AsyncTTLCache
+
+
+SIGNATURE_WORKERS = int(os.getenv("SIGNATURE_WORKERS", str(min(os.cpu_count() or 1, 4))))
+SIGNATURE_MAX_PENDING = int(os.getenv("SIGNATURE_MAX_PENDING", str(SIGNATURE_WORKERS * 16)))
+SIGNATURE_CACHE_TTL_SECONDS = float(os.getenv("SIGNATURE_CACHE_TTL_SECONDS", "120"))
+
+
+class SignerBusy(Exception):
+    """Raised when SIGNATURE_MAX_PENDING recoveries are already in flight"""
+
+
+def recover_signer(message: str, signature: str) -> str:
+    """Address that signed `message` (personal_sign); runs in the pool workers"""
+    return Account.recover_message(encode_defunct(text=message), signature=signature)
+
+
+def signature_digest(message: str, signature: str) -> bytes:
+    return hashlib.sha256(message.encode() + b"\x00" + signature.lower().encode()).digest()
+
+
+class SignatureVerifier:
+    def __init__(self, workers: int = SIGNATURE_WORKERS, max_pending: int = SIGNATURE_MAX_PENDING) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._recovered = AsyncTTLCache(ttl=SIGNATURE_CACHE_TTL_SECONDS, maxsize=10000)
+
+    def start(self) -> None:
+        if self._pool is None:
+            # spawn: forking a process that already runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            # Start the workers now rather than on the first login
+            for _ in range(self.workers):
+                self._pool.submit(abs, 0)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, message: str, signature: str) -> str:
+        self.start()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, recover_signer, message, signature)
+        finally:
+            self.pending -= 1
+
+    async def recover(self, message: str, signature: str) -> str:
+        """Recovered checksum address; ValueError for malformed signatures, SignerBusy when saturated"""
+        digest = signature_digest(message, signature)
+        cached = self._recovered.get(digest)
+        if cached is not None:
+            return cached
+        if self.pending >= self.max_pending:
+            raise SignerBusy()
+        return await self._recovered.get_or_load(digest, lambda: self._run(message, signature))
+
+
+signature_verifier = SignatureVerifier()
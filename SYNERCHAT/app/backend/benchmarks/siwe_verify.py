@@ -0,0 +1,92 @@
+"""
+SIWE signature verifications per second, inline on the event loop against the
+SignatureVerifier process pool, plus the worst event-loop stall seen during the
+burst (how long a /ws relay frame would wait).
+
+Every verification uses a distinct (message, signature) pair, so the recovery
+cache never short-circuits the work.
+
+Usage (from SYNERCHAT/app/backend):
+    python -m benchmarks.siwe_verify --logins 400 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import time
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from app.utils.signatures import SignatureVerifier, recover_signer
+
+
+def make_logins(count: int) -> list:
+    account = Account.create()
+    logins = []
+    for i in range(count):
+        message = f"Synerchat Login\naddress:{account.address.lower()}\ndeviceId:bench\nnonce:{i:032x}"
+        signature = Account.sign_message(encode_defunct(text=message), account.key).signature.hex()
+        logins.append((message, signature, account.address))
+    return logins
+
+
+async def watch_loop(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Largest delay between when a 5 ms timer was due and when it ran"""
+    worst = 0.0
+    while not stop.is_set():
+        due = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - due)
+    return worst
+
+
+async def run_inline(logins: list) -> tuple:
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stop))
+    await asyncio.sleep(0)
+
+    async def verify(message, signature, address):
+        assert recover_signer(message, signature) == address
+
+    started = time.perf_counter()
+    await asyncio.gather(*(verify(*login) for login in logins))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await watcher
+
+
+async def run_pool(logins: list, workers: int) -> tuple:
+    verifier = SignatureVerifier(workers=workers, max_pending=len(logins))
+    verifier.start()
+    await verifier.recover(*logins[0][:2])  # wait for the workers to come up
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stop))
+    await asyncio.sleep(0)
+
+    async def verify(message, signature, address):
+        assert await verifier.recover(message, signature) == address
+
+    started = time.perf_counter()
+    await asyncio.gather(*(verify(*login) for login in logins[1:]))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    verifier.shutdown()
+    return elapsed, await watcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 4))
+    args = parser.parse_args()
+
+    logins = make_logins(args.logins + 1)
+    print(f"{args.logins} verifications, {os.cpu_count()} CPUs, {args.workers} pool workers")
+    elapsed, stall = asyncio.run(run_inline(logins[1:]))
+    print(f"  inline  {args.logins / elapsed:8,.0f} verifications/s  (per core)         worst loop stall {stall * 1000:8.1f} ms")
+    elapsed, stall = asyncio.run(run_pool(logins, args.workers))
+    rate = args.logins / elapsed
+    print(f"  pool    {rate:8,.0f} verifications/s  {rate / args.workers:7,.0f}/s per worker   worst loop stall {stall * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Soak test of the /ws room relay: 1,000 rooms x 10 sockets, every room sending
+at a steady rate while a small share of receivers are slow.
+
+Runs ConnectionManager in-process against fake sockets whose send_bytes yields
+to the loop (and sleeps for the slow ones), so it measures the relay's
+fan-out, queueing and scheduling rather than the network. For comparison,
+--sequential uses the previous broadcast: await send_bytes on every member in
+turn, sender included.
+
+Reports delivered frames/s, how long a sender's read loop was held up by a
+broadcast, end-to-end latency to fast receivers, and slow-consumer disconnects.
+
+Usage (from SYNERCHAT/app/backend):
+    python -m benchmarks.ws_relay_soak --rooms 1000 --sockets 10 --rate 1 --seconds 20
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import struct
+import time
+
+from app.routers.ws import ConnectionManager
+
+
+class FakeSocket:
+    def __init__(self, latencies: list, slow_seconds: float = 0.0) -> None:
+        self.latencies = latencies
+        self.slow_seconds = slow_seconds
+        self.received = 0
+        self.closed_with = None
+
+    async def accept(self) -> None:
+        pass
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+
+    async def send_bytes(self, data: bytes) -> None:
+        if self.slow_seconds:
+            await asyncio.sleep(self.slow_seconds)
+        else:
+            await asyncio.sleep(0)
+            self.latencies.append(time.perf_counter() - struct.unpack_from("d", data)[0])
+        self.received += 1
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def sequential_broadcast(manager: ConnectionManager, room: str, message: bytes, sender) -> None:
+    """The relay before per-socket queues"""
+    for websocket in list(manager.rooms.get(room, ())):
+        await websocket.send_bytes(message)
+
+
+async def run(args) -> None:
+    manager = ConnectionManager()
+    latencies: list = []
+    stalls: list = []
+    rooms = {}
+    for r in range(args.rooms):
+        room = f"room-{r}"
+        sockets = [
+            FakeSocket(latencies, args.slow_ms / 1000 if random.random() < args.slow_ratio else 0.0)
+            for _ in range(args.sockets)
+        ]
+        for websocket in sockets:
+            await manager.connect(room, websocket)
+        rooms[room] = sockets
+
+    padding = b"\x00" * max(0, args.size - 8)
+    deadline = time.perf_counter() + args.seconds
+    sent = 0
+
+    async def room_sender(room: str, sockets: list) -> None:
+        nonlocal sent
+        # Spread the rooms' first messages over one interval
+        await asyncio.sleep(random.random() / args.rate)
+        while time.perf_counter() < deadline:
+            sender = random.choice(sockets)
+            frame = struct.pack("d", time.perf_counter()) + padding
+            started = time.perf_counter()
+            if args.sequential:
+                await sequential_broadcast(manager, room, frame, sender)
+            else:
+                manager.broadcast(room, frame, sender=sender)
+            stalls.append(time.perf_counter() - started)
+            sent += 1
+            await asyncio.sleep(1 / args.rate)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(room_sender(room, sockets) for room, sockets in rooms.items()))
+    elapsed = time.perf_counter() - started
+    # Let the writers drain what was queued
+    await asyncio.sleep(0.5)
+
+    all_sockets = [websocket for sockets in rooms.values() for websocket in sockets]
+    delivered = sum(websocket.received for websocket in all_sockets)
+    slow = sum(1 for websocket in all_sockets if websocket.slow_seconds)
+    evicted = sum(1 for websocket in all_sockets if websocket.closed_with is not None)
+    metrics = manager.metrics(top=0)
+
+    mode = "sequential" if args.sequential else "queued"
+    print(f"{mode}: {args.rooms} rooms x {args.sockets} sockets, {slow} slow ({args.slow_ms} ms/frame), "
+          f"{args.rate} msg/s per room, {args.size} B frames, {elapsed:.1f}s")
+    print(f"  messages sent      {sent:10,d}   {sent / elapsed:10,.0f}/s")
+    print(f"  frames delivered   {delivered:10,d}   {delivered / elapsed:10,.0f}/s")
+    print(f"  sender stall       median {statistics.median(stalls) * 1e6:8.1f} us   "
+          f"p99 {percentile(stalls, 0.99) * 1e3:8.2f} ms   max {max(stalls) * 1e3:8.2f} ms")
+    print(f"  fast-rx latency    median {statistics.median(latencies) * 1e3:8.2f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1e3:8.2f} ms")
+    print(f"  slow disconnects   {evicted:10,d}")
+    if not args.sequential:
+        print(f"  relay rate (10s)   {metrics['messagesPerSecond']:10,.0f} msg/s   {metrics['bytesPerSecond'] / 1e6:8.2f} MB/s")
+
+    for room in rooms:
+        for websocket in list(manager.rooms.get(room, {})):
+            manager.disconnect(room, websocket)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--sockets", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second per room")
+    parser.add_argument("--size", type=int, default=512, help="frame size in bytes")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--slow-ratio", type=float, default=0.01)
+    parser.add_argument("--slow-ms", type=float, default=200)
+    parser.add_argument("--sequential", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
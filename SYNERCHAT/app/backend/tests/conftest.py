@@ -0,0 +1,124 @@
+"""Shared setup: throwaway state files and a fake JSON-RPC node.
+
+Run from SYNERCHAT/app/backend:
+
+    python -m pytest -q tests
+"""
+import asyncio
+import os
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["KEYREGISTRY_ADDRESS"] = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+os.environ["POLYGON_RPC"] = "http://fake-node.invalid"
+os.environ["KEY_INDEX_DB"] = os.path.join(_tmp.name, "key_index.db")
+os.environ["KEY_INDEX_CONFIRMATIONS"] = "5"
+os.environ["NONCE_STORE_URL"] = "memory://"
+
+from eth_abi import decode, encode
+from web3 import AsyncWeb3, Web3
+from web3.providers.async_base import AsyncBaseProvider
+
+from app.key_index import EVENT_TOPICS, KEYREGISTRY_ADDRESS
+from app.routers import keys
+from app.utils import chain
+
+GET_DEVICE_KEY = Web3.keccak(text="getDeviceKey(address,bytes32)")[:4]
+DEVICE_KEY_TYPE = "(bytes32,bytes,bytes,uint256,bool)"
+TOPICS = {name: topic for topic, name in EVENT_TOPICS.items()}
+
+
+class FakeNode(AsyncBaseProvider):
+    """Answers the JSON-RPC calls the backend makes from in-memory state, and records them"""
+
+    def __init__(self, latency: float = 0.01) -> None:
+        super().__init__()
+        self.latency = latency
+        self.calls: List[str] = []
+        self.down = False
+        # (checksum owner, deviceId bytes) -> (deviceId, pubEncKey, pubSigKey, registeredAt, active)
+        self.keys: Dict[Tuple[str, bytes], tuple] = {}
+        # KeyRegistry logs, and which fork each block belongs to (changing it changes the block hash)
+        self.head = 0
+        self.logs: List[dict] = []
+        self.forks: Dict[int, int] = {}
+
+    def count(self, method: str) -> int:
+        return self.calls.count(method)
+
+    def block_hash(self, number: int) -> str:
+        return Web3.to_hex(Web3.keccak(text=f"block {number} fork {self.forks.get(number, 0)}"))
+
+    @staticmethod
+    def timestamp(number: int) -> int:
+        return 1700000000 + 2 * number
+
+    def emit(self, number: int, event: str, owner: str, device_id: bytes, *keys: bytes) -> None:
+        """Add a KeyRegistry log to block `number`; keys are the event's two bytes fields, if any"""
+        self.logs.append({
+            "address": KEYREGISTRY_ADDRESS,
+            "blockNumber": hex(number),
+            "blockHash": self.block_hash(number),
+            "logIndex": hex(sum(1 for log in self.logs if int(log["blockNumber"], 16) == number)),
+            "transactionHash": Web3.to_hex(Web3.keccak(text=f"tx {len(self.logs)}")),
+            "transactionIndex": "0x0",
+            "removed": False,
+            "topics": [TOPICS[event], "0x" + bytes(12).hex() + owner[2:].lower(), "0x" + device_id.hex()],
+            "data": "0x" + (encode(["bytes", "bytes"], list(keys)).hex() if keys else ""),
+        })
+
+    def reorg(self, from_block: int) -> None:
+        """Replace every block from from_block on: their logs are gone and their hashes change"""
+        self.logs = [log for log in self.logs if int(log["blockNumber"], 16) < from_block]
+        for number in range(from_block, self.head + 1):
+            self.forks[number] = self.forks.get(number, 0) + 1
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+    async def make_request(self, method: str, params: Any) -> dict:
+        self.calls.append(method)
+        await asyncio.sleep(self.latency)
+        if self.down:
+            return {"jsonrpc": "2.0", "id": len(self.calls), "error": {"code": -32000, "message": "node down"}}
+        return {"jsonrpc": "2.0", "id": len(self.calls), "result": self.answer(method, params)}
+
+    def answer(self, method: str, params: Any) -> Any:
+        if method == "eth_call":
+            data = bytes.fromhex(params[0]["data"][2:])
+            assert data[:4] == GET_DEVICE_KEY
+            owner, device_id = decode(["address", "bytes32"], data[4:])
+            key = self.keys.get((Web3.to_checksum_address(owner), device_id), (b"\0" * 32, b"", b"", 0, False))
+            return "0x" + encode([DEVICE_KEY_TYPE], [key]).hex()
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            return {
+                "number": hex(number),
+                "hash": self.block_hash(number),
+                "parentHash": self.block_hash(number - 1),
+                "timestamp": hex(self.timestamp(number)),
+            }
+        if method == "eth_getLogs":
+            query = params[0]
+            first, last = int(query["fromBlock"], 16), int(query["toBlock"], 16)
+            return [log for log in self.logs if first <= int(log["blockNumber"], 16) <= last]
+        raise NotImplementedError(method)
+
+
+@pytest.fixture
+def node():
+    """A fresh node behind the shared AsyncWeb3 client, with empty caches"""
+    fake = FakeNode()
+    w3 = AsyncWeb3(fake)
+    w3.middleware_onion.remove("validation")
+    chain._w3 = w3
+    keys._registry = None
+    keys.device_key_cache._entries.clear()
+    yield fake
+    chain._w3 = None
+    keys._registry = None
@@ -0,0 +1,122 @@
+"""KeyRegistry indexer: confirmation depth, reorg rewind and the SQLite mirror."""
+import asyncio
+
+import pytest
+
+from app import key_index as key_index_module
+from app.key_index import EMPTY_KEY, KeyIndex, KeyIndexer
+
+ALICE = "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"
+BOB = "0x3C44CdDdB6a900fa2b585dd299e03d12FA4293BC"
+PHONE = bytes([1]) * 32
+LAPTOP = bytes([2]) * 32
+ENC, SIG = b"\x04" + b"\x11" * 64, b"\x04" + b"\x22" * 64
+NEW_ENC, NEW_SIG = b"\x04" + b"\x33" * 64, b"\x04" + b"\x44" * 64
+
+
+def hex_id(device_id: bytes) -> str:
+    return "0x" + device_id.hex()
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = KeyIndex(str(tmp_path / "keys.db"))
+    yield index
+    index.close()
+
+
+def sync(index: KeyIndex) -> bool:
+    return asyncio.run(KeyIndexer(index).sync_once())
+
+
+def test_only_confirmed_blocks_are_indexed(node, index):
+    node.emit(3, "DeviceKeyRegistered", ALICE, PHONE, ENC, SIG)
+    node.head = 7  # block 3 has 4 confirmations, 5 are needed
+
+    assert sync(index)
+    assert index.get(ALICE, hex_id(PHONE)) == EMPTY_KEY
+    assert index.state()["block_number"] == 2
+
+    node.head = 8
+    assert sync(index)
+    assert index.get(ALICE, hex_id(PHONE)) == {
+        "deviceId": hex_id(PHONE),
+        "pubEncKey": "0x" + ENC.hex(),
+        "pubSigKey": "0x" + SIG.hex(),
+        "registeredAt": node.timestamp(3),
+        "active": True,
+    }
+    assert index.state()["block_number"] == 3
+
+
+def test_mirror_follows_register_rotate_revoke(node, index, monkeypatch):
+    monkeypatch.setattr(key_index_module, "KEY_INDEX_BATCH_BLOCKS", 4)
+    node.emit(1, "DeviceKeyRegistered", ALICE, PHONE, ENC, SIG)
+    node.emit(1, "DeviceKeyRegistered", ALICE, LAPTOP, ENC, SIG)
+    node.emit(4, "DeviceKeyRotated", ALICE, PHONE, NEW_ENC, NEW_SIG)
+    node.emit(6, "DeviceKeyRegistered", BOB, PHONE, ENC, SIG)
+    node.emit(9, "DeviceKeyRevoked", ALICE, LAPTOP)
+    node.head = 15
+
+    # Batches of 4 blocks up to block 10: 0-3, 4-7, 8-10
+    assert [sync(index) for _ in range(3)] == [False, False, True]
+
+    keys = index.get_many([(ALICE, hex_id(PHONE)), (ALICE, hex_id(LAPTOP)), (BOB, hex_id(PHONE)), (BOB, hex_id(LAPTOP))])
+    assert keys[(ALICE, hex_id(PHONE))]["pubEncKey"] == "0x" + NEW_ENC.hex()
+    assert keys[(ALICE, hex_id(PHONE))]["registeredAt"] == node.timestamp(1)
+    assert keys[(ALICE, hex_id(PHONE))]["active"]
+    assert not keys[(ALICE, hex_id(LAPTOP))]["active"]
+    assert keys[(BOB, hex_id(PHONE))]["registeredAt"] == node.timestamp(6)
+    assert keys[(BOB, hex_id(LAPTOP))] == EMPTY_KEY
+
+    rows = index.conn.execute(
+        "SELECT owner, device_id, active, block_number FROM device_keys ORDER BY block_number"
+    ).fetchall()
+    assert rows == [(ALICE, hex_id(PHONE), 1, 4), (BOB, hex_id(PHONE), 1, 6), (ALICE, hex_id(LAPTOP), 0, 9)]
+    assert index.conn.execute("SELECT COUNT(*) FROM key_events").fetchone()[0] == 5
+    assert [number for number, _ in index.indexed_blocks()] == [10, 7, 3]
+    state = index.state()
+    assert state["block_number"] == 10 and state["caught_up"]
+
+
+def test_deep_reorg_rewinds_and_replays(node, index):
+    node.emit(2, "DeviceKeyRegistered", ALICE, PHONE, ENC, SIG)
+    node.emit(12, "DeviceKeyRotated", ALICE, PHONE, NEW_ENC, NEW_SIG)
+    node.emit(16, "DeviceKeyRevoked", ALICE, PHONE)
+    node.head = 12
+    assert sync(index)  # up to block 7
+    node.head = 25
+    assert sync(index)  # up to block 20
+    assert not index.get(ALICE, hex_id(PHONE))["active"]
+
+    # Blocks from 10 on are replaced, deeper than the confirmation depth:
+    # no rotation and no revocation, Bob registers instead
+    node.reorg(10)
+    node.emit(14, "DeviceKeyRegistered", BOB, LAPTOP, ENC, SIG)
+
+    assert not sync(index)
+    state = index.state()
+    assert state["block_number"] == 7 and not state["caught_up"]
+    assert index.get(ALICE, hex_id(PHONE))["pubEncKey"] == "0x" + ENC.hex()
+    assert index.get(ALICE, hex_id(PHONE))["active"]
+    assert index.get(BOB, hex_id(LAPTOP)) == EMPTY_KEY
+
+    assert sync(index)
+    assert index.state()["block_number"] == 20
+    assert index.get(ALICE, hex_id(PHONE))["active"]
+    assert index.get(ALICE, hex_id(PHONE))["pubEncKey"] == "0x" + ENC.hex()
+    assert index.get(BOB, hex_id(LAPTOP))["registeredAt"] == node.timestamp(14)
+    assert index.conn.execute("SELECT COUNT(*) FROM key_events").fetchone()[0] == 2
+
+
+def test_reorg_past_every_recorded_block_reindexes_from_the_start(node, index):
+    node.emit(2, "DeviceKeyRegistered", ALICE, PHONE, ENC, SIG)
+    node.head = 10
+    assert sync(index)  # up to block 5
+
+    node.reorg(1)
+    assert not sync(index)
+    assert index.state()["block_number"] == -1
+    assert index.get(ALICE, hex_id(PHONE)) == EMPTY_KEY
+    assert sync(index)
+    assert index.get(ALICE, hex_id(PHONE)) == EMPTY_KEY
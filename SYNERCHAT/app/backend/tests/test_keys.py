@@ -0,0 +1,78 @@
+"""/keys: RPC reads go through a TTL cache that coalesces concurrent misses."""
+import asyncio
+
+import httpx
+import pytest
+
+from app.main import app
+from app.routers import keys
+from app.utils.cache import AsyncTTLCache
+
+OWNER = "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"
+DEVICE_ID = bytes(range(32))
+KEY = (DEVICE_ID, b"\x04" + b"\x11" * 64, b"\x04" + b"\x22" * 64, 1700000000, True)
+
+
+def test_concurrent_misses_share_one_rpc_call(node):
+    node.keys[(OWNER, DEVICE_ID)] = KEY
+
+    async def lookups():
+        return await asyncio.gather(*(keys.load_device_key(OWNER, DEVICE_ID) for _ in range(50)))
+
+    results = asyncio.run(lookups())
+
+    assert node.count("eth_call") == 1
+    assert {result.pubEncKey for result in results} == {"0x" + KEY[1].hex()}
+    assert results[0].registeredAt == 1700000000 and results[0].active
+
+
+def test_concurrent_requests_share_one_rpc_call(node):
+    node.keys[(OWNER, DEVICE_ID)] = KEY
+
+    async def requests():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.get(f"/keys/{OWNER.lower()}", params={"deviceId": "0x" + DEVICE_ID.hex()})
+                for _ in range(20)
+            ))
+
+    responses = asyncio.run(requests())
+
+    assert [response.status_code for response in responses] == [200] * 20
+    assert node.count("eth_call") == 1
+    assert responses[0].json()["pubSigKey"] == "0x" + KEY[2].hex()
+
+
+def test_failed_load_is_not_cached(node):
+    async def lookup():
+        return await keys.load_device_key(OWNER, DEVICE_ID)
+
+    node.down = True
+    with pytest.raises(ValueError):
+        asyncio.run(lookup())
+
+    node.down = False
+    node.keys[(OWNER, DEVICE_ID)] = KEY
+    assert asyncio.run(lookup()).active
+    assert node.count("eth_call") == 2
+
+
+def test_entries_expire_after_the_ttl(node, monkeypatch):
+    monkeypatch.setattr(keys, "device_key_cache", AsyncTTLCache(ttl=0.2))
+    node.keys[(OWNER, DEVICE_ID)] = KEY
+
+    async def lookups():
+        first = await keys.load_device_key(OWNER, DEVICE_ID)
+        # Revoked on chain: invisible until the entry expires
+        node.keys[(OWNER, DEVICE_ID)] = KEY[:4] + (False,)
+        cached = await keys.load_device_key(OWNER, DEVICE_ID)
+        await asyncio.sleep(0.25)
+        refreshed = await keys.load_device_key(OWNER, DEVICE_ID)
+        return first, cached, refreshed
+
+    first, cached, refreshed = asyncio.run(lookups())
+
+    assert first.active and cached.active
+    assert not refreshed.active
+    assert node.count("eth_call") == 2
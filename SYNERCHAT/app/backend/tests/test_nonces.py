@@ -0,0 +1,124 @@
+"""SIWE nonce stores: single use, expiry and the size cap, for every local backend."""
+import asyncio
+import os
+
+import pytest
+
+from app.utils.nonces import MemoryNonceStore, NonceStore, SQLiteNonceStore, create_nonce_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    """Factory of stores of one backend; SQLite stores made by one test share a file, like workers do"""
+    stores = []
+
+    def make(ttl: float = 300, maxsize: int = 1000) -> NonceStore:
+        if request.param == "memory":
+            store = MemoryNonceStore(ttl=ttl, maxsize=maxsize)
+        else:
+            store = SQLiteNonceStore(str(tmp_path / "nonces.db"), ttl=ttl, maxsize=maxsize)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        asyncio.run(store.close())
+
+
+def test_issue_and_consume(make_store):
+    store = make_store()
+
+    async def scenario():
+        await store.start()
+        await store.put("0xabc:phone", "n1")
+        assert await store.peek("0xabc:phone") == "n1"
+        # A wrong guess doesn't burn the nonce
+        assert not await store.take("0xabc:phone", "guess")
+        assert await store.take("0xabc:phone", "n1")
+        assert not await store.take("0xabc:phone", "n1")
+        assert await store.peek("0xabc:phone") is None
+
+    asyncio.run(scenario())
+
+
+def test_reissue_replaces_the_nonce(make_store):
+    store = make_store()
+
+    async def scenario():
+        await store.put("0xabc:phone", "n1")
+        await store.put("0xabc:phone", "n2")
+        assert not await store.take("0xabc:phone", "n1")
+        assert await store.take("0xabc:phone", "n2")
+
+    asyncio.run(scenario())
+
+
+def test_nonces_expire(make_store):
+    store = make_store(ttl=0.2)
+
+    async def scenario():
+        await store.put("0xabc:phone", "n1")
+        await store.put("0xabc:laptop", "n2")
+        assert await store.peek("0xabc:phone") == "n1"
+        await asyncio.sleep(0.3)
+        assert await store.peek("0xabc:phone") is None
+        assert not await store.take("0xabc:laptop", "n2")
+
+    asyncio.run(scenario())
+
+
+def test_size_cap_drops_the_oldest(make_store):
+    store = make_store(maxsize=3)
+
+    async def scenario():
+        for i in range(5):
+            await store.put(f"key{i}", f"n{i}")
+        return [await store.peek(f"key{i}") for i in range(5)]
+
+    assert asyncio.run(scenario()) == [None, None, "n2", "n3", "n4"]
+
+
+def test_concurrent_takes_consume_once(make_store):
+    # Two stores: two workers on the memory backend don't share anything, so
+    # only the SQLite file is shared between them
+    first, second = make_store(), make_store()
+    shared = isinstance(first, SQLiteNonceStore)
+
+    async def scenario():
+        await first.put("0xabc:phone", "n1")
+        stores = [first, second] if shared else [first]
+        return await asyncio.gather(*(stores[i % len(stores)].take("0xabc:phone", "n1") for i in range(20)))
+
+    assert sorted(asyncio.run(scenario())) == [False] * 19 + [True]
+
+
+def test_memory_store_stays_bounded_under_reissue_churn():
+    store = MemoryNonceStore(maxsize=10)
+
+    async def scenario():
+        for i in range(10000):
+            await store.put(f"key{i % 50}", f"n{i}")
+
+    asyncio.run(scenario())
+    assert len(store) == 10
+    assert len(store._heap) <= 2 * 10 + 1024
+
+
+def test_sqlite_file_is_created_on_start(tmp_path):
+    path = tmp_path / "nonces.db"
+    store = create_nonce_store(f"sqlite:///{path}")
+    assert isinstance(store, SQLiteNonceStore)
+    assert not path.exists()
+
+    async def scenario():
+        await store.start()
+        await store.close()
+
+    asyncio.run(scenario())
+    assert os.path.exists(path)
+
+
+def test_base_store_is_abstract():
+    with pytest.raises(TypeError):
+        NonceStore()
+    assert isinstance(create_nonce_store("memory://"), MemoryNonceStore)
@@ -39,8 +39,7 @@ def verify_token(authorization: Optional[str] = Header(None)) -> dict:
         raise HTTPException(status_code=401, detail="Invalid token")
     
     # Check expiry
-    expires_at = datetime.fromisoformat(session['expires_at'])
-    if datetime.now() > expires_at:
+    if datetime.now() > session['expires_at']:
         db.delete_token(token)
         raise HTTPException(status_code=401, detail="Token expired")
     
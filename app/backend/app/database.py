@@ -1,13 +1,18 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index, text, update, func, and_, case, tuple_, select, bindparam
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 
 # Get DATABASE_URL from environment (Heroku sets this automatically)
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///synerchat.db')
 
+# Run migrations on startup; on by default only for the local SQLite database,
+# deployments run them once in the release phase instead
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', '1' if DATABASE_URL.startswith('sqlite') else '0') == '1'
+
 # Fix for Heroku postgres:// -> postgresql://
 if DATABASE_URL.startswith('postgres://'):
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
@@ -26,6 +31,8 @@ class User(Base):
     username = Column(String)
     profile_picture = Column(String)
     public_key = Column(Text)
+    # Bumped on every profile change so clients can cache profiles per version
+    profile_version = Column(Integer, nullable=False, default=1, server_default='1')
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class ChatRequest(Base):
@@ -38,24 +45,101 @@ class ChatRequest(Base):
     verification_code = Column(String)
     code_expires_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # get_chat_requests: only pending requests are ever listed
+        Index('ix_chat_requests_to_user_id_pending', 'to_user_id',
+              postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")),
+    )
 
 class Chat(Base):
     __tablename__ = 'chats'
     
     id = Column(Integer, primary_key=True, index=True)
-    user1_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    user2_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user1_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    user2_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    # Canonical (smaller id, larger id) pair: at most one chat per pair of users
+    user_low_id = Column(Integer)
+    user_high_id = Column(Integer)
     shared_secret = Column(Text)
+    # Sequence number of the latest message, allocated by create_message
+    last_seq = Column(Integer, nullable=False, default=0, server_default='0')
+    # Ephemeral chats are relayed in memory only, their messages are never stored
+    ephemeral = Column(Boolean, nullable=False, default=False, server_default='0')
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ux_chats_user_pair', 'user_low_id', 'user_high_id', unique=True),
+    )
+
+# Fields of a user that chat partners see, sent once per session through the user directory
+PROFILE_FIELDS = ('id', 'email', 'username', 'profile_picture', 'public_key', 'profile_version')
+
+def public_profile(user: Dict) -> Dict:
+    return {field: user.get(field) for field in PROFILE_FIELDS}
+
+def message_dict(msg: 'Message') -> Dict:
+    # Sender profiles aren't repeated per message, they come from the user directory
+    return {
+        'id': msg.id,
+        'chat_id': msg.chat_id,
+        'sender_id': msg.sender_id,
+        'seq': msg.seq,
+        'encrypted_content': msg.encrypted_content,
+        'message_type': msg.message_type,
+        'attachment_id': msg.attachment_id,
+        'created_at': msg.created_at.isoformat() if msg.created_at else None
+    }
+
+def user_pair(user_a_id: int, user_b_id: int) -> Tuple[int, int]:
+    """Canonical (low, high) order of two user ids"""
+    return (user_a_id, user_b_id) if user_a_id < user_b_id else (user_b_id, user_a_id)
 
 class Message(Base):
     __tablename__ = 'messages'
     
     id = Column(Integer, primary_key=True, index=True)
     chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
-    sender_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    sender_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     encrypted_content = Column(Text, nullable=False)
     message_type = Column(String, default='text')
+    attachment_id = Column(String)  # set for message_type 'attachment'
+    # Per-chat order: 1, 2, 3... without gaps, so clients can detect missed messages
+    seq = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Unread count window
+        Index('ix_messages_chat_id_created_at', 'chat_id', 'created_at'),
+        # get_chat_messages pagination; also rejects a sequence number used twice
+        Index('ux_messages_chat_id_seq', 'chat_id', 'seq', unique=True),
+    )
+
+class ChatSummary(Base):
+    """Inbox read model: one row per chat and participant, kept up to date by create_message"""
+    __tablename__ = 'chat_summaries'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    chat_id = Column(Integer, ForeignKey('chats.id'), primary_key=True)
+    other_user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    last_message_id = Column(Integer)
+    last_sender_id = Column(Integer)
+    last_activity = Column(DateTime, nullable=False)
+    unread_count = Column(Integer, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = (
+        # get_inbox: latest activity first, chat_id breaks ties for the page cursor
+        Index('ix_chat_summaries_user_id_last_activity', 'user_id', text('last_activity DESC'), text('chat_id DESC')),
+    )
+
+class Attachment(Base):
+    __tablename__ = 'attachments'
+    
+    id = Column(String, primary_key=True)  # random, also the blob file name
+    chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False, index=True)
+    uploader_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    size = Column(Integer, nullable=False)  # declared total size of the encrypted blob
+    completed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class AuthToken(Base):
@@ -74,28 +158,112 @@ class ChatDeletionRequest(Base):
     chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
     requester_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_chat_deletion_requests_chat_id_requester_id', 'chat_id', 'requester_id'),
+    )
 
 class FCMToken(Base):
     __tablename__ = 'fcm_tokens'
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     token = Column(String, unique=True, nullable=False, index=True)
     device_type = Column(String)  # 'android' or 'ios'
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 # Database wrapper class
+# Hot read statements, built once at import with bound parameters: SQLAlchemy's
+# compiled cache then reuses their SQL, and rows come back as plain mappings
+# (datetimes are left to the JSON encoder) instead of hydrated ORM objects
+USER_COLUMNS = (User.id, User.email, User.username, User.profile_picture, User.public_key,
+                User.profile_version, User.created_at)
+MESSAGE_COLUMNS = (Message.id, Message.chat_id, Message.sender_id, Message.seq, Message.encrypted_content,
+                   Message.message_type, Message.attachment_id, Message.created_at)
+
+SELECT_USER_BY_ID = select(*USER_COLUMNS).where(User.id == bindparam('user_id'))
+
+SELECT_TOKEN = select(AuthToken.user_id, AuthToken.token, AuthToken.expires_at).where(
+    AuthToken.token == bindparam('token'))
+
+def _chat_messages_statement(after: bool, before: bool):
+    statement = select(*MESSAGE_COLUMNS).where(Message.chat_id == bindparam('chat_id'))
+    if before:
+        statement = statement.where(Message.seq < bindparam('before_seq'))
+    if after:
+        statement = statement.where(Message.seq > bindparam('after_seq')).order_by(Message.seq)
+    else:
+        statement = statement.order_by(Message.seq.desc())
+    return statement.limit(bindparam('limit'))
+
+# (after_seq given, before_seq given) -> statement
+SELECT_CHAT_MESSAGES = {(after, before): _chat_messages_statement(after, before)
+                        for after in (False, True) for before in (False, True)}
+
+_other_user_id = case((Chat.user1_id == bindparam('user_id'), Chat.user2_id), else_=Chat.user1_id)
+SELECT_USER_CHATS = select(
+    Chat.id, Chat.user1_id, Chat.user2_id, Chat.created_at,
+    _other_user_id.label('other_user_id'),
+    User.email.label('other_user_email'),
+    User.username.label('other_user_username'),
+    User.profile_picture.label('other_user_profile_picture')
+).outerjoin(User, User.id == _other_user_id).where(
+    (Chat.user1_id == bindparam('user_id')) | (Chat.user2_id == bindparam('user_id'))
+)
+
+SELECT_PENDING_REQUESTS = select(
+    ChatRequest.id, ChatRequest.from_user_id, ChatRequest.to_user_id, ChatRequest.status,
+    ChatRequest.verification_code, ChatRequest.code_expires_at, ChatRequest.created_at,
+    User.email.label('from_user_email'),
+    User.username.label('from_user_username')
+).outerjoin(User, User.id == ChatRequest.from_user_id).where(
+    ChatRequest.to_user_id == bindparam('user_id'),
+    ChatRequest.status == 'pending'
+).order_by(ChatRequest.id)
+
+SELECT_INBOX_COLUMNS = (
+    ChatSummary.chat_id, ChatSummary.other_user_id, ChatSummary.last_activity, ChatSummary.unread_count,
+    Chat.ephemeral, Chat.created_at, User.email, User.username, User.profile_picture,
+    *(column.label(f'message_{column.key}') for column in MESSAGE_COLUMNS)
+)
+
+def _inbox_statement(paged: bool):
+    statement = select(*SELECT_INBOX_COLUMNS).join(
+        Chat, Chat.id == ChatSummary.chat_id
+    ).join(
+        User, User.id == ChatSummary.other_user_id
+    ).outerjoin(
+        Message, Message.id == ChatSummary.last_message_id
+    ).where(ChatSummary.user_id == bindparam('user_id'))
+    if paged:
+        statement = statement.where(tuple_(ChatSummary.last_activity, ChatSummary.chat_id) <
+                                    tuple_(bindparam('before_activity'), bindparam('before_chat_id')))
+    return statement.order_by(ChatSummary.last_activity.desc(), ChatSummary.chat_id.desc()).limit(bindparam('limit'))
+
+# first page / next pages
+SELECT_INBOX = {paged: _inbox_statement(paged) for paged in (False, True)}
+
 class Database:
-    def __init__(self):
-        Base.metadata.create_all(bind=engine)
+    # No connection is opened until the first query; the schema is managed by app.migrations
     
     def get_session(self):
         return SessionLocal()
     
+    def fetch_all(self, statement, **params) -> List[Dict]:
+        """Run a Core read statement and return its rows as plain dicts"""
+        with engine.connect() as conn:
+            return [dict(row) for row in conn.execute(statement, params).mappings()]
+    
+    def fetch_one(self, statement, **params) -> Optional[Dict]:
+        with engine.connect() as conn:
+            row = conn.execute(statement, params).mappings().first()
+            return dict(row) if row else None
+    
     def init_db(self):
-        """Initialize database tables"""
-        Base.metadata.create_all(bind=engine)
+        """Bring the schema up to date (normally done once per release, see app.migrations)"""
+        from .migrations import run_migrations
+        run_migrations()
     
     # User methods
     def create_user(self, email: str, password_hash: str, username: Optional[str] = None, 
@@ -139,19 +307,35 @@ class Database:
             session.close()
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
+        user = self.fetch_one(SELECT_USER_BY_ID, user_id=user_id)
+        if user and user['created_at']:
+            user['created_at'] = user['created_at'].isoformat()
+        return user
+    
+    def get_user_profiles(self, user_ids: List[int]) -> List[Dict]:
+        """Public profiles of several users in one query"""
         session = self.get_session()
         try:
-            user = session.query(User).filter(User.id == user_id).first()
-            if user:
-                return {
-                    'id': user.id,
-                    'email': user.email,
-                    'username': user.username,
-                    'profile_picture': user.profile_picture,
-                    'public_key': user.public_key,
-                    'created_at': user.created_at.isoformat() if user.created_at else None
-                }
-            return None
+            users = session.query(User).filter(User.id.in_(set(user_ids))).all()
+            return [{
+                'id': user.id,
+                'email': user.email,
+                'username': user.username,
+                'profile_picture': user.profile_picture,
+                'public_key': user.public_key,
+                'profile_version': user.profile_version
+            } for user in users]
+        finally:
+            session.close()
+    
+    def get_contact_ids(self, user_id: int) -> List[int]:
+        """Ids of the users sharing a chat with this user"""
+        session = self.get_session()
+        try:
+            chats = session.query(Chat.user1_id, Chat.user2_id).filter(
+                (Chat.user1_id == user_id) | (Chat.user2_id == user_id)
+            ).all()
+            return sorted({user2_id if user1_id == user_id else user1_id for user1_id, user2_id in chats})
         finally:
             session.close()
     
@@ -169,6 +353,9 @@ class Database:
                 user.profile_picture = profile_picture
             if public_key is not None:
                 user.public_key = public_key
+            if username is not None or profile_picture is not None or public_key is not None:
+                # Incremented in SQL so concurrent updates can't reuse a version
+                user.profile_version = User.profile_version + 1
             
             session.commit()
             return True
@@ -195,18 +382,8 @@ class Database:
             session.close()
     
     def get_token(self, token: str) -> Optional[Dict]:
-        session = self.get_session()
-        try:
-            auth_token = session.query(AuthToken).filter(AuthToken.token == token).first()
-            if auth_token:
-                return {
-                    'user_id': auth_token.user_id,
-                    'token': auth_token.token,
-                    'expires_at': auth_token.expires_at.isoformat()
-                }
-            return None
-        finally:
-            session.close()
+        """Session of an auth token; expires_at is a datetime"""
+        return self.fetch_one(SELECT_TOKEN, token=token)
     
     def delete_token(self, token: str) -> bool:
         session = self.get_session()
@@ -244,30 +421,8 @@ class Database:
             session.close()
     
     def get_chat_requests(self, user_id: int) -> List[Dict]:
-        session = self.get_session()
-        try:
-            requests = session.query(ChatRequest).filter(
-                ChatRequest.to_user_id == user_id,
-                ChatRequest.status == 'pending'
-            ).all()
-            
-            result = []
-            for req in requests:
-                from_user = session.query(User).filter(User.id == req.from_user_id).first()
-                result.append({
-                    'id': req.id,
-                    'from_user_id': req.from_user_id,
-                    'to_user_id': req.to_user_id,
-                    'status': req.status,
-                    'verification_code': req.verification_code,
-                    'code_expires_at': req.code_expires_at.isoformat() if req.code_expires_at else None,
-                    'created_at': req.created_at.isoformat() if req.created_at else None,
-                    'from_user_email': from_user.email if from_user else None,
-                    'from_user_username': from_user.username if from_user else None
-                })
-            return result
-        finally:
-            session.close()
+        """Pending requests to a user with the sender's name (datetimes not serialized)"""
+        return self.fetch_all(SELECT_PENDING_REQUESTS, user_id=user_id)
     
     def update_chat_request_status(self, request_id: int, status: str) -> bool:
         session = self.get_session()
@@ -307,8 +462,11 @@ class Database:
     def create_chat(self, user1_id: int, user2_id: int, shared_secret: str) -> Optional[int]:
         session = self.get_session()
         try:
-            chat = Chat(user1_id=user1_id, user2_id=user2_id, shared_secret=shared_secret)
+            low_id, high_id = user_pair(user1_id, user2_id)
+            chat = Chat(user1_id=user1_id, user2_id=user2_id, user_low_id=low_id, user_high_id=high_id,
+                        shared_secret=shared_secret)
             session.add(chat)
+            self._add_chat_summaries(session, chat)
             session.commit()
             session.refresh(chat)
             return chat.id
@@ -319,29 +477,27 @@ class Database:
         finally:
             session.close()
     
+    @staticmethod
+    def _add_chat_summaries(session, chat: Chat):
+        """Create the inbox rows of a new chat for both participants"""
+        session.flush()
+        for user_id, other_user_id in ((chat.user1_id, chat.user2_id), (chat.user2_id, chat.user1_id)):
+            session.add(ChatSummary(user_id=user_id, chat_id=chat.id, other_user_id=other_user_id,
+                                    last_activity=chat.created_at, unread_count=0))
+    
     def get_user_chats(self, user_id: int) -> List[Dict]:
+        """Chats of a user with the other participant, in one query (datetimes not serialized)"""
+        return self.fetch_all(SELECT_USER_CHATS, user_id=user_id)
+    
+    def chat_exists_between(self, user_a_id: int, user_b_id: int) -> bool:
+        """Check for a chat between two users with a single lookup on the pair index"""
         session = self.get_session()
         try:
-            chats = session.query(Chat).filter(
-                (Chat.user1_id == user_id) | (Chat.user2_id == user_id)
-            ).all()
-            
-            result = []
-            for chat in chats:
-                other_user_id = chat.user2_id if chat.user1_id == user_id else chat.user1_id
-                other_user = session.query(User).filter(User.id == other_user_id).first()
-                
-                result.append({
-                    'id': chat.id,
-                    'user1_id': chat.user1_id,
-                    'user2_id': chat.user2_id,
-                    'created_at': chat.created_at.isoformat() if chat.created_at else None,
-                    'other_user_id': other_user_id,
-                    'other_user_email': other_user.email if other_user else None,
-                    'other_user_username': other_user.username if other_user else None,
-                    'other_user_profile_picture': other_user.profile_picture if other_user else None
-                })
-            return result
+            low_id, high_id = user_pair(user_a_id, user_b_id)
+            return session.query(Chat.id).filter(
+                Chat.user_low_id == low_id,
+                Chat.user_high_id == high_id
+            ).first() is not None
         finally:
             session.close()
     
@@ -355,27 +511,75 @@ class Database:
                     'user1_id': chat.user1_id,
                     'user2_id': chat.user2_id,
                     'shared_secret': chat.shared_secret,
+                    'last_seq': chat.last_seq,
+                    'ephemeral': bool(chat.ephemeral),
                     'created_at': chat.created_at.isoformat() if chat.created_at else None
                 }
             return None
         finally:
             session.close()
     
+    def set_chat_ephemeral(self, chat_id: int, ephemeral: bool) -> bool:
+        session = self.get_session()
+        try:
+            updated = session.query(Chat).filter(Chat.id == chat_id).update({Chat.ephemeral: ephemeral})
+            session.commit()
+            return updated > 0
+        except Exception as e:
+            session.rollback()
+            print(f"Error updating chat mode: {e}")
+            return False
+        finally:
+            session.close()
+    
     # Message methods
     def create_message(self, chat_id: int, sender_id: int, encrypted_content: str, 
-                      message_type: str = 'text') -> Optional[int]:
+                      message_type: str = 'text', attachment_id: Optional[str] = None) -> Optional[Dict]:
+        """Store a message under the chat's next sequence number
+        
+        Returns the id, seq and created_at of the stored message, or None if the
+        chat doesn't exist or is ephemeral (checked in the same statement, so a
+        mode switch by another worker can't let a message through).
+        """
         session = self.get_session()
         try:
+            # The increment locks the chat row until commit, so concurrent
+            # senders in one chat get consecutive numbers
+            seq = session.execute(
+                update(Chat).where(Chat.id == chat_id, Chat.ephemeral.is_(False))
+                .values(last_seq=Chat.last_seq + 1)
+                .returning(Chat.last_seq)
+            ).scalar()
+            if seq is None:
+                session.rollback()
+                return None
             message = Message(
                 chat_id=chat_id,
                 sender_id=sender_id,
                 encrypted_content=encrypted_content,
-                message_type=message_type
+                message_type=message_type,
+                attachment_id=attachment_id,
+                seq=seq,
+                created_at=datetime.utcnow()
             )
             session.add(message)
+            session.flush()
+            # Inbox rows of both participants, in the same transaction; sending
+            # implies the sender has read the chat
+            session.execute(
+                update(ChatSummary).where(ChatSummary.chat_id == chat_id).values(
+                    last_message_id=message.id,
+                    last_sender_id=sender_id,
+                    last_activity=message.created_at,
+                    unread_count=case((ChatSummary.user_id == sender_id, 0), else_=ChatSummary.unread_count + 1)
+                )
+            )
             session.commit()
-            session.refresh(message)
-            return message.id
+            return {
+                'id': message.id,
+                'seq': seq,
+                'created_at': message.created_at.isoformat()
+            }
         except Exception as e:
             session.rollback()
             print(f"Error creating message: {e}")
@@ -383,28 +587,122 @@ class Database:
         finally:
             session.close()
     
-    def get_chat_messages(self, chat_id: int, limit: int = 100) -> List[Dict]:
+    def get_chat_messages(self, chat_id: int, limit: int = 100,
+                          after_seq: Optional[int] = None, before_seq: Optional[int] = None) -> List[Dict]:
+        """Messages of a chat in seq order (datetimes not serialized)
+        
+        Without after_seq these are the latest messages (before before_seq if
+        given); with after_seq, the ones following it, e.g. to fill a gap.
+        """
+        statement = SELECT_CHAT_MESSAGES[after_seq is not None, before_seq is not None]
+        messages = self.fetch_all(statement, chat_id=chat_id, limit=limit,
+                                  after_seq=after_seq, before_seq=before_seq)
+        if after_seq is None:
+            messages.reverse()
+        return messages
+    
+    # Sync methods: one set-based query each, whatever the number of chats
+    def get_sync_chats(self, user_id: int) -> List[Dict]:
         session = self.get_session()
         try:
-            messages = session.query(Message).filter(
-                Message.chat_id == chat_id
-            ).order_by(Message.created_at.desc()).limit(limit).all()
-            
-            result = []
+            chats = session.query(Chat).filter(
+                (Chat.user1_id == user_id) | (Chat.user2_id == user_id)
+            ).order_by(Chat.id).all()
+            return [{
+                'id': chat.id,
+                'other_user_id': chat.user2_id if chat.user1_id == user_id else chat.user1_id,
+                'last_seq': chat.last_seq,
+                'ephemeral': bool(chat.ephemeral),
+                'created_at': chat.created_at.isoformat() if chat.created_at else None
+            } for chat in chats]
+        finally:
+            session.close()
+    
+    def get_last_messages(self, chat_ids: List[int]) -> Dict[int, Dict]:
+        """Latest message of each chat (chat_id -> message)"""
+        if not chat_ids:
+            return {}
+        session = self.get_session()
+        try:
+            messages = session.query(Message).join(
+                Chat, and_(Chat.id == Message.chat_id, Chat.last_seq == Message.seq)
+            ).filter(Chat.id.in_(chat_ids)).all()
+            return {msg.chat_id: message_dict(msg) for msg in messages}
+        finally:
+            session.close()
+    
+    def get_recent_messages(self, chat_ids: List[int], per_chat: int) -> Dict[int, List[Dict]]:
+        """The last per_chat messages of each chat, in seq order (chat_id -> messages)"""
+        if not chat_ids or per_chat <= 0:
+            return {}
+        session = self.get_session()
+        try:
+            messages = session.query(Message).join(Chat, Chat.id == Message.chat_id).filter(
+                Chat.id.in_(chat_ids),
+                Message.seq > Chat.last_seq - per_chat
+            ).order_by(Message.chat_id, Message.seq).all()
+            result: Dict[int, List[Dict]] = {}
             for msg in messages:
-                sender = session.query(User).filter(User.id == msg.sender_id).first()
-                result.append({
-                    'id': msg.id,
-                    'chat_id': msg.chat_id,
-                    'sender_id': msg.sender_id,
-                    'encrypted_content': msg.encrypted_content,
-                    'message_type': msg.message_type,
-                    'created_at': msg.created_at.isoformat() if msg.created_at else None,
-                    'email': sender.email if sender else None,
-                    'username': sender.username if sender else None,
-                    'profile_picture': sender.profile_picture if sender else None
-                })
-            return list(reversed(result))
+                result.setdefault(msg.chat_id, []).append(message_dict(msg))
+            return result
+        finally:
+            session.close()
+    
+    def get_unread_counts(self, user_id: int) -> Dict[int, int]:
+        """Unread messages per chat (chat_id -> count, zeros omitted)"""
+        session = self.get_session()
+        try:
+            rows = session.query(ChatSummary.chat_id, ChatSummary.unread_count).filter(
+                ChatSummary.user_id == user_id,
+                ChatSummary.unread_count > 0
+            ).all()
+            return {chat_id: count for chat_id, count in rows}
+        finally:
+            session.close()
+    
+    # Inbox methods
+    def get_inbox(self, user_id: int, limit: int = 50,
+                  before: Optional[Tuple[datetime, int]] = None) -> List[Dict]:
+        """Chats by latest activity with their last message and partner, one index range scan
+        
+        before is the (last_activity, chat_id) of the last row of the previous page.
+        Rows are shaped for the /chat/active response (datetimes not serialized).
+        """
+        params = {'user_id': user_id, 'limit': limit}
+        if before is not None:
+            params['before_activity'], params['before_chat_id'] = before
+        with engine.connect() as conn:
+            rows = conn.execute(SELECT_INBOX[before is not None], params).all()
+        return [{
+            'id': row.chat_id,
+            'other_user': {
+                'id': row.other_user_id,
+                'email': row.email,
+                'username': row.username,
+                'profile_picture': row.profile_picture
+            },
+            'last_message': {
+                column.key: getattr(row, f'message_{column.key}') for column in MESSAGE_COLUMNS
+            } if row.message_id is not None else None,
+            'last_activity': row.last_activity,
+            'unread_count': row.unread_count,
+            'ephemeral': bool(row.ephemeral),
+            'created_at': row.created_at
+        } for row in rows]
+    
+    def mark_chat_read(self, user_id: int, chat_id: int) -> bool:
+        session = self.get_session()
+        try:
+            updated = session.query(ChatSummary).filter(
+                ChatSummary.user_id == user_id,
+                ChatSummary.chat_id == chat_id
+            ).update({ChatSummary.unread_count: 0})
+            session.commit()
+            return updated > 0
+        except Exception as e:
+            session.rollback()
+            print(f"Error marking chat read: {e}")
+            return False
         finally:
             session.close()
     
@@ -466,12 +764,16 @@ class Database:
             shared_secret = chat_request.verification_code + verification_code
             
             # Create chat
+            low_id, high_id = user_pair(chat_request.from_user_id, chat_request.to_user_id)
             chat = Chat(
                 user1_id=chat_request.from_user_id,
                 user2_id=chat_request.to_user_id,
+                user_low_id=low_id,
+                user_high_id=high_id,
                 shared_secret=shared_secret
             )
             session.add(chat)
+            self._add_chat_summaries(session, chat)
             
             # Update request status
             chat_request.status = 'accepted'
@@ -479,6 +781,10 @@ class Database:
             session.commit()
             session.refresh(chat)
             return chat.id
+        except IntegrityError:
+            # The unique pair index caught a concurrent accept or an existing chat
+            session.rollback()
+            raise Exception("Already have active chat with this user")
         except Exception as e:
             session.rollback()
             raise e
@@ -489,15 +795,22 @@ class Database:
         """Alias for get_chat_by_id"""
         return self.get_chat_by_id(chat_id)
     
-    def get_messages(self, chat_id: int, limit: int = 100) -> List[Dict]:
+    def get_messages(self, chat_id: int, limit: int = 100,
+                     after_seq: Optional[int] = None, before_seq: Optional[int] = None) -> List[Dict]:
         """Alias for get_chat_messages"""
-        return self.get_chat_messages(chat_id, limit)
+        return self.get_chat_messages(chat_id, limit, after_seq=after_seq, before_seq=before_seq)
     
     def clear_messages(self, chat_id: int) -> bool:
-        """Delete all messages in a chat"""
+        """Delete all messages in a chat (and their attachment records)"""
         session = self.get_session()
         try:
             session.query(Message).filter(Message.chat_id == chat_id).delete()
+            session.query(Attachment).filter(Attachment.chat_id == chat_id).delete()
+            session.query(ChatSummary).filter(ChatSummary.chat_id == chat_id).update({
+                ChatSummary.last_message_id: None,
+                ChatSummary.last_sender_id: None,
+                ChatSummary.unread_count: 0
+            })
             session.commit()
             return True
         except Exception as e:
@@ -545,8 +858,10 @@ class Database:
         """Delete a chat and all its messages"""
         session = self.get_session()
         try:
-            # Delete all messages first
+            # Delete all messages and attachment records first
             session.query(Message).filter(Message.chat_id == chat_id).delete()
+            session.query(Attachment).filter(Attachment.chat_id == chat_id).delete()
+            session.query(ChatSummary).filter(ChatSummary.chat_id == chat_id).delete()
             # Delete the chat
             session.query(Chat).filter(Chat.id == chat_id).delete()
             session.commit()
@@ -558,6 +873,57 @@ class Database:
         finally:
             session.close()
     
+    # Attachment methods
+    def create_attachment(self, attachment_id: str, chat_id: int, uploader_id: int, size: int) -> bool:
+        session = self.get_session()
+        try:
+            session.add(Attachment(id=attachment_id, chat_id=chat_id, uploader_id=uploader_id, size=size))
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            print(f"Error creating attachment: {e}")
+            return False
+        finally:
+            session.close()
+    
+    def get_attachment(self, attachment_id: str) -> Optional[Dict]:
+        session = self.get_session()
+        try:
+            attachment = session.query(Attachment).filter(Attachment.id == attachment_id).first()
+            if attachment:
+                return {
+                    'id': attachment.id,
+                    'chat_id': attachment.chat_id,
+                    'uploader_id': attachment.uploader_id,
+                    'size': attachment.size,
+                    'completed': bool(attachment.completed),
+                    'created_at': attachment.created_at.isoformat() if attachment.created_at else None
+                }
+            return None
+        finally:
+            session.close()
+    
+    def complete_attachment(self, attachment_id: str) -> bool:
+        session = self.get_session()
+        try:
+            session.query(Attachment).filter(Attachment.id == attachment_id).update({'completed': True})
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            print(f"Error completing attachment: {e}")
+            return False
+        finally:
+            session.close()
+    
+    def get_chat_attachment_ids(self, chat_id: int) -> List[str]:
+        session = self.get_session()
+        try:
+            return [row.id for row in session.query(Attachment.id).filter(Attachment.chat_id == chat_id)]
+        finally:
+            session.close()
+    
     # FCM Token methods
     def save_fcm_token(self, user_id: int, token: str, device_type: str = 'unknown') -> bool:
         """Save or update FCM token for a user"""
@@ -613,31 +979,15 @@ class Database:
             session.close()
     
     def get_unread_message_count(self, user_id: int, chat_id: Optional[int] = None) -> int:
-        """Get count of unread messages for a user
-        
-        Note: This is a simplified version. In a real app, you'd track read status per message.
-        For now, we'll return the count of recent messages not sent by the user.
-        """
+        """Get count of unread messages for a user, from the inbox counters"""
         session = self.get_session()
         try:
-            query = session.query(Message).filter(Message.sender_id != user_id)
-            
+            query = session.query(func.coalesce(func.sum(ChatSummary.unread_count), 0)).filter(
+                ChatSummary.user_id == user_id
+            )
             if chat_id:
-                query = query.filter(Message.chat_id == chat_id)
-            else:
-                # Get all chats for the user
-                user_chats = session.query(Chat).filter(
-                    (Chat.user1_id == user_id) | (Chat.user2_id == user_id)
-                ).all()
-                chat_ids = [chat.id for chat in user_chats]
-                query = query.filter(Message.chat_id.in_(chat_ids))
-            
-            # Count messages from the last hour (simplified unread logic)
-            from datetime import timedelta
-            one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-            count = query.filter(Message.created_at >= one_hour_ago).count()
-            
-            return count
+                query = query.filter(ChatSummary.chat_id == chat_id)
+            return query.scalar()
         finally:
             session.close()
 
@@ -0,0 +1,168 @@
+import os
+import hashlib
+import mimetypes
+from typing import Dict, List, Optional, Tuple
+import anyio
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+
+# Files the manifest advertises as app builds
+BUILD_EXTENSIONS = ('.apk', '.ipa')
+
+CONTENT_TYPES = {
+    '.apk': 'application/vnd.android.package-archive',
+    '.ipa': 'application/octet-stream',
+}
+
+class DownloadFile:
+    """A downloadable file with the size and content hash taken at startup"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.size = os.path.getsize(path)
+        ext = os.path.splitext(self.filename)[1].lower()
+        self.content_type = CONTENT_TYPES.get(ext) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        self.sha256 = sha.hexdigest()
+        self.etag = f'"{self.sha256[:32]}"'
+
+    def to_dict(self) -> Dict:
+        return {
+            'filename': self.filename,
+            'url': f'/downloads/{self.filename}',
+            'size': self.size,
+            'sha256': self.sha256,
+            'content_type': self.content_type
+        }
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=start-end' range into inclusive offsets
+
+    Returns None for anything we don't serve partially (multiple ranges,
+    other units, malformed headers): the caller then sends the whole file.
+    Raises ValueError when the range can't be satisfied.
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    start_s, sep, end_s = spec.strip().partition('-')
+    try:
+        start = int(start_s) if start_s.strip() else None
+        end = int(end_s) if end_s.strip() else None
+    except ValueError:
+        return None
+    if not sep or (start is None and end is None):
+        return None
+
+    if start is None:
+        # Suffix range: the last N bytes (an empty file has none)
+        if end == 0 or size == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - end, 0), size - 1
+    if end is not None and end < start:
+        return None
+    if start >= size:
+        raise ValueError('Range not satisfiable')
+    return start, size - 1 if end is None else min(end, size - 1)
+
+class FileRangeResponse(Response):
+    """Streams (part of) a file, zero-copy when the ASGI server supports it"""
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: Dict[str, str], media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.headers['content-length'] = str(self.count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        if scope['method'].upper() == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            return
+
+        async with await anyio.open_file(self.path, mode='rb') as f:
+            if 'http.response.zerocopysend' in scope.get('extensions', {}):
+                # Let the server sendfile() straight from the descriptor
+                await send({
+                    'type': 'http.response.zerocopysend',
+                    'file': f.wrapped.fileno(),
+                    'offset': self.start,
+                    'count': self.count,
+                    'more_body': False
+                })
+                return
+
+            await f.seek(self.start)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+            if remaining > 0:
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+class DownloadsCatalog:
+    """The files of the downloads directory, hashed once at startup"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.files: Dict[str, DownloadFile] = {}
+
+    def load(self):
+        files = {}
+        for filename in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, filename)
+            if filename.startswith('.') or not os.path.isfile(path):
+                continue
+            files[filename] = DownloadFile(path)
+        self.files = files
+        print(f"Loaded {len(files)} downloads")
+
+    def get(self, filename: str) -> Optional[DownloadFile]:
+        return self.files.get(filename)
+
+    def builds(self) -> List[Dict]:
+        return [f.to_dict() for f in self.files.values() if f.filename.lower().endswith(BUILD_EXTENSIONS)]
+
+    def response(self, file: DownloadFile, request: Request) -> Response:
+        return range_response(request, file.path, file.size, file.etag, file.content_type, headers={
+            # Filenames aren't versioned: revalidate, the ETag makes that cheap
+            'Cache-Control': 'no-cache',
+            'Content-Disposition': f'attachment; filename="{file.filename}"'
+        })
+
+def range_response(request: Request, path: str, size: int, etag: str, media_type: str,
+                   headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serve a file honouring If-None-Match, Range and If-Range"""
+    headers = {'ETag': etag, 'Accept-Ranges': 'bytes', **(headers or {})}
+
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and any(tag.strip().removeprefix('W/') in (etag, '*')
+                             for tag in if_none_match.split(',')):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    # A stale If-Range means the client's partial copy is of another version
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+        if byte_range is not None:
+            start, end = byte_range
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            return FileRangeResponse(path, start, end, status_code=206, headers=headers, media_type=media_type)
+
+    return FileRangeResponse(path, 0, size - 1, status_code=200, headers=headers, media_type=media_type)
@@ -1,18 +1,30 @@
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from .routers import auth, chat, notifications
-from .database import db
 
-# Load environment variables from .env file
+# Load environment variables from .env file, before any module reads them
 load_dotenv()
 
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from .routers import auth, chat, notifications, media, attachments, sync
+from .database import db, AUTO_MIGRATE
+from .static_assets import StaticAssets
+from .downloads import DownloadsCatalog
+from .services.push_notifications import push_service
+from .responses import FastJSONResponse
+from .services.rate_limit import RateLimitMiddleware
+from .services.drain import graceful_drain, wait_for_background_jobs
+
 CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
 
-app = FastAPI(title='Synerchat Backend', version='1.0.0')
+app = FastAPI(title='Synerchat Backend', version='1.0.0', default_response_class=FastJSONResponse)
+
+# Frontend build, served by the catch-all route at the end
+frontend_path = os.path.join(os.path.dirname(__file__), '../static')
+static_assets = StaticAssets(frontend_path)
+
+# Added before CORS so it runs inside it and 429s still carry CORS headers
+app.add_middleware(RateLimitMiddleware, exempt=lambda path: static_assets.get(path) is not None)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +38,9 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(chat.router)
 app.include_router(notifications.router)
+app.include_router(media.router)
+app.include_router(attachments.router)
+app.include_router(sync.router)
 
 @app.get('/healthz')
 async def healthz():
@@ -35,45 +50,52 @@ async def healthz():
 downloads_path = os.path.join(os.path.dirname(__file__), '../downloads')
 if not os.path.exists(downloads_path):
     os.makedirs(downloads_path)
+downloads = DownloadsCatalog(downloads_path)
 
-@app.get("/downloads/{filename}")
-async def download_app(filename: str):
-    """Serve mobile app downloads (APK/IPA)"""
-    file_path = os.path.join(downloads_path, filename)
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        # Set appropriate content type
-        content_type = "application/vnd.android.package-archive" if filename.endswith('.apk') else "application/octet-stream"
-        return FileResponse(
-            file_path, 
-            media_type=content_type,
-            filename=filename,
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Cache-Control": "no-cache"
-            }
-        )
-    return {"error": "File not found"}
+@app.get("/downloads/manifest")
+async def downloads_manifest():
+    """Available mobile builds with size and hash, to check for updates"""
+    return {"builds": downloads.builds()}
+
+@app.api_route("/downloads/{filename}", methods=["GET", "HEAD"])
+async def download_app(filename: str, request: Request):
+    """Serve mobile app downloads (APK/IPA), resumable with Range requests"""
+    file = downloads.get(filename)
+    if file is None:
+        return {"error": "File not found"}
+    return downloads.response(file, request)
 
 # Serve frontend static files
-frontend_path = os.path.join(os.path.dirname(__file__), '../static')
 if os.path.exists(frontend_path):
-    app.mount("/assets", StaticFiles(directory=os.path.join(frontend_path, "assets")), name="assets")
-    
     @app.get("/{full_path:path}")
-    async def serve_frontend(full_path: str):
-        file_path = os.path.join(frontend_path, full_path)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            return FileResponse(file_path)
-        return FileResponse(os.path.join(frontend_path, "index.html"))
+    async def serve_frontend(full_path: str, request: Request):
+        asset = static_assets.get(full_path)
+        if asset is None:
+            # Missing build outputs are real 404s, anything else is a client-side route
+            if full_path.startswith('assets/'):
+                raise HTTPException(status_code=404, detail="Not found")
+            asset = static_assets.get('index.html')
+            if asset is None:
+                raise HTTPException(status_code=404, detail="Not found")
+        return static_assets.response(asset, request)
 
 @app.on_event("startup")
 async def startup():
-    """Initialize database on startup"""
-    db.init_db()
-    print("Database initialized")
+    """Build in-memory manifests; schema migrations normally run in the release phase"""
+    if AUTO_MIGRATE:
+        db.init_db()
+        print("Database initialized")
+    downloads.load()
+    if os.path.exists(frontend_path):
+        static_assets.load()
+    # Runs after uvicorn installed its handlers, so it can chain to them
+    graceful_drain.install()
     print("Synerchat backend ready!")
 
 @app.on_event("shutdown")
 async def shutdown():
     """Cleanup on shutdown"""
     print("Shutting down Synerchat backend")
+    # Normally done by the drain already; covers shutdowns without one (Ctrl+C)
+    await wait_for_background_jobs(5)
+    await push_service.close()
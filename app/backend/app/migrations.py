@@ -0,0 +1,207 @@
+"""
+Versioned schema migrations
+
+Run once per release (Heroku release phase), not on every boot:
+    python -m app.migrations            # apply pending migrations
+    python -m app.migrations --status   # show current and latest version
+
+A fresh database gets the whole schema from the models and is stamped with the
+latest version. Databases created before migrations existed are stamped with
+version 1 and then get every later migration, so migrations after the first
+must work on a database created by the previous schema.
+"""
+import re
+import sys
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, text, Index
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex
+from .database import engine, Base, Attachment, ChatSummary
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+# (version, description, function, transactional)
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None], bool]] = []
+
+def migration(version: int, description: str, transactional: bool = True):
+    """Register a migration function
+
+    Non-transactional migrations run in autocommit mode, which Postgres
+    requires for CREATE INDEX CONCURRENTLY; they must be safe to re-run.
+    """
+    def decorator(func: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, func, transactional))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+def find_index(name: str) -> Index:
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(name)
+
+def create_index_online(conn: Connection, name: str):
+    """Create a model-defined index without blocking writes (CONCURRENTLY on Postgres)"""
+    index = find_index(name)
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+    if conn.dialect.name == 'postgresql':
+        # A concurrent build that failed leaves an INVALID index behind, which
+        # IF NOT EXISTS would skip; drop it and build again
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {'name': name}).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        ddl = re.sub(r'^CREATE (UNIQUE )?INDEX ', r'CREATE \1INDEX CONCURRENTLY ', ddl)
+    print(f"  {ddl}")
+    conn.execute(text(ddl))
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+@migration(1, 'Initial schema')
+def initial_schema(conn: Connection):
+    Base.metadata.create_all(bind=conn)
+
+@migration(2, 'Indexes on foreign-key hot columns', transactional=False)
+def hot_column_indexes(conn: Connection):
+    for name in (
+        'ix_messages_chat_id_created_at',
+        'ix_messages_sender_id',
+        'ix_chats_user1_id',
+        'ix_chats_user2_id',
+        'ix_chat_requests_to_user_id_pending',
+        'ix_fcm_tokens_user_id',
+        'ix_chat_deletion_requests_chat_id_requester_id',
+    ):
+        create_index_online(conn, name)
+
+@migration(3, 'Canonical user pair on chats with a unique index', transactional=False)
+def chat_user_pair(conn: Connection):
+    columns = {c['name'] for c in inspect(conn).get_columns('chats')}
+    for column in ('user_low_id', 'user_high_id'):
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE chats ADD COLUMN {column} INTEGER"))
+    # Backfill only the oldest chat of each pair: existing duplicates keep a NULL
+    # pair (NULLs don't collide in the unique index) and stay readable as before
+    low = "CASE WHEN user1_id < user2_id THEN user1_id ELSE user2_id END"
+    high = "CASE WHEN user1_id < user2_id THEN user2_id ELSE user1_id END"
+    conn.execute(text(
+        f"UPDATE chats SET user_low_id = {low}, user_high_id = {high} "
+        f"WHERE user_low_id IS NULL AND id IN (SELECT MIN(id) FROM chats GROUP BY {low}, {high})"
+    ))
+    create_index_online(conn, 'ux_chats_user_pair')
+
+@migration(4, 'Attachments table and message attachment references')
+def attachments(conn: Connection):
+    Attachment.__table__.create(bind=conn, checkfirst=True)
+    columns = {c['name'] for c in inspect(conn).get_columns('messages')}
+    if 'attachment_id' not in columns:
+        conn.execute(text("ALTER TABLE messages ADD COLUMN attachment_id VARCHAR"))
+
+@migration(5, 'Profile version on users for the user directory')
+def profile_version(conn: Connection):
+    columns = {c['name'] for c in inspect(conn).get_columns('users')}
+    if 'profile_version' not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN profile_version INTEGER NOT NULL DEFAULT 1"))
+
+@migration(6, 'Per-chat message sequence numbers', transactional=False)
+def message_seq(conn: Connection):
+    chat_columns = {c['name'] for c in inspect(conn).get_columns('chats')}
+    if 'last_seq' not in chat_columns:
+        conn.execute(text("ALTER TABLE chats ADD COLUMN last_seq INTEGER NOT NULL DEFAULT 0"))
+    message_columns = {c['name'] for c in inspect(conn).get_columns('messages')}
+    if 'seq' not in message_columns:
+        conn.execute(text("ALTER TABLE messages ADD COLUMN seq INTEGER"))
+    # Number existing messages in their previous display order; each statement
+    # is atomic and recomputes everything, so re-running is safe
+    conn.execute(text(
+        "UPDATE messages SET seq = numbered.rn FROM ("
+        "SELECT id, ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY created_at, id) AS rn FROM messages"
+        ") AS numbered WHERE messages.id = numbered.id"
+    ))
+    conn.execute(text(
+        "UPDATE chats SET last_seq = COALESCE((SELECT MAX(seq) FROM messages WHERE messages.chat_id = chats.id), 0)"
+    ))
+    create_index_online(conn, 'ux_messages_chat_id_seq')
+
+@migration(7, 'Chat summaries for the inbox')
+def chat_summaries(conn: Connection):
+    ChatSummary.__table__.create(bind=conn, checkfirst=True)
+    # One row per participant, previewing the chat's latest message; unread
+    # counters start at zero
+    for user_col, other_col in (('user1_id', 'user2_id'), ('user2_id', 'user1_id')):
+        conn.execute(text(
+            "INSERT INTO chat_summaries "
+            "(user_id, chat_id, other_user_id, last_message_id, last_sender_id, last_activity, unread_count) "
+            f"SELECT c.{user_col}, c.id, c.{other_col}, m.id, m.sender_id, COALESCE(m.created_at, c.created_at), 0 "
+            "FROM chats c LEFT JOIN messages m ON m.chat_id = c.id AND m.seq = c.last_seq "
+            f"WHERE NOT EXISTS (SELECT 1 FROM chat_summaries s WHERE s.user_id = c.{user_col} AND s.chat_id = c.id)"
+        ))
+
+@migration(8, 'Ephemeral (relay-only) chats')
+def ephemeral_chats(conn: Connection):
+    columns = {c['name'] for c in inspect(conn).get_columns('chats')}
+    if 'ephemeral' not in columns:
+        conn.execute(text("ALTER TABLE chats ADD COLUMN ephemeral BOOLEAN NOT NULL DEFAULT FALSE"))
+
+def _ensure_version_table(conn: Connection):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+        "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+def _stamp(conn: Connection, version: int, description: str):
+    conn.execute(
+        text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)"),
+        {'v': version, 'd': description, 't': datetime.utcnow()}
+    )
+
+def current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(SCHEMA_VERSION_TABLE):
+        return 0
+    return conn.execute(text(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}")).scalar() or 0
+
+def run_migrations() -> int:
+    """Apply pending migrations, returns the resulting schema version"""
+    with engine.begin() as conn:
+        version = current_version(conn)
+        if version == 0:
+            fresh = not inspect(conn).has_table('users')
+            _ensure_version_table(conn)
+            if fresh:
+                Base.metadata.create_all(bind=conn)
+                for v, description, _, _ in MIGRATIONS:
+                    _stamp(conn, v, description)
+                print(f"Created schema at version {latest_version()}")
+                return latest_version()
+            # Database from before migrations existed: it has the initial schema
+            _stamp(conn, 1, MIGRATIONS[0][1])
+            version = 1
+
+    for v, description, func, transactional in MIGRATIONS:
+        if v <= version:
+            continue
+        print(f"Applying migration {v}: {description}")
+        if transactional:
+            # One transaction per migration, so a failure leaves the previous version intact
+            with engine.begin() as conn:
+                func(conn)
+                _stamp(conn, v, description)
+        else:
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                func(conn)
+                _stamp(conn, v, description)
+        version = v
+    return version
+
+if __name__ == '__main__':
+    if '--status' in sys.argv:
+        with engine.connect() as conn:
+            print(f"Schema version {current_version(conn)} (latest {latest_version()})")
+    else:
+        print(f"Schema at version {run_migrations()}")
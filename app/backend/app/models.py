@@ -61,6 +61,7 @@ class Message(BaseModel):
     chat_id: int
     content: str
     message_type: Optional[str] = 'text'
+    attachment_id: Optional[str] = None  # uploaded through /attachments
 
 class MessageResponse(BaseModel):
     id: int
@@ -72,6 +73,9 @@ class MessageResponse(BaseModel):
     username: Optional[str]
     profile_picture: Optional[str]
 
+class ChatMode(BaseModel):
+    ephemeral: bool
+
 class VerifyChat(BaseModel):
     chat_id: int
     verification_code: str
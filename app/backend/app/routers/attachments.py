@@ -0,0 +1,91 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+from ..database import db
+from ..auth import verify_token
+from ..downloads import range_response
+from ..services.attachments import attachment_store, UploadError, ATTACHMENT_MAX_BYTES
+
+router = APIRouter(prefix="/attachments", tags=["attachments"])
+
+class CreateAttachment(BaseModel):
+    chat_id: int
+    size: int
+
+def get_chat_for_user(chat_id: int, user: dict) -> dict:
+    chat = db.get_chat(chat_id)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    if chat['user1_id'] != user['id'] and chat['user2_id'] != user['id']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return chat
+
+def get_attachment_for_user(attachment_id: str, user: dict) -> dict:
+    attachment = db.get_attachment(attachment_id)
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    get_chat_for_user(attachment['chat_id'], user)
+    return attachment
+
+@router.post("")
+async def create_upload(create: CreateAttachment, user: dict = Depends(verify_token)):
+    """Start a resumable upload of an encrypted blob for a chat"""
+    get_chat_for_user(create.chat_id, user)
+    if create.size <= 0 or create.size > ATTACHMENT_MAX_BYTES:
+        raise HTTPException(status_code=400, detail=f"Size must be between 1 and {ATTACHMENT_MAX_BYTES} bytes")
+    
+    attachment_id = attachment_store.new_id()
+    attachment_store.create(attachment_id)
+    if not db.create_attachment(attachment_id, create.chat_id, user['id'], create.size):
+        attachment_store.delete([attachment_id])
+        raise HTTPException(status_code=500, detail="Failed to create upload")
+    
+    return {"attachment_id": attachment_id, "offset": 0, "size": create.size}
+
+@router.head("/{attachment_id}/upload")
+async def upload_offset(attachment_id: str, user: dict = Depends(verify_token)):
+    """Where to resume an interrupted upload"""
+    attachment = get_attachment_for_user(attachment_id, user)
+    offset = attachment_store.offset(attachment_id) or 0
+    return Response(headers={"Upload-Offset": str(offset), "Upload-Length": str(attachment['size'])})
+
+@router.patch("/{attachment_id}/upload")
+async def upload_chunk(attachment_id: str, request: Request, user: dict = Depends(verify_token)):
+    """Append the raw request body at the Upload-Offset header, streamed to disk"""
+    attachment = get_attachment_for_user(attachment_id, user)
+    if attachment['uploader_id'] != user['id']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if attachment['completed']:
+        raise HTTPException(status_code=409, detail="Upload already completed")
+    
+    try:
+        offset = int(request.headers.get("upload-offset", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Missing Upload-Offset header")
+    
+    try:
+        offset = await attachment_store.append(attachment_id, offset, attachment['size'], request.stream())
+    except UploadError as e:
+        current = attachment_store.offset(attachment_id) or 0
+        raise HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(current)})
+    
+    completed = offset == attachment['size']
+    if completed:
+        db.complete_attachment(attachment_id)
+    return Response(
+        status_code=204,
+        headers={"Upload-Offset": str(offset), "Upload-Complete": "true" if completed else "false"}
+    )
+
+@router.get("/{attachment_id}")
+async def download_attachment(attachment_id: str, request: Request, user: dict = Depends(verify_token)):
+    """Download a completed encrypted blob, with Range support"""
+    attachment = get_attachment_for_user(attachment_id, user)
+    if not attachment['completed']:
+        raise HTTPException(status_code=409, detail="Upload not completed")
+    
+    # Blobs never change once completed
+    return range_response(
+        request, attachment_store.path_for(attachment_id), attachment['size'], f'"{attachment_id}"',
+        "application/octet-stream", headers={"Cache-Control": "private, max-age=31536000, immutable"}
+    )
@@ -2,9 +2,21 @@ from fastapi import APIRouter, HTTPException, Depends
 from ..models import UserRegister, UserLogin, UserProfile, UserUpdate
 from ..database import db
 from ..auth import hash_password, verify_password, create_session, verify_token
+from ..websocket_manager import manager
+from ..services.media import media_store, MediaError, MediaTooLarge
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+async def store_profile_picture(profile_picture):
+    """Move an inline data URL picture into the media store and return its URL"""
+    try:
+        return await run_in_threadpool(media_store.profile_picture_ref, profile_picture)
+    except MediaTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MediaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/register")
 async def register(user: UserRegister):
     """Register new user"""
@@ -16,12 +28,15 @@ async def register(user: UserRegister):
     # Hash password
     password_hash = hash_password(user.password)
     
+    # Store inline (data URL) pictures in the media store, keep only the reference
+    profile_picture = await store_profile_picture(user.profile_picture)
+    
     # Create user
     user_id = db.create_user(
         email=user.email,
         password_hash=password_hash,
         username=user.username,
-        profile_picture=user.profile_picture,
+        profile_picture=profile_picture,
         public_key=user.public_key
     )
     
@@ -85,13 +100,16 @@ async def get_current_user(user: dict = Depends(verify_token)):
 @router.put("/me")
 async def update_profile(update: UserUpdate, user: dict = Depends(verify_token)):
     """Update user profile"""
-    db.update_user_profile(
+    db.update_user(
         user_id=user['id'],
         username=update.username,
-        profile_picture=update.profile_picture,
+        profile_picture=await store_profile_picture(update.profile_picture),
         public_key=update.public_key
     )
     
+    # Chat partners and the user's other devices refresh their directory entry
+    await manager.publish_profile(user['id'])
+    
     # Get updated user
     updated_user = db.get_user_by_id(user['id'])
     
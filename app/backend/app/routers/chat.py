@@ -1,11 +1,23 @@
-from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
-from typing import List
-from ..models import ChatRequest, AcceptChatRequest, Message, VerifyChat, SearchUsers
-from ..database import db
+from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, Query, Header
+from typing import List, Optional
+from ..models import ChatRequest, AcceptChatRequest, Message, VerifyChat, SearchUsers, ChatMode
+from ..database import db, public_profile
 from ..auth import verify_token
 from ..websocket_manager import manager
 from .notifications import send_new_message_notification
+from ..services.attachments import attachment_store
+from ..services.ephemeral import ephemeral_relay
+from ..services.rate_limit import FrameLimiter
+from ..services.drain import run_in_background
+from ..responses import FastJSONResponse
 import json
+import os
+import time
+import secrets
+from datetime import datetime
+
+# /chat/ws/metrics is disabled unless this is set
+WS_METRICS_TOKEN = os.getenv('WS_METRICS_TOKEN', '')
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -28,10 +40,8 @@ async def create_chat_request(request: ChatRequest, user: dict = Depends(verify_
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check if already have active chat
-    active_chats = db.get_active_chats(user['id'])
-    for chat in active_chats:
-        if chat['user1_id'] == request.to_user_id or chat['user2_id'] == request.to_user_id:
-            raise HTTPException(status_code=400, detail="Already have active chat with this user")
+    if db.chat_exists_between(user['id'], request.to_user_id):
+        raise HTTPException(status_code=400, detail="Already have active chat with this user")
     
     # Create request with expiration (24 hours)
     from datetime import datetime, timedelta
@@ -65,7 +75,7 @@ async def create_chat_request(request: ChatRequest, user: dict = Depends(verify_
 async def get_pending_requests(user: dict = Depends(verify_token)):
     """Get pending chat requests"""
     requests = db.get_pending_requests(user['id'])
-    return {"requests": requests}
+    return FastJSONResponse({"requests": requests})
 
 @router.post("/accept")
 async def accept_request(accept: AcceptChatRequest, user: dict = Depends(verify_token)):
@@ -83,8 +93,12 @@ async def accept_request(accept: AcceptChatRequest, user: dict = Depends(verify_
     # Get chat details
     chat = db.get_chat(chat_id)
     
+    # Each side needs the new partner's profile in its directory
+    profiles = db.get_user_profiles([chat['user1_id'], chat['user2_id']])
+    
     # Notify both users
     for user_id in [chat['user1_id'], chat['user2_id']]:
+        await manager.ensure_profiles(user_id, profiles)
         await manager.broadcast_to_user(
             user_id=user_id,
             message_type="chat_accepted",
@@ -97,31 +111,52 @@ async def accept_request(accept: AcceptChatRequest, user: dict = Depends(verify_
     return {"chat_id": chat_id, "status": "accepted"}
 
 @router.get("/active")
-async def get_active_chats(user: dict = Depends(verify_token)):
-    """Get all active chats for user"""
-    chats = db.get_active_chats(user['id'])
-    
-    # Format chats with other user info
-    formatted_chats = []
-    for chat in chats:
-        other_user = {
-            "id": chat['other_user_id'],
-            "email": chat.get('other_user_email'),
-            "username": chat.get('other_user_username'),
-            "profile_picture": chat.get('other_user_profile_picture')
-        }
-        
-        formatted_chats.append({
-            "id": chat['id'],
-            "other_user": other_user,
-            "created_at": chat.get('created_at')
-        })
-    
-    return {"chats": formatted_chats}
+async def get_active_chats(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    user: dict = Depends(verify_token)
+):
+    """Get the user's chats, most recent activity first
+    
+    Pass next_cursor from the previous response as cursor for the next page.
+    """
+    before = None
+    if cursor:
+        try:
+            last_activity, _, chat_id = cursor.rpartition(",")
+            before = (datetime.fromisoformat(last_activity), int(chat_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Rows come shaped for the response, with the other user's info
+    chats = db.get_inbox(user['id'], limit=limit, before=before)
+    
+    next_cursor = None
+    if len(chats) == limit:
+        next_cursor = f"{chats[-1]['last_activity'].isoformat()},{chats[-1]['id']}"
+    
+    return FastJSONResponse({"chats": chats, "next_cursor": next_cursor})
+
+@router.post("/read/{chat_id}")
+async def mark_chat_read(chat_id: int, user: dict = Depends(verify_token)):
+    """Reset the unread counter of a chat for the current user"""
+    if not db.mark_chat_read(user['id'], chat_id):
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return {"status": "read"}
 
 @router.get("/messages/{chat_id}")
-async def get_messages(chat_id: int, user: dict = Depends(verify_token)):
-    """Get messages for a chat"""
+async def get_messages(
+    chat_id: int,
+    after_seq: Optional[int] = None,
+    before_seq: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=500),
+    user: dict = Depends(verify_token)
+):
+    """Get messages for a chat
+    
+    Latest messages by default; after_seq/before_seq select an exact seq range,
+    e.g. the messages a client missed when it sees a gap in seq.
+    """
     # Verify user is part of chat
     chat = db.get_chat(chat_id)
     if not chat:
@@ -130,69 +165,131 @@ async def get_messages(chat_id: int, user: dict = Depends(verify_token)):
     if chat['user1_id'] != user['id'] and chat['user2_id'] != user['id']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    messages = db.get_messages(chat_id)
-    return {"messages": messages}
+    messages = db.get_messages(chat_id, limit, after_seq=after_seq, before_seq=before_seq)
+    # Messages only carry sender_id, the participants' profiles are listed once
+    users = db.get_user_profiles([chat['user1_id'], chat['user2_id']])
+    return FastJSONResponse({"messages": messages, "users": users, "last_seq": chat['last_seq']})
 
 @router.post("/send")
 async def send_message(message: Message, user: dict = Depends(verify_token)):
     """Send a message in a chat"""
     # Verify user is part of chat
-    chat = db.get_chat(message.chat_id)
+    chat = ephemeral_relay.get_chat(message.chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
     if chat['user1_id'] != user['id'] and chat['user2_id'] != user['id']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Save message with timestamp
-    from datetime import datetime
-    created_at = datetime.now().isoformat()
+    if chat['ephemeral']:
+        return await send_ephemeral_message(chat, message, user)
+    
+    # Attachments travel as a reference to a completed upload of this chat
+    if message.attachment_id:
+        attachment = db.get_attachment(message.attachment_id)
+        if not attachment or attachment['chat_id'] != message.chat_id or not attachment['completed']:
+            raise HTTPException(status_code=400, detail="Invalid attachment")
     
-    message_id = db.create_message(
+    # Save message; the database assigns its position in the chat
+    created = db.create_message(
         chat_id=message.chat_id,
         sender_id=user['id'],
         encrypted_content=message.content,
-        message_type=message.message_type or 'text'
+        message_type=message.message_type or 'text',
+        attachment_id=message.attachment_id
     )
+    if not created:
+        # Switched to ephemeral on another worker since the mode was cached: relay instead
+        chat = ephemeral_relay.refresh_chat(message.chat_id)
+        if chat and chat['ephemeral']:
+            return await send_ephemeral_message(chat, message, user)
+        raise HTTPException(status_code=500, detail="Failed to save message")
     
     # Get other user ID
     other_user_id = chat['user2_id'] if chat['user1_id'] == user['id'] else chat['user1_id']
     
-    # Get sender info for display
-    sender_info = {
-        "id": user['id'],
-        "username": user.get('username'),
-        "email": user['email']
-    }
-    
     # Send via WebSocket to both users with complete data
     message_data = {
-        "id": message_id,
+        "id": created['id'],
         "chat_id": message.chat_id,
+        "seq": created['seq'],
         "sender_id": user['id'],
         "content": message.content,
         "message_type": message.message_type or 'text',
-        "created_at": created_at,
-        "sender": sender_info
+        "attachment_id": message.attachment_id,
+        "created_at": created['created_at']
     }
     
+    # Recipients resolve sender_id from their user directory; top it up if needed
+    await manager.ensure_profiles(other_user_id, [public_profile(user)])
+    
     # Broadcast to both users in the chat immediately
     await manager.broadcast_to_user(other_user_id, "new_message", message_data)
     await manager.broadcast_to_user(user['id'], "new_message", message_data)
     
     # Send push notification to recipient (in background)
-    try:
-        await send_new_message_notification(other_user_id)
-    except Exception as e:
-        print(f"Failed to send push notification: {e}")
+    run_in_background(send_new_message_notification(other_user_id))
     
     return {
-        "message_id": message_id, 
+        "message_id": created['id'], 
         "status": "sent",
-        "created_at": created_at,
+        "seq": created['seq'],
+        "created_at": created['created_at'],
+        "data": message_data
+    }
+
+async def send_ephemeral_message(chat: dict, message: Message, user: dict):
+    """Relay a message of an ephemeral chat without storing it"""
+    # Attachments are stored uploads, which an ephemeral chat must not leave behind
+    if message.attachment_id:
+        raise HTTPException(status_code=400, detail="Attachments are not available in ephemeral chats")
+    
+    other_user_id = chat['user2_id'] if chat['user1_id'] == user['id'] else chat['user1_id']
+    message_data = ephemeral_relay.new_message(
+        message.chat_id, user['id'], message.message_type or 'text', content=message.content
+    )
+    await manager.ensure_profiles(other_user_id, [public_profile(user)])
+    delivered = await ephemeral_relay.relay(chat, user['id'], {
+        "type": "new_message",
+        "data": message_data,
+        "timestamp": message_data['created_at']
+    })
+    if not delivered:
+        run_in_background(send_new_message_notification(other_user_id))
+    
+    return {
+        "message_id": message_data['id'],
+        "status": "sent" if delivered else "held",
+        "created_at": message_data['created_at'],
         "data": message_data
     }
 
+@router.post("/mode/{chat_id}")
+async def set_chat_mode(chat_id: int, mode: ChatMode, user: dict = Depends(verify_token)):
+    """Switch a chat between stored and ephemeral (relay-only) messages
+    
+    Either participant may switch; messages already stored are kept until cleared.
+    """
+    chat = db.get_chat(chat_id)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    
+    if chat['user1_id'] != user['id'] and chat['user2_id'] != user['id']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if not db.set_chat_ephemeral(chat_id, mode.ephemeral):
+        raise HTTPException(status_code=500, detail="Failed to update chat")
+    ephemeral_relay.forget_chat(chat_id)
+    
+    for user_id in (chat['user1_id'], chat['user2_id']):
+        await manager.broadcast_to_user(user_id, "chat_mode", {
+            "chat_id": chat_id,
+            "ephemeral": mode.ephemeral,
+            "changed_by": user['id']
+        })
+    
+    return {"chat_id": chat_id, "ephemeral": mode.ephemeral}
+
 @router.post("/verify")
 async def verify_chat(verify: VerifyChat, user: dict = Depends(verify_token)):
     """Verify chat with code to keep it alive"""
@@ -242,7 +339,10 @@ async def clear_chat_messages(chat_id: int, user: dict = Depends(verify_token)):
     if chat['user1_id'] != user['id'] and chat['user2_id'] != user['id']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db.clear_messages(chat_id)
+    attachment_ids = db.get_chat_attachment_ids(chat_id)
+    if db.clear_messages(chat_id):
+        attachment_store.delete(attachment_ids)
+    ephemeral_relay.drop_chat(chat_id)
     
     # Notify both users
     await manager.send_to_chat(
@@ -270,9 +370,13 @@ async def request_delete_chat(chat_id: int, user: dict = Depends(verify_token)):
     other_user_id = chat['user2_id'] if chat['user1_id'] == user['id'] else chat['user1_id']
     
     # Request deletion
+    attachment_ids = db.get_chat_attachment_ids(chat_id)
     both_agreed = db.request_chat_deletion(chat_id, user['id'])
     
     if both_agreed:
+        attachment_store.delete(attachment_ids)
+        ephemeral_relay.forget_chat(chat_id)
+        ephemeral_relay.drop_chat(chat_id)
         # Both users agreed, chat is deleted
         await manager.broadcast_to_user(
             user_id=chat['user1_id'],
@@ -309,74 +413,146 @@ async def request_delete_chat(chat_id: int, user: dict = Depends(verify_token)):
         )
         return {"status": "pending", "message": "Waiting for other user's consent"}
 
+@router.get("/ws/metrics")
+async def websocket_metrics(x_metrics_token: str = Header("")):
+    """Connection counts, admission rejections and accept latency of this worker"""
+    if not WS_METRICS_TOKEN or not secrets.compare_digest(x_metrics_token, WS_METRICS_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return manager.metrics()
+
+def parse_seq(value) -> Optional[int]:
+    """A client-sent sequence number, None unless it is a non-negative integer"""
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    return None
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time chat"""
+    started = time.perf_counter()
+    # A draining or full worker turns handshakes away before touching the database
+    if manager.draining:
+        await manager.reject_draining(websocket)
+        return
+    if manager.is_full():
+        await manager.reject_busy(websocket)
+        return
+    
     # Get token from query params
     token = websocket.query_params.get("token")
     if not token:
+        manager.stats.reject('unauthorized')
         await websocket.close(code=1008)
         return
     
     # Verify token
     session = db.get_token(token)
     if not session:
+        manager.stats.reject('unauthorized')
         await websocket.close(code=1008)
         return
     
     # Check token expiry
-    from datetime import datetime
-    expires_at = datetime.fromisoformat(session['expires_at'])
-    if datetime.now() > expires_at:
+    if datetime.now() > session['expires_at']:
         db.delete_token(token)
+        manager.stats.reject('unauthorized')
         await websocket.close(code=1008)
         return
     
     user = db.get_user_by_id(session['user_id'])
     if not user:
+        manager.stats.reject('unauthorized')
         await websocket.close(code=1008)
         return
     
     # Connect
-    await manager.connect(websocket, user['id'])
+    if not await manager.connect(websocket, user['id'], started=started):
+        return
     
     try:
+        await manager.send_session_info(websocket, user['id'])
+        await manager.send_user_directory(websocket, user['id'])
+        # Ephemeral messages that arrived while the user was offline
+        await ephemeral_relay.flush(user['id'])
+        
+        frames = FrameLimiter()
         while True:
             # Receive message
             data = await websocket.receive_text()
+            # Over-budget frames are dropped before they are parsed
+            if not frames.allow():
+                if frames.exhausted:
+                    await websocket.close(code=1008)
+                    manager.disconnect(websocket, user['id'])
+                    return
+                if frames.rejected == 1:
+                    await websocket.send_json({"type": "rate_limited", "data": {"retry_after": 1 / frames.limit.rate}})
+                continue
             message_data = json.loads(data)
             
-            if message_data['type'] == 'message':
+            if message_data['type'] == 'resume':
+                # Reconnecting client: replay what it missed since its last seen event
+                await manager.resume(
+                    websocket,
+                    user['id'],
+                    epoch=message_data.get('epoch'),
+                    last_seq=parse_seq(message_data.get('last_seq', 0))
+                )
+            
+            elif message_data['type'] == 'presence':
+                # App moved to foreground/background on this device
+                manager.set_presence(websocket, user['id'], message_data.get('state'))
+            
+            elif message_data['type'] == 'message':
                 # Save message
                 chat_id = message_data['chat_id']
                 encrypted_content = message_data['encrypted_content']
                 message_type = message_data.get('message_type', 'text')
                 
                 # Verify user is part of chat
-                chat = db.get_chat(chat_id)
+                chat = ephemeral_relay.get_chat(chat_id)
                 if not chat or (chat['user1_id'] != user['id'] and chat['user2_id'] != user['id']):
                     continue
                 
-                # Save to database
-                message_id = db.save_message(chat_id, user['id'], encrypted_content, message_type)
+                other_user_id = chat['user2_id'] if chat['user1_id'] == user['id'] else chat['user1_id']
+                
+                created = None
+                if not chat['ephemeral']:
+                    # Save to database; refused if the chat is ephemeral by now
+                    created = db.create_message(chat_id, user['id'], encrypted_content, message_type)
+                    if not created:
+                        # Switched on another worker since the mode was cached
+                        chat = ephemeral_relay.refresh_chat(chat_id)
+                        if not chat or not chat['ephemeral']:
+                            continue
+                
+                if chat['ephemeral']:
+                    # Relay only: nothing about this message reaches the database
+                    await manager.ensure_profiles(other_user_id, [public_profile(user)])
+                    message = ephemeral_relay.new_message(
+                        chat_id, user['id'], message_type, encrypted_content=encrypted_content
+                    )
+                    delivered = await ephemeral_relay.relay(chat, user['id'], {"type": "message", "data": message})
+                    if not delivered:
+                        run_in_background(send_new_message_notification(other_user_id))
+                    continue
+                
+                await manager.ensure_profiles(other_user_id, [public_profile(user)])
                 
                 # Broadcast to chat participants
                 await manager.send_to_chat(
                     message={
                         "type": "message",
                         "data": {
-                            "id": message_id,
+                            "id": created['id'],
                             "chat_id": chat_id,
+                            "seq": created['seq'],
                             "sender_id": user['id'],
                             "encrypted_content": encrypted_content,
                             "message_type": message_type,
-                            "sender": {
-                                "id": user['id'],
-                                "email": user['email'],
-                                "username": user['username'],
-                                "profile_picture": user['profile_picture'],
-                                "public_key": user['public_key']
-                            }
+                            "created_at": created['created_at']
                         }
                     },
                     chat_id=chat_id
@@ -0,0 +1,44 @@
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+import os
+from ..database import db
+from ..auth import verify_token
+from ..websocket_manager import manager
+from ..services.media import media_store, MediaError, MediaTooLarge, MEDIA_MAX_BYTES, MEDIA_NAME_RE, CONTENT_TYPES
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+@router.post("/avatar")
+async def upload_avatar(file: UploadFile = File(...), user: dict = Depends(verify_token)):
+    """Upload a profile picture and set it as the user's avatar"""
+    data = await file.read(MEDIA_MAX_BYTES + 1)
+    try:
+        # Decoding and resizing is CPU work, keep it off the event loop
+        stored = await run_in_threadpool(media_store.put_image, data)
+    except MediaTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MediaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    db.update_user(user['id'], profile_picture=stored['url'])
+    await manager.publish_profile(user['id'])
+    return stored
+
+@router.get("/{name}")
+async def get_media(name: str, request: Request):
+    """Serve a stored image; content-addressed, so cached forever"""
+    path = media_store.path_for(name)
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    match = MEDIA_NAME_RE.match(name)
+    etag = f'"{match.group("hash")}-{match.group("size") or "orig"}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    ext = match.group("ext")
+    return FileResponse(path, media_type=CONTENT_TYPES.get(ext, "application/octet-stream"), headers=headers)
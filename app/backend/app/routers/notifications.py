@@ -6,6 +6,7 @@ from pydantic import BaseModel
 from typing import Optional
 from ..database import db
 from ..services.push_notifications import push_service
+from ..services.presence import presence
 from .auth import get_current_user
 
 router = APIRouter(prefix='/api/notifications', tags=['notifications'])
@@ -99,7 +100,11 @@ async def send_new_message_notification(recipient_user_id: int):
     """
     Send push notification when a new message is received
     Called internally when a message is sent
+    Skipped when the recipient has the app open, since the WebSocket already delivered it
     """
+    if presence.is_active(recipient_user_id):
+        return False
+    
     try:
         # Get recipient's FCM tokens
         tokens = db.get_user_fcm_tokens(recipient_user_id)
@@ -116,6 +121,10 @@ async def send_new_message_notification(recipient_user_id: int):
             unread_count=unread_count
         )
         
+        # Drop device tokens FCM reported as unregistered
+        for token in result.get('invalid_tokens', []):
+            db.delete_fcm_token(token)
+        
         return result['success'] > 0
     
     except Exception as e:
@@ -0,0 +1,114 @@
+"""
+Single-call bootstrap for app launch
+
+GET /sync returns everything the app needs to draw its first screen (profile,
+chats with last-message previews, pending requests, unread counts and
+optionally the recent messages of each chat) from a fixed handful of queries.
+
+The response carries a sync_token. Passing it back as ?since= returns only
+what changed: new or updated chats, removed chat ids, changed profiles, and
+the pending requests if that list changed. The token is the state vector the
+client has seen (each chat's last_seq, profile versions, pending request ids),
+so it is opaque to clients but needs no server-side storage.
+"""
+from fastapi import APIRouter, Depends, Query
+from typing import Dict, List, Optional
+import base64
+import binascii
+import json
+from ..database import db, public_profile
+from ..auth import verify_token
+from ..responses import FastJSONResponse
+
+router = APIRouter(tags=["sync"])
+
+SYNC_TOKEN_VERSION = 1
+MAX_MESSAGES_PER_CHAT = 50
+
+def encode_sync_token(state: Dict) -> str:
+    raw = json.dumps({"v": SYNC_TOKEN_VERSION, **state}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_sync_token(token: Optional[str], user_id: int) -> Optional[Dict]:
+    """State vector of a previous sync, None if missing, malformed or for another user"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw)
+        if state.get("v") != SYNC_TOKEN_VERSION or state.get("u") != user_id:
+            return None
+        return {
+            "chats": {int(k): int(v) for k, v in state["c"].items()},
+            "profiles": {int(k): int(v) for k, v in state["p"].items()},
+            "requests": [int(r) for r in state["r"]]
+        }
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+@router.get("/sync")
+async def sync(
+    since: Optional[str] = None,
+    messages: int = Query(0, ge=0, le=MAX_MESSAGES_PER_CHAT),
+    chat_id: Optional[List[int]] = Query(None),
+    user: dict = Depends(verify_token)
+):
+    """Bootstrap (or catch up) the app state in one call
+
+    messages: also return up to this many recent messages per chat (only the
+    ones newer than the sync token on incremental syncs); chat_id limits that
+    window to the given chats.
+    """
+    previous = decode_sync_token(since, user['id'])
+    full = previous is None
+    if full:
+        previous = {"chats": {}, "profiles": {}, "requests": []}
+
+    chats = db.get_sync_chats(user['id'])
+    chat_ids = [chat['id'] for chat in chats]
+    changed = [chat for chat in chats if previous["chats"].get(chat['id']) != chat['last_seq']]
+    changed_ids = [chat['id'] for chat in changed]
+
+    last_messages = db.get_last_messages(changed_ids)
+    for chat in changed:
+        chat['last_message'] = last_messages.get(chat['id'])
+
+    # Profiles: the user's own and the chat partners', when new or updated
+    profiles = db.get_user_profiles([user['id']] + [chat['other_user_id'] for chat in chats])
+    profile_versions = {p['id']: p['profile_version'] for p in profiles}
+    users = [p for p in profiles if previous["profiles"].get(p['id']) != p['profile_version']]
+
+    requests = db.get_pending_requests(user['id'])
+    request_ids = [r['id'] for r in requests]
+
+    # Marking a chat read changes these without a new message, so always sent in full
+    unread_counts = db.get_unread_counts(user['id'])
+
+    window_ids = [cid for cid in changed_ids if chat_id is None or cid in chat_id]
+    recent = db.get_recent_messages(window_ids, messages)
+    recent = {
+        cid: [m for m in chat_messages if m['seq'] > previous["chats"].get(cid, 0)]
+        for cid, chat_messages in recent.items()
+    }
+
+    response = {
+        "full": full,
+        "sync_token": encode_sync_token({
+            "u": user['id'],
+            "c": {chat['id']: chat['last_seq'] for chat in chats},
+            "p": profile_versions,
+            "r": request_ids
+        }),
+        "chats": changed,
+        "removed_chat_ids": sorted(set(previous["chats"]) - set(chat_ids)),
+        "users": users,
+        "unread_counts": unread_counts,
+        "unread_count": sum(unread_counts.values())
+    }
+    if full or user['profile_version'] != previous["profiles"].get(user['id']):
+        response["profile"] = {**public_profile(user), "created_at": user['created_at']}
+    if full or request_ids != previous["requests"]:
+        response["requests"] = requests
+    if messages:
+        response["messages"] = recent
+    return FastJSONResponse(response)
@@ -0,0 +1,94 @@
+"""
+On-disk store for encrypted attachment blobs
+
+Clients encrypt attachments end-to-end before uploading; the server only ever
+sees ciphertext. Uploads are resumable: the bytes already on disk are the
+upload offset, and each append streams the request body straight to the file
+without buffering it in memory.
+"""
+import os
+import asyncio
+import secrets
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+import anyio
+import logging
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENTS_ROOT = os.getenv('ATTACHMENTS_ROOT', os.path.join(os.path.dirname(__file__), '../../attachments'))
+ATTACHMENT_MAX_BYTES = int(os.getenv('ATTACHMENT_MAX_BYTES', str(500 * 1024 * 1024)))
+
+class UploadError(Exception):
+    """Append rejected (wrong offset or more data than declared)"""
+
+class AttachmentStore:
+    def __init__(self, root: str = ATTACHMENTS_ROOT):
+        self.root = root
+        # One append at a time per upload: the lock and how many appends hold or
+        # wait on it. Dropped when the last one exits, finished upload or not
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    @staticmethod
+    def new_id() -> str:
+        return secrets.token_hex(16)
+
+    def path_for(self, attachment_id: str) -> str:
+        if not attachment_id.isalnum():
+            raise ValueError('Invalid attachment id')
+        return os.path.join(self.root, attachment_id[:2], attachment_id)
+
+    def create(self, attachment_id: str):
+        path = self.path_for(attachment_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+
+    def offset(self, attachment_id: str) -> Optional[int]:
+        """Bytes received so far, None if the blob doesn't exist"""
+        try:
+            return os.path.getsize(self.path_for(attachment_id))
+        except OSError:
+            return None
+
+    async def append(self, attachment_id: str, offset: int, size: int, chunks: AsyncIterator[bytes]) -> int:
+        """Append a streamed body at offset, returns the new offset
+
+        Bytes written before a dropped connection stay on disk, so the client
+        resumes from whatever offset() reports afterwards.
+        """
+        lock, users = self._locks.get(attachment_id, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._locks[attachment_id] = (lock, users + 1)
+        try:
+            async with lock:
+                current = self.offset(attachment_id)
+                if current is None:
+                    raise UploadError('Upload not found')
+                if offset != current:
+                    raise UploadError(f'Offset mismatch, upload is at {current}')
+
+                async with await anyio.open_file(self.path_for(attachment_id), 'ab') as f:
+                    async for chunk in chunks:
+                        if not chunk:
+                            continue
+                        if current + len(chunk) > size:
+                            raise UploadError('More data than the declared size')
+                        await f.write(chunk)
+                        current += len(chunk)
+
+                return current
+        finally:
+            lock, users = self._locks[attachment_id]
+            if users == 1:
+                del self._locks[attachment_id]
+            else:
+                self._locks[attachment_id] = (lock, users - 1)
+
+    def delete(self, attachment_ids: Iterable[str]):
+        for attachment_id in attachment_ids:
+            try:
+                os.remove(self.path_for(attachment_id))
+            except OSError as e:
+                logger.warning(f"Could not delete attachment {attachment_id}: {e}")
+
+# Global instance
+attachment_store = AttachmentStore()
@@ -0,0 +1,91 @@
+"""
+Graceful drain on SIGTERM: WebSocket clients are told to reconnect after their
+own random delay, so a restart doesn't bring them all back at the same instant,
+and background jobs get a deadline to finish before the server exits
+"""
+import asyncio
+import os
+import signal
+import threading
+import time
+from typing import Optional, Set
+
+from ..websocket_manager import manager, WS_DRAIN_SPREAD_SECONDS
+
+# From SIGTERM until the server is told to exit. Keep it below the platform's
+# kill timeout (Heroku: 30 s) with room for the server's own shutdown
+DRAIN_SECONDS = float(os.getenv('DRAIN_SECONDS', '20'))
+
+# Fire-and-forget jobs (push notifications) that a drain waits for
+background_tasks: Set[asyncio.Task] = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Run a job without waiting for it; a drain gives it time to finish"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_job_done)
+    return task
+
+def _job_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background job failed: {task.exception()}")
+
+async def wait_for_background_jobs(timeout: float) -> int:
+    """Wait up to timeout seconds for running jobs; returns how many are still unfinished"""
+    if background_tasks and timeout > 0:
+        await asyncio.wait(set(background_tasks), timeout=timeout)
+    return len(background_tasks)
+
+class GracefulDrain:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self._previous = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def install(self):
+        """Intercept SIGTERM; the server's own handler runs once the drain is over"""
+        if threading.current_thread() is not threading.main_thread():
+            return  # Signal handlers can only be set from the main thread (e.g. not under TestClient)
+        self._loop = asyncio.get_running_loop()
+        self._previous = signal.signal(signal.SIGTERM, self._handle_sigterm)
+
+    def _handle_sigterm(self, signum, frame):
+        if self.task is not None:
+            # Second SIGTERM: stop draining and exit now
+            self._exit(signum, frame)
+            return
+        self._loop.call_soon_threadsafe(self._start, signum)
+
+    def _start(self, signum):
+        self.task = asyncio.create_task(self.run(signum))
+
+    async def run(self, signum: int = signal.SIGTERM):
+        started = time.monotonic()
+        deadline = started + DRAIN_SECONDS
+        print(f"Draining: {manager.connection_count} WebSocket connections, {len(background_tasks)} background jobs")
+        try:
+            await manager.drain()
+            # Clients leave on their own within the spread; then close whoever is
+            # left (clients that don't know the reconnect frame)
+            until = min(deadline, started + WS_DRAIN_SPREAD_SECONDS + 1)
+            while manager.connection_count and time.monotonic() < until:
+                await asyncio.sleep(0.1)
+            await manager.close_all()
+            # Pushes for the last messages received
+            unfinished = await wait_for_background_jobs(deadline - time.monotonic())
+            print(f"Drained in {time.monotonic() - started:.1f}s, {unfinished} background jobs unfinished")
+        except Exception as e:
+            print(f"Error while draining: {e}")
+        finally:
+            self._exit(signum, None)
+
+    def _exit(self, signum, frame):
+        """Hand the signal to the handler that was there before (uvicorn's shutdown)"""
+        if callable(self._previous):
+            self._previous(signum, frame)
+        else:
+            signal.signal(signum, self._previous or signal.SIG_DFL)
+            signal.raise_signal(signum)
+
+graceful_drain = GracefulDrain()
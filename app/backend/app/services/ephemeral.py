@@ -0,0 +1,153 @@
+"""
+Relay for ephemeral chats: messages go from sender to recipient through the
+WebSocket manager and are never written to the database
+"""
+import os
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from ..database import db
+from ..websocket_manager import manager
+
+# How long a message for an offline recipient is held before it is dropped
+EPHEMERAL_TTL_SECONDS = int(os.getenv('EPHEMERAL_TTL_SECONDS', '3600'))
+# Held messages per recipient (oldest dropped first) and in total
+EPHEMERAL_MAX_PENDING_PER_USER = int(os.getenv('EPHEMERAL_MAX_PENDING_PER_USER', '200'))
+EPHEMERAL_MAX_PENDING_BYTES = int(os.getenv('EPHEMERAL_MAX_PENDING_BYTES', str(64 * 1024 * 1024)))
+# Chats whose participants and mode are kept in memory
+CHAT_CACHE_SIZE = int(os.getenv('EPHEMERAL_CHAT_CACHE_SIZE', '10000'))
+# How long a cached mode is trusted. A switch made on another worker can go unseen
+# here for this long; in that window a chat switched back to stored still has its
+# messages relayed. The other direction can't happen: the database refuses to
+# store messages of an ephemeral chat
+CHAT_CACHE_TTL_SECONDS = float(os.getenv('EPHEMERAL_CHAT_CACHE_TTL_SECONDS', '5'))
+
+class EphemeralRelay:
+    """
+    Store-and-forward buffer for ephemeral messages plus a cache of chat modes.
+
+    A message is pushed to every connected device of both participants. If the
+    recipient has no connection it is held here until they connect, it expires,
+    or it is pushed out by the per-user or total limits. Like presence, the
+    buffer is local to this worker and is lost on restart, by design.
+    """
+
+    def __init__(self):
+        # chat_id -> (loaded_at, {'id', 'user1_id', 'user2_id', 'ephemeral'}), least recently used first
+        self.chats: "OrderedDict[int, tuple]" = OrderedDict()
+        # entry id -> (expires_at, user_id, size, message), oldest first
+        self.pending: "OrderedDict[int, tuple]" = OrderedDict()
+        # user_id -> entry ids held for that user, oldest first
+        self.pending_by_user: Dict[int, "OrderedDict[int, None]"] = {}
+        self.pending_bytes = 0
+        self._next_entry = 0
+
+    def get_chat(self, chat_id: int) -> Optional[Dict]:
+        """Participants and mode of a chat, from memory for up to CHAT_CACHE_TTL_SECONDS"""
+        now = time.monotonic()
+        cached = self.chats.get(chat_id)
+        if cached is not None and now - cached[0] < CHAT_CACHE_TTL_SECONDS:
+            self.chats.move_to_end(chat_id)
+            return cached[1]
+        row = db.get_chat(chat_id)
+        if not row:
+            self.chats.pop(chat_id, None)
+            return None
+        chat = {key: row[key] for key in ('id', 'user1_id', 'user2_id', 'ephemeral')}
+        self.chats[chat_id] = (now, chat)
+        self.chats.move_to_end(chat_id)
+        if len(self.chats) > CHAT_CACHE_SIZE:
+            self.chats.popitem(last=False)
+        return chat
+
+    def forget_chat(self, chat_id: int):
+        """Drop the cached mode of a chat after it changed or was deleted"""
+        self.chats.pop(chat_id, None)
+
+    def refresh_chat(self, chat_id: int) -> Optional[Dict]:
+        """Reload a chat whose cached mode turned out to be stale"""
+        self.forget_chat(chat_id)
+        return self.get_chat(chat_id)
+
+    @staticmethod
+    def new_message(chat_id: int, sender_id: int, message_type: str, **content) -> Dict:
+        """Message payload; ids are strings so they can't collide with stored ids, and there is no seq"""
+        return {
+            'id': f"e{secrets.token_hex(8)}",
+            'chat_id': chat_id,
+            'sender_id': sender_id,
+            **content,
+            'message_type': message_type,
+            'ephemeral': True,
+            'created_at': datetime.utcnow().isoformat()
+        }
+
+    async def relay(self, chat: Dict, sender_id: int, message: Dict) -> bool:
+        """Deliver to both participants; returns False if the recipient was offline and it was held
+        
+        Bypasses the event log, so the message is not kept for resume replays.
+        """
+        delivered = True
+        for user_id in (chat['user1_id'], chat['user2_id']):
+            if manager.active_connections.get(user_id):
+                await manager.send_unlogged(message, user_id)
+            elif user_id != sender_id:
+                self.hold(user_id, message)
+                delivered = False
+        return delivered
+
+    def hold(self, user_id: int, message: Dict):
+        now = time.monotonic()
+        self._expire(now)
+        data = message['data']
+        size = len(data.get('content') or data.get('encrypted_content') or '') + 256
+        self._next_entry += 1
+        entry_id = self._next_entry
+        self.pending[entry_id] = (now + EPHEMERAL_TTL_SECONDS, user_id, size, message)
+        self.pending_by_user.setdefault(user_id, OrderedDict())[entry_id] = None
+        self.pending_bytes += size
+
+        user_entries = self.pending_by_user[user_id]
+        while len(user_entries) > EPHEMERAL_MAX_PENDING_PER_USER:
+            self._drop(next(iter(user_entries)))
+        while self.pending_bytes > EPHEMERAL_MAX_PENDING_BYTES and self.pending:
+            self._drop(next(iter(self.pending)))
+
+    def _drop(self, entry_id: int) -> Optional[Dict]:
+        _, user_id, size, message = self.pending.pop(entry_id)
+        self.pending_bytes -= size
+        user_entries = self.pending_by_user[user_id]
+        del user_entries[entry_id]
+        if not user_entries:
+            del self.pending_by_user[user_id]
+        return message
+
+    def _expire(self, now: float):
+        # Every entry lives equally long, so insertion order is expiry order
+        while self.pending:
+            entry_id, (expires_at, *_) = next(iter(self.pending.items()))
+            if expires_at > now:
+                break
+            self._drop(entry_id)
+
+    def take_pending(self, user_id: int) -> List[Dict]:
+        """Remove and return the messages held for a user, oldest first"""
+        self._expire(time.monotonic())
+        entry_ids = list(self.pending_by_user.get(user_id, ()))
+        return [self._drop(entry_id) for entry_id in entry_ids]
+
+    async def flush(self, user_id: int):
+        """Deliver held messages to a user who just connected"""
+        for message in self.take_pending(user_id):
+            await manager.send_unlogged(message, user_id)
+
+    def drop_chat(self, chat_id: int):
+        """Discard held messages of a chat that was cleared or deleted"""
+        for entry_id, (_, _, _, message) in list(self.pending.items()):
+            if message['data'].get('chat_id') == chat_id:
+                self._drop(entry_id)
+
+ephemeral_relay = EphemeralRelay()
@@ -0,0 +1,254 @@
+"""
+Push Notifications Service talking directly to the FCM HTTP v1 API
+"""
+import os
+import json
+import time
+import asyncio
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+FCM_API_URL = os.getenv('FCM_API_URL', 'https://fcm.googleapis.com').rstrip('/')
+FCM_PROJECT_ID = os.getenv('FCM_PROJECT_ID')
+# Static bearer token, for the local fake FCM server (skips the OAuth flow)
+FCM_ACCESS_TOKEN = os.getenv('FCM_ACCESS_TOKEN')
+# In-flight requests; HTTP/2 multiplexes them over a few pooled connections
+FCM_MAX_CONCURRENCY = int(os.getenv('FCM_MAX_CONCURRENCY', '100'))
+FCM_MAX_CONNECTIONS = int(os.getenv('FCM_MAX_CONNECTIONS', '10'))
+FCM_TIMEOUT_SECONDS = float(os.getenv('FCM_TIMEOUT_SECONDS', '10'))
+
+FCM_SCOPE = 'https://www.googleapis.com/auth/firebase.messaging'
+# Refresh OAuth tokens this long before they actually expire
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+# FCM error codes meaning the device token will never work again
+INVALID_TOKEN_ERRORS = {'UNREGISTERED', 'SENDER_ID_MISMATCH'}
+
+class AccessTokenProvider:
+    """Caches the OAuth access token of the Firebase service account"""
+
+    def __init__(self, credentials_path: Optional[str], static_token: Optional[str] = None):
+        self.credentials_path = credentials_path
+        self.static_token = static_token
+        self._credentials = None
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def project_id(self) -> Optional[str]:
+        """Project id from the service account file, if there is one"""
+        if not self.credentials_path or not os.path.exists(self.credentials_path):
+            return None
+        with open(self.credentials_path) as f:
+            return json.load(f).get('project_id')
+
+    async def get_token(self, force_refresh: bool = False) -> str:
+        if self.static_token:
+            return self.static_token
+
+        if not force_refresh and self._token and time.time() < self._expires_at:
+            return self._token
+
+        async with self._lock:
+            # Another request may have refreshed it while we waited
+            if not force_refresh and self._token and time.time() < self._expires_at:
+                return self._token
+            # google-auth refresh is blocking, keep it off the event loop
+            self._token, expiry = await asyncio.to_thread(self._refresh)
+            self._expires_at = expiry - TOKEN_REFRESH_MARGIN_SECONDS
+            return self._token
+
+    def _refresh(self) -> tuple:
+        from google.oauth2 import service_account
+        from google.auth.transport.requests import Request
+
+        if self._credentials is None:
+            self._credentials = service_account.Credentials.from_service_account_file(
+                self.credentials_path, scopes=[FCM_SCOPE]
+            )
+        self._credentials.refresh(Request())
+        expiry = self._credentials.expiry.timestamp() if self._credentials.expiry else time.time() + 3600
+        return self._credentials.token, expiry
+
+class FCMHttpPushService:
+    """
+    Async push backend using the FCM HTTP v1 API over a pooled HTTP/2 client.
+    Same interface as PushNotificationService, selected with PUSH_BACKEND=fcm_http.
+    """
+
+    def __init__(
+        self,
+        credentials_path: Optional[str] = None,
+        project_id: Optional[str] = FCM_PROJECT_ID,
+        api_url: str = FCM_API_URL,
+        access_token: Optional[str] = FCM_ACCESS_TOKEN,
+        max_concurrency: int = FCM_MAX_CONCURRENCY,
+        max_connections: int = FCM_MAX_CONNECTIONS
+    ):
+        credentials_path = credentials_path or os.getenv('FIREBASE_CREDENTIALS_PATH')
+        self.tokens = AccessTokenProvider(credentials_path, static_token=access_token)
+        self.project_id = project_id or self.tokens.project_id()
+        self.api_url = api_url
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.initialized = bool(self.project_id) and bool(
+            access_token or (credentials_path and os.path.exists(credentials_path))
+        )
+        self._client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        if not self.initialized:
+            logger.warning("FCM project or credentials not found. Push notifications disabled.")
+
+    @property
+    def send_url(self) -> str:
+        return f"{self.api_url}/v1/projects/{self.project_id}/messages:send"
+
+    def _get_client(self):
+        """Create the shared HTTP client on first use (needs a running event loop)"""
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                http2=True,
+                timeout=FCM_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def build_message(token: str, unread_count: int, data: Optional[dict] = None) -> dict:
+        """FCM v1 message body, equivalent to the one built with firebase_admin"""
+        return {
+            'message': {
+                'token': token,
+                'notification': {
+                    'title': 'New Messages',
+                    'body': f'You have {unread_count} unread message{"s" if unread_count > 1 else ""}',
+                },
+                # FCM only accepts string values in data
+                'data': {str(k): str(v) for k, v in (data or {}).items()},
+                'android': {
+                    'priority': 'high',
+                    'notification': {
+                        'sound': 'default',
+                        'notification_count': unread_count,
+                        'channel_id': 'messages',
+                    }
+                },
+                'apns': {
+                    'payload': {
+                        'aps': {
+                            'badge': unread_count,
+                            'sound': 'default',
+                            'content-available': 1,
+                        }
+                    }
+                }
+            }
+        }
+
+    @staticmethod
+    def _error_code(response) -> Optional[str]:
+        """Extract the FCM error code (e.g. UNREGISTERED) from an error response"""
+        try:
+            error = response.json().get('error', {})
+        except ValueError:
+            return None
+        for detail in error.get('details', []):
+            if 'errorCode' in detail:
+                return detail['errorCode']
+        return error.get('status')
+
+    async def _send(self, token: str, unread_count: int, data: Optional[dict]) -> str:
+        """Send one message; returns 'success', 'invalid' or 'failure'"""
+        client = self._get_client()
+        body = self.build_message(token, unread_count, data)
+
+        async with self._semaphore:
+            for attempt in range(2):
+                access_token = await self.tokens.get_token(force_refresh=attempt > 0)
+                response = await client.post(
+                    self.send_url,
+                    json=body,
+                    headers={'Authorization': f'Bearer {access_token}'}
+                )
+                if response.status_code == 200:
+                    return 'success'
+                # Expired or revoked access token: refresh once and retry
+                if response.status_code == 401 and attempt == 0:
+                    continue
+                break
+
+        # Only FCM's own verdict on the device token counts: a bare 404 is as
+        # likely a wrong FCM_PROJECT_ID or URL, and would wipe every token
+        error_code = self._error_code(response)
+        if error_code in INVALID_TOKEN_ERRORS:
+            return 'invalid'
+        logger.error(f"FCM send failed ({response.status_code}): {error_code}")
+        return 'failure'
+
+    async def send_notification(
+        self,
+        token: str,
+        unread_count: int,
+        data: Optional[dict] = None
+    ) -> bool:
+        """
+        Send push notification to a device
+
+        Returns:
+            True if notification sent successfully, False otherwise
+        """
+        if not self.initialized:
+            logger.warning("FCM not configured. Cannot send notification.")
+            return False
+
+        try:
+            return await self._send(token, unread_count, data) == 'success'
+        except Exception as e:
+            logger.error(f"Failed to send notification: {e}")
+            return False
+
+    async def send_batch_notifications(
+        self,
+        tokens: List[str],
+        unread_count: int,
+        data: Optional[dict] = None
+    ) -> dict:
+        """
+        Send notifications to multiple devices concurrently
+
+        Returns:
+            Dictionary with success and failure counts, and the tokens FCM
+            reported as no longer valid
+        """
+        if not self.initialized:
+            logger.warning("FCM not configured. Cannot send notifications.")
+            return {"success": 0, "failure": len(tokens), "invalid_tokens": []}
+
+        results = await asyncio.gather(
+            *(self._send(token, unread_count, data) for token in tokens),
+            return_exceptions=True
+        )
+
+        success = sum(1 for r in results if r == 'success')
+        invalid_tokens = [token for token, r in zip(tokens, results) if r == 'invalid']
+        for r in results:
+            if isinstance(r, Exception):
+                logger.error(f"Failed to send notification: {r}")
+
+        return {
+            "success": success,
+            "failure": len(tokens) - success,
+            "invalid_tokens": invalid_tokens
+        }
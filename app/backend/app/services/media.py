@@ -0,0 +1,176 @@
+"""
+Content-addressed media store for avatars
+
+Images are stored once on local disk under their sha256 and referenced by URL
+(/media/<hash>.<ext>), so user payloads carry a short reference instead of an
+inline data URL. Fixed-size thumbnails are generated at upload time.
+
+Convert profile pictures stored inline before this existed:
+    python -m app.services.media --convert-profile-pictures
+"""
+import os
+import io
+import re
+import sys
+import base64
+import hashlib
+import binascii
+from typing import Dict, Optional
+import logging
+
+try:
+    from PIL import Image
+except ImportError:  # optional, without Pillow only originals are stored
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(os.path.dirname(__file__), '../../media'))
+# Prefix for media URLs, e.g. https://api.example.com for mobile clients; relative by default
+MEDIA_BASE_URL = os.getenv('MEDIA_BASE_URL', '').rstrip('/')
+MEDIA_MAX_BYTES = int(os.getenv('MEDIA_MAX_BYTES', str(5 * 1024 * 1024)))
+# Decoded size cap: a small compressed file can decode to hundreds of MB
+# (25 megapixels is about 100 MB as RGBA)
+MEDIA_MAX_PIXELS = int(os.getenv('MEDIA_MAX_PIXELS', str(25_000_000)))
+
+THUMBNAIL_SIZES = (64, 256)
+THUMBNAIL_FORMAT = 'webp'
+
+# Pillow format -> file extension
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp', 'gif': 'image/gif'}
+
+# <hash>.<ext> for originals, <hash>_<size>.webp for thumbnails
+MEDIA_NAME_RE = re.compile(r'^(?P<hash>[0-9a-f]{64})(?:_(?P<size>\d+))?\.(?P<ext>[a-z]+)$')
+DATA_URL_RE = re.compile(r'^data:image/[a-z0-9.+-]+;base64,(?P<data>.+)$', re.IGNORECASE | re.DOTALL)
+
+class MediaError(Exception):
+    """Invalid or unsupported upload"""
+
+class MediaTooLarge(MediaError):
+    """Upload over the byte or pixel limit"""
+
+def _detect_extension(data: bytes) -> str:
+    """Image type from the magic bytes (used when Pillow isn't installed)"""
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    raise MediaError('Unsupported image format')
+
+class MediaStore:
+    def __init__(self, root: str = MEDIA_ROOT):
+        self.root = root
+
+    def path_for(self, name: str) -> Optional[str]:
+        """Disk path of a stored file, None if the name isn't a valid media name"""
+        match = MEDIA_NAME_RE.match(name)
+        if not match:
+            return None
+        return os.path.join(self.root, match.group('hash')[:2], name)
+
+    def url_for(self, name: str) -> str:
+        return f'{MEDIA_BASE_URL}/media/{name}'
+
+    def _write(self, name: str, data: bytes):
+        """Write a file atomically; content-addressed files never change once written"""
+        path = self.path_for(name)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put_image(self, data: bytes) -> Dict:
+        """Store an image and its thumbnails, returns the references (blocking, CPU heavy)"""
+        if not data:
+            raise MediaError('Empty image')
+        if len(data) > MEDIA_MAX_BYTES:
+            raise MediaTooLarge(f'Image larger than {MEDIA_MAX_BYTES} bytes')
+
+        digest = hashlib.sha256(data).hexdigest()
+        thumbnails = {}
+
+        if Image is None:
+            ext = _detect_extension(data)
+        else:
+            try:
+                image = Image.open(io.BytesIO(data))
+            except Image.DecompressionBombError:
+                raise MediaTooLarge(f'Image larger than {MEDIA_MAX_PIXELS} pixels')
+            except Exception:
+                raise MediaError('Invalid image')
+            # open() only parsed the header: refuse bombs before decoding anything
+            width, height = image.size
+            if width * height > MEDIA_MAX_PIXELS:
+                raise MediaTooLarge(f'Image larger than {MEDIA_MAX_PIXELS} pixels')
+            try:
+                image.load()
+            except Exception:
+                raise MediaError('Invalid image')
+            ext = IMAGE_FORMATS.get(image.format)
+            if ext is None:
+                raise MediaError('Unsupported image format')
+
+            for size in THUMBNAIL_SIZES:
+                name = f'{digest}_{size}.{THUMBNAIL_FORMAT}'
+                if not os.path.exists(self.path_for(name)):
+                    thumb = image.convert('RGBA') if image.mode not in ('RGB', 'RGBA') else image.copy()
+                    thumb.thumbnail((size, size))
+                    buffer = io.BytesIO()
+                    thumb.save(buffer, format=THUMBNAIL_FORMAT.upper(), quality=85)
+                    self._write(name, buffer.getvalue())
+                thumbnails[size] = self.url_for(name)
+
+        name = f'{digest}.{ext}'
+        self._write(name, data)
+        return {
+            'hash': digest,
+            'url': self.url_for(name),
+            'thumbnails': thumbnails
+        }
+
+    def profile_picture_ref(self, value: Optional[str]) -> Optional[str]:
+        """Replace an inline data URL with a media reference; other values pass through"""
+        if not value:
+            return value
+        match = DATA_URL_RE.match(value)
+        if not match:
+            return value
+        try:
+            data = base64.b64decode(match.group('data'), validate=False)
+        except (binascii.Error, ValueError):
+            raise MediaError('Invalid data URL')
+        return self.put_image(data)['url']
+
+# Global instance
+media_store = MediaStore()
+
+def convert_inline_profile_pictures() -> int:
+    """Move profile pictures stored as data URLs into the media store"""
+    from ..database import db, User
+
+    converted = 0
+    session = db.get_session()
+    try:
+        users = session.query(User).filter(User.profile_picture.like('data:%')).all()
+        for user in users:
+            try:
+                user.profile_picture = media_store.profile_picture_ref(user.profile_picture)
+                converted += 1
+            except MediaError as e:
+                logger.warning(f"Skipping profile picture of user {user.id}: {e}")
+        session.commit()
+        return converted
+    finally:
+        session.close()
+
+if __name__ == '__main__':
+    if '--convert-profile-pictures' in sys.argv:
+        print(f"Converted {convert_inline_profile_pictures()} profile pictures")
@@ -0,0 +1,54 @@
+"""
+Presence tracking for connected devices
+"""
+from typing import Dict
+
+FOREGROUND = 'foreground'
+BACKGROUND = 'background'
+
+class PresenceService:
+    """
+    Tracks which devices of each user have a live WebSocket and whether
+    the app is in the foreground on them.
+
+    State is local to this worker; there is no cross-worker backplane, so a
+    user connected to another worker is seen as offline and still gets pushes.
+    """
+
+    def __init__(self):
+        # user_id -> device_id -> state
+        self.devices: Dict[int, Dict[str, str]] = {}
+
+    def device_connected(self, user_id: int, device_id: str, state: str = FOREGROUND):
+        """Register a connected device (apps connect while in the foreground)"""
+        self.devices.setdefault(user_id, {})[device_id] = state
+
+    def device_disconnected(self, user_id: int, device_id: str):
+        """Forget a device whose socket went away"""
+        user_devices = self.devices.get(user_id)
+        if user_devices is None:
+            return
+        user_devices.pop(device_id, None)
+        if not user_devices:
+            del self.devices[user_id]
+
+    def set_state(self, user_id: int, device_id: str, state: str) -> bool:
+        """Update the foreground/background state reported by a connected device"""
+        if state not in (FOREGROUND, BACKGROUND):
+            return False
+        user_devices = self.devices.get(user_id)
+        if user_devices is None or device_id not in user_devices:
+            return False
+        user_devices[device_id] = state
+        return True
+
+    def is_online(self, user_id: int) -> bool:
+        """True if the user has at least one connected device"""
+        return bool(self.devices.get(user_id))
+
+    def is_active(self, user_id: int) -> bool:
+        """True if the user has the app open in the foreground on some device"""
+        return FOREGROUND in self.devices.get(user_id, {}).values()
+
+# Global instance
+presence = PresenceService()
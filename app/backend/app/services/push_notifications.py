@@ -3,23 +3,30 @@ Push Notifications Service using Firebase Cloud Messaging
 """
 import os
 from typing import List, Optional
-from firebase_admin import credentials, messaging, initialize_app
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 'firebase' (firebase_admin SDK) or 'fcm_http' (async FCM HTTP v1 client)
+PUSH_BACKEND = os.getenv('PUSH_BACKEND', 'firebase')
+
 class PushNotificationService:
     def __init__(self):
+        # Firebase is initialized on first use, not at import time
         self.initialized = False
-        self._initialize_firebase()
+        self._init_attempted = False
     
     def _initialize_firebase(self):
-        """Initialize Firebase Admin SDK"""
+        """Initialize Firebase Admin SDK (once)"""
+        if self._init_attempted:
+            return
+        self._init_attempted = True
         try:
             # Check if Firebase credentials are available
             firebase_cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
             
             if firebase_cred_path and os.path.exists(firebase_cred_path):
+                from firebase_admin import credentials, initialize_app
                 cred = credentials.Certificate(firebase_cred_path)
                 initialize_app(cred)
                 self.initialized = True
@@ -30,6 +37,10 @@ class PushNotificationService:
             logger.error(f"Failed to initialize Firebase: {e}")
             self.initialized = False
     
+    async def close(self):
+        """Nothing to release, the SDK manages its own HTTP session"""
+        pass
+    
     async def send_notification(
         self,
         token: str,
@@ -47,11 +58,14 @@ class PushNotificationService:
         Returns:
             True if notification sent successfully, False otherwise
         """
+        self._initialize_firebase()
         if not self.initialized:
             logger.warning("Firebase not initialized. Cannot send notification.")
             return False
         
         try:
+            from firebase_admin import messaging
+            
             # Create notification message
             message = messaging.Message(
                 notification=messaging.Notification(
@@ -105,11 +119,14 @@ class PushNotificationService:
         Returns:
             Dictionary with success and failure counts
         """
+        self._initialize_firebase()
         if not self.initialized:
             logger.warning("Firebase not initialized. Cannot send notifications.")
             return {"success": 0, "failure": len(tokens)}
         
         try:
+            from firebase_admin import messaging
+            
             # Create multicast message
             message = messaging.MulticastMessage(
                 notification=messaging.Notification(
@@ -150,5 +167,12 @@ class PushNotificationService:
             logger.error(f"Failed to send batch notifications: {e}")
             return {"success": 0, "failure": len(tokens)}
 
+def create_push_service():
+    """Build the push backend selected by PUSH_BACKEND"""
+    if PUSH_BACKEND == 'fcm_http':
+        from .fcm_http import FCMHttpPushService
+        return FCMHttpPushService()
+    return PushNotificationService()
+
 # Global instance
-push_service = PushNotificationService()
+push_service = create_push_service()
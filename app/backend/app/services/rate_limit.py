@@ -0,0 +1,245 @@
+"""
+Token-bucket rate limiting for HTTP requests, WebSocket handshakes and
+inbound WebSocket frames
+
+Limits are checked in an ASGI middleware before routing, so a rejected request
+never reaches a dependency. Buckets are per client IP or per user; the user of
+a bearer token is looked up once per worker and then kept in memory. Files of
+the frontend build are exempt: a page load fetches dozens of them.
+"""
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from ..database import db
+from ..responses import FastJSONResponse
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+# redis://... shares buckets between workers and hosts; in memory otherwise,
+# in which case every worker enforces the budget on its own
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', '')
+# Buckets kept by the in-memory store (least recently used are dropped)
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+# Proxies in front of the app that append the address they saw to X-Forwarded-For
+# (Heroku's router: 1, set in the Procfile). The client is the address the outermost
+# of them appended; earlier entries are whatever the client sent. 0 uses the socket peer
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+# Every HTTP request and WebSocket handshake, per IP
+RATE_LIMIT_DEFAULT = os.getenv('RATE_LIMIT_DEFAULT', '600/minute')
+# Inbound frames per WebSocket connection
+WS_FRAME_LIMIT = os.getenv('WS_FRAME_LIMIT', '20/second')
+# Consecutive rejected frames after which the connection is closed
+WS_MAX_REJECTED_FRAMES = int(os.getenv('WS_MAX_REJECTED_FRAMES', '50'))
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+class Limit(NamedTuple):
+    rate: float  # tokens added per second
+    burst: int   # bucket size
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Limit':
+        """'10/minute' -> 10 requests at once, refilled at 10 per minute"""
+        count, _, period = spec.strip().partition('/')
+        return cls(rate=int(count) / PERIODS[period.strip().rstrip('s')], burst=int(count))
+
+# (method, path) -> (limit, key); key is 'ip' or 'user' (the bearer token's user, else the IP).
+# Override with RATE_LIMIT_ROUTES="POST /auth/login=20/minute;POST /chat/send=5/second"
+ROUTE_LIMITS: Dict[Tuple[str, str], Tuple[str, str]] = {
+    ('POST', '/auth/login'): ('10/minute', 'ip'),
+    ('POST', '/auth/register'): ('5/minute', 'ip'),
+    ('POST', '/chat/search-users'): ('30/minute', 'user'),
+    ('POST', '/chat/request'): ('20/minute', 'user'),
+    ('POST', '/chat/send'): ('10/second', 'user'),
+    ('WS', '/chat/ws'): ('30/minute', 'ip'),
+}
+
+def _route_limits() -> Dict[Tuple[str, str], Tuple[Limit, str]]:
+    routes = dict(ROUTE_LIMITS)
+    for item in filter(None, os.getenv('RATE_LIMIT_ROUTES', '').split(';')):
+        route, _, spec = item.partition('=')
+        method, _, path = route.strip().partition(' ')
+        key = routes.get((method.upper(), path), (None, 'ip'))[1]
+        routes[(method.upper(), path)] = (spec, key)
+    return {route: (Limit.parse(spec), key) for route, (spec, key) in routes.items()}
+
+class MemoryBucketStore:
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> (tokens, last refill), least recently used first
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take_now(self, key: str, limit: Limit) -> float:
+        """Take one token; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / limit.rate
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+    async def take(self, key: str, limit: Limit) -> float:
+        return self.take_now(key, limit)
+
+class RedisBucketStore:
+    """Buckets shared by every worker; the refill and take run atomically in Redis"""
+
+    SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 't', 'u')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'u', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+    def __init__(self, url: str):
+        from redis import asyncio as aioredis  # optional, only needed for a shared store
+        self.redis = aioredis.from_url(url)
+        self.script = self.redis.register_script(self.SCRIPT)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        try:
+            return float(await self.script(keys=[f"ratelimit:{key}"], args=[limit.rate, limit.burst]))
+        except Exception as e:
+            # Fail open: an unavailable limiter must not take the API down
+            print(f"Rate limit store error: {e}")
+            return 0.0
+
+class TokenUsers:
+    """Bearer token -> user id, so per-user budgets follow the account rather than each token"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # token digest -> user id, least recently used first
+        self.users: "OrderedDict[str, int]" = OrderedDict()
+
+    async def get(self, token: bytes) -> Optional[int]:
+        digest = hashlib.blake2b(token, digest_size=12).hexdigest()
+        user_id = self.users.get(digest)
+        if user_id is not None:
+            self.users.move_to_end(digest)
+            return user_id
+        # Unknown tokens are not cached: made-up ones would push real users out.
+        # Expiry and logout are still checked by verify_token
+        session = await run_in_threadpool(db.get_token, token.decode('latin-1'))
+        if session is None:
+            return None
+        self.users[digest] = session['user_id']
+        if len(self.users) > self.max_keys:
+            self.users.popitem(last=False)
+        return session['user_id']
+
+class FrameLimiter:
+    """Budget for the frames received on one WebSocket connection"""
+
+    def __init__(self, limit: Optional[Limit] = None):
+        self.limit = limit or Limit.parse(WS_FRAME_LIMIT)
+        self.tokens = float(self.limit.burst)
+        self.updated = time.monotonic()
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.limit.burst, self.tokens + (now - self.updated) * self.limit.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.rejected = 0
+            return True
+        self.rejected += 1
+        return False
+
+    @property
+    def exhausted(self) -> bool:
+        """The client kept sending while rejected; the connection should be closed"""
+        return self.rejected > WS_MAX_REJECTED_FRAMES
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUSTED_PROXIES:
+        hops = [
+            hop.strip()
+            for name, value in scope.get('headers', ()) if name == b'x-forwarded-for'
+            for hop in value.decode('latin-1').split(',')
+        ]
+        if hops:
+            return hops[max(0, len(hops) - RATE_LIMIT_TRUSTED_PROXIES)]
+    client = scope.get('client')
+    return client[0] if client else 'unknown'
+
+def bearer_token(scope) -> Optional[bytes]:
+    """The caller's token, from the Authorization header or the WebSocket `token` query parameter"""
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization' and value.startswith(b'Bearer '):
+            return value[7:]
+    if scope['type'] == 'websocket':
+        query = scope.get('query_string', b'')
+        for pair in query.split(b'&'):
+            name, _, value = pair.partition(b'=')
+            if name == b'token' and value:
+                return value
+    return None
+
+class RateLimitMiddleware:
+    """Rejects over-budget requests with 429 (handshakes with close 1008) before routing"""
+
+    def __init__(self, app, exempt: Optional[Callable[[str], bool]] = None):
+        self.app = app
+        # GET/HEAD paths that are never limited (the frontend's static files)
+        self.exempt = exempt
+        self.store = RedisBucketStore(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryBucketStore()
+        self.default = Limit.parse(RATE_LIMIT_DEFAULT)
+        self.routes = _route_limits()
+        self.token_users = TokenUsers()
+
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT_ENABLED or scope['type'] not in ('http', 'websocket'):
+            return await self.app(scope, receive, send)
+
+        method = 'WS' if scope['type'] == 'websocket' else scope['method']
+        if method in ('GET', 'HEAD') and self.exempt is not None and self.exempt(scope['path']):
+            return await self.app(scope, receive, send)
+        ip = client_ip(scope)
+        # The per-IP budget is charged first, so it also caps the token lookups
+        # a client can cause with made-up tokens
+        wait = await self.store.take(f"ip:{ip}", self.default)
+        route = self.routes.get((method, scope['path']))
+        if not wait and route is not None:
+            limit, key = route
+            identity = f"ip:{ip}"
+            token = bearer_token(scope) if key == 'user' else None
+            if token:
+                user_id = await self.token_users.get(token)
+                if user_id is not None:
+                    identity = f"user:{user_id}"
+            wait = await self.store.take(f"{method}:{scope['path']}:{identity}", limit)
+        if not wait:
+            return await self.app(scope, receive, send)
+
+        if scope['type'] == 'websocket':
+            await receive()  # websocket.connect
+            await send({'type': 'websocket.close', 'code': 1008})
+            return
+        response = FastJSONResponse(
+            {'detail': 'Too many requests'},
+            status_code=429,
+            headers={'Retry-After': str(math.ceil(wait))}
+        )
+        await response(scope, receive, send)
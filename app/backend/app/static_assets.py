@@ -0,0 +1,160 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+from typing import Dict, Optional
+from fastapi import Request
+from fastapi.responses import Response, FileResponse
+
+try:
+    import brotli
+except ImportError:  # optional, .br files on disk are still served
+    brotli = None
+
+# Files up to this size are kept in memory (with their compressed variants)
+STATIC_MEMORY_MAX_BYTES = int(os.getenv('STATIC_MEMORY_MAX_BYTES', str(1024 * 1024)))
+
+# Vite writes its build outputs to assets/ as index-BAKq1VPy.js: safe to cache
+# forever. Files copied from public/ keep their names (apple-touch-icon.png) and
+# must stay revalidatable so a deploy can replace them
+HASHED_ASSET_RE = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+# Service workers are checked on every navigation and must never be stale
+SERVICE_WORKER_RE = re.compile(r'(^|[-_.])(sw|service-worker)\.js$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE = 'public, max-age=3600'
+NO_CACHE = 'no-cache'
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/xml', 'application/wasm')
+MIN_COMPRESS_BYTES = 1024
+
+# Content-Encoding -> precompressed file suffix, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+class StaticAsset:
+    """One file of the frontend build with its precomputed headers and variants"""
+
+    def __init__(self, path: str, rel_path: str):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.size = os.path.getsize(path)
+
+        if rel_path == 'index.html' or SERVICE_WORKER_RE.search(rel_path):
+            self.cache_control = NO_CACHE
+        elif HASHED_ASSET_RE.search(rel_path):
+            self.cache_control = IMMUTABLE_CACHE
+        else:
+            self.cache_control = DEFAULT_CACHE
+
+        self.in_memory = self.size <= STATIC_MEMORY_MAX_BYTES
+        sha = hashlib.sha256()
+        chunks = []
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+                if self.in_memory:
+                    chunks.append(chunk)
+        body = b''.join(chunks)
+        self.body: Optional[bytes] = body if self.in_memory else None
+        self.etag = f'"{sha.hexdigest()[:20]}"'
+
+        # encoding -> bytes (in memory) or file path (on disk)
+        self.variants: Dict[str, object] = {}
+        for encoding, suffix in ENCODINGS.items():
+            if os.path.isfile(path + suffix):
+                if self.in_memory:
+                    with open(path + suffix, 'rb') as f:
+                        self.variants[encoding] = f.read()
+                else:
+                    self.variants[encoding] = path + suffix
+        if self.in_memory and self.size >= MIN_COMPRESS_BYTES and self.content_type.startswith(COMPRESSIBLE_TYPES):
+            self._compress(body)
+
+        self.etags = {self.etag} | {self.variant_etag(encoding) for encoding in self.variants}
+
+    def _compress(self, body: bytes):
+        """Build missing compressed variants once, keeping them only if smaller"""
+        if 'gzip' not in self.variants:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+        if 'br' not in self.variants and brotli is not None:
+            compressed = brotli.compress(body)
+            if len(compressed) < len(body):
+                self.variants['br'] = compressed
+
+    def variant_etag(self, encoding: Optional[str]) -> str:
+        """Each encoding is a different representation, so it gets its own ETag"""
+        if encoding is None:
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Codings from an Accept-Encoding header, minus the ones refused with q=0"""
+    accepted = set()
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q=') and params[2:] in ('0', '0.0', '0.00', '0.000'):
+            continue
+        if coding:
+            accepted.add(coding.lower())
+    return accepted
+
+class StaticAssets:
+    """Manifest of the frontend build directory, built once at startup"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.assets: Dict[str, StaticAsset] = {}
+
+    def load(self):
+        """Scan the build directory (precompressed .br/.gz files become variants)"""
+        assets = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if any(filename.endswith(suffix) and os.path.isfile(path[:-len(suffix)])
+                       for suffix in ENCODINGS.values()):
+                    continue
+                rel_path = os.path.relpath(path, self.root).replace(os.sep, '/')
+                assets[rel_path] = StaticAsset(path, rel_path)
+        self.assets = assets
+        print(f"Loaded {len(assets)} static assets")
+
+    def get(self, rel_path: str) -> Optional[StaticAsset]:
+        return self.assets.get(rel_path.lstrip('/'))
+
+    def response(self, asset: StaticAsset, request: Request) -> Response:
+        """Serve an asset, honouring If-None-Match and Accept-Encoding"""
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match:
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag == '*' or tag in asset.etags:
+                    return Response(status_code=304, headers={
+                        'ETag': asset.etag if tag == '*' else tag,
+                        'Cache-Control': asset.cache_control,
+                        'Vary': 'Accept-Encoding'
+                    })
+
+        encoding = None
+        if asset.variants:
+            accepted = accepted_encodings(request.headers.get('accept-encoding', ''))
+            encoding = next((e for e in ENCODINGS if e in asset.variants and e in accepted), None)
+
+        headers = {
+            'ETag': asset.variant_etag(encoding),
+            'Cache-Control': asset.cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+        if encoding:
+            headers['Content-Encoding'] = encoding
+
+        body = asset.variants[encoding] if encoding else (asset.body if asset.in_memory else asset.path)
+        if isinstance(body, bytes):
+            return Response(content=body, media_type=asset.content_type, headers=headers)
+        return FileResponse(body, media_type=asset.content_type, headers=headers)
@@ -1,9 +1,98 @@
 from fastapi import WebSocket
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Optional
+from collections import OrderedDict, deque
+import os
 import json
+import time
+import random
 import asyncio
+import secrets
 from datetime import datetime, timedelta
-from .database import db
+from .database import db, public_profile
+from .services.presence import presence
+
+# Number of recent events kept per user for reconnect resume
+EVENT_LOG_SIZE = int(os.getenv('WS_EVENT_LOG_SIZE', '256'))
+# Number of users whose event logs are kept in memory (least recently used are dropped)
+EVENT_LOG_MAX_USERS = int(os.getenv('WS_EVENT_LOG_MAX_USERS', '10000'))
+# Sockets one worker accepts; further handshakes are told to come back later
+WS_MAX_CONNECTIONS = int(os.getenv('WS_MAX_CONNECTIONS', '10000'))
+# Sockets per user; a connection beyond this closes the user's oldest one
+WS_MAX_DEVICES_PER_USER = int(os.getenv('WS_MAX_DEVICES_PER_USER', '5'))
+# Retry hint of a busy close, randomized between 1x and 2x so rejected clients spread out
+WS_BUSY_RETRY_SECONDS = float(os.getenv('WS_BUSY_RETRY_SECONDS', '5'))
+# On shutdown, clients are told to reconnect at random within this many seconds
+WS_DRAIN_SPREAD_SECONDS = float(os.getenv('WS_DRAIN_SPREAD_SECONDS', '10'))
+# Accept latencies kept for the percentiles in the metrics
+WS_LATENCY_SAMPLES = int(os.getenv('WS_LATENCY_SAMPLES', '1024'))
+
+# Try Again Later; the close reason is "retry_after=<seconds>"
+BUSY_CLOSE_CODE = 1013
+# Worker shutting down (handshakes while draining, sockets left at the end); same reason format
+SERVICE_RESTART_CLOSE_CODE = 1012
+# Closed because the same user opened a newer connection; clients don't reconnect
+REPLACED_CLOSE_CODE = 4001
+
+class UserEventLog:
+    """Bounded ring buffer of the events sent to one user, numbered by a per-user sequence"""
+    
+    def __init__(self, maxlen: int = EVENT_LOG_SIZE):
+        # Identifies this log instance; sequences from a different epoch can't be resumed
+        self.epoch = secrets.token_hex(8)
+        self.seq = 0
+        self.events: deque = deque(maxlen=maxlen)
+    
+    def append(self, message: dict) -> dict:
+        """Stamp the message with the next sequence number and store it"""
+        self.seq += 1
+        message = {**message, "seq": self.seq, "epoch": self.epoch}
+        self.events.append(message)
+        return message
+    
+    def since(self, epoch: Optional[str], last_seq: int) -> Optional[List[dict]]:
+        """Events after last_seq, or None if they are no longer all in the buffer"""
+        if epoch != self.epoch or last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self.events or last_seq < self.events[0]["seq"] - 1:
+            return None
+        return [event for event in self.events if event["seq"] > last_seq]
+
+class AdmissionStats:
+    """Accept/reject/evict counters and recent accept latencies of one worker"""
+    
+    def __init__(self, samples: int = WS_LATENCY_SAMPLES):
+        self.accepted = 0
+        self.evicted = 0
+        # reason -> count
+        self.rejected: Dict[str, int] = {}
+        # Seconds from the start of the handshake until the socket was registered
+        self.latencies: deque = deque(maxlen=samples)
+    
+    def reject(self, reason: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+    
+    def snapshot(self) -> dict:
+        latencies = sorted(self.latencies)
+        
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
+        
+        return {
+            "accepted": self.accepted,
+            "rejected": dict(self.rejected),
+            "evicted": self.evicted,
+            "accept_latency_ms": {
+                "samples": len(latencies),
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": percentile(1.0)
+            }
+        }
 
 class ConnectionManager:
     def __init__(self):
@@ -11,28 +100,217 @@ class ConnectionManager:
         self.active_connections: Dict[int, List[WebSocket]] = {}
         # chat_id -> set of user_ids
         self.chat_participants: Dict[int, Set[int]] = {}
+        # user_id -> recent events for reconnect resume
+        self.event_logs: "OrderedDict[int, UserEventLog]" = OrderedDict()
+        # websocket -> {user_id: profile version already sent on that connection}
+        self.known_profiles: Dict[WebSocket, Dict[int, int]] = {}
         # Background task for verification checks
         self.verification_task = None
+        # Sockets across all users
+        self.connection_count = 0
+        self.stats = AdmissionStats()
+        # Set on shutdown: new sockets are turned away
+        self.draining = False
+    
+    def is_full(self) -> bool:
+        return self.connection_count >= WS_MAX_CONNECTIONS
+    
+    @staticmethod
+    def drain_delay() -> float:
+        """Random reconnect delay of one client of a draining worker"""
+        return random.uniform(1, WS_DRAIN_SPREAD_SECONDS)
     
-    async def connect(self, websocket: WebSocket, user_id: int):
+    async def _turn_away(self, websocket: WebSocket, code: int, retry_after: float):
+        # Accepted first: a close before accept becomes an HTTP 403 and the reason is lost
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+        await websocket.close(code=code, reason=f"retry_after={retry_after:.1f}")
+    
+    async def reject_busy(self, websocket: WebSocket):
+        """Turn a handshake away with a jittered retry hint"""
+        self.stats.reject('busy')
+        await self._turn_away(websocket, BUSY_CLOSE_CODE, WS_BUSY_RETRY_SECONDS * (1 + random.random()))
+    
+    async def reject_draining(self, websocket: WebSocket):
+        self.stats.reject('draining')
+        await self._turn_away(websocket, SERVICE_RESTART_CLOSE_CODE, self.drain_delay())
+    
+    async def drain(self):
+        """Stop admitting sockets and tell every connection to reconnect after its own random delay
+        
+        Sent directly, not through the event log: it is about this connection, not an event to resume.
+        """
+        self.draining = True
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                try:
+                    await connection.send_json({
+                        "type": "reconnect",
+                        "data": {"retry_after": round(self.drain_delay(), 1)}
+                    })
+                except Exception:
+                    pass  # Already gone; its receive loop cleans up
+    
+    async def close_all(self):
+        """Close the connections still open at the end of a drain"""
+        for user_id, connections in list(self.active_connections.items()):
+            for connection in list(connections):
+                self.disconnect(connection, user_id)
+                try:
+                    await connection.close(
+                        code=SERVICE_RESTART_CLOSE_CODE,
+                        reason=f"retry_after={self.drain_delay():.1f}"
+                    )
+                except Exception:
+                    pass
+    
+    async def connect(self, websocket: WebSocket, user_id: int, started: Optional[float] = None) -> bool:
+        """Admit an authenticated socket; False if the worker is full and it was turned away
+        
+        A user at the device cap keeps their newest connections: the oldest is closed
+        with REPLACED_CLOSE_CODE. `started` is the perf_counter() at the start of the
+        handshake, for the accept latency metric.
+        """
+        connections = self.active_connections.get(user_id, [])
+        if len(connections) < WS_MAX_DEVICES_PER_USER and self.is_full():
+            await self.reject_busy(websocket)
+            return False
+        
+        await websocket.accept()
+        while len(self.active_connections.get(user_id, [])) >= WS_MAX_DEVICES_PER_USER:
+            oldest = self.active_connections[user_id][0]
+            self.disconnect(oldest, user_id)
+            self.stats.evicted += 1
+            try:
+                await oldest.close(code=REPLACED_CLOSE_CODE)
+            except Exception:
+                pass  # Already gone
+        
+        self.active_connections.setdefault(user_id, []).append(websocket)
+        self.connection_count += 1
+        presence.device_connected(user_id, self.device_id(websocket))
+        self.stats.accepted += 1
+        if started is not None:
+            self.stats.latencies.append(time.perf_counter() - started)
         
         # Start verification checker if not running
         if self.verification_task is None:
             self.verification_task = asyncio.create_task(self.check_verifications())
+        return True
+    
+    def metrics(self) -> dict:
+        return {
+            "connections": self.connection_count,
+            "users": len(self.active_connections),
+            "max_connections": WS_MAX_CONNECTIONS,
+            "max_devices_per_user": WS_MAX_DEVICES_PER_USER,
+            "draining": self.draining,
+            **self.stats.snapshot()
+        }
+    
+    @staticmethod
+    def device_id(websocket: WebSocket) -> str:
+        """Presence key of a connection"""
+        return str(id(websocket))
+    
+    def set_presence(self, websocket: WebSocket, user_id: int, state: str) -> bool:
+        """Record the foreground/background state reported by a connection"""
+        return presence.set_state(user_id, self.device_id(websocket), state)
     
     def disconnect(self, websocket: WebSocket, user_id: int):
+        presence.device_disconnected(user_id, self.device_id(websocket))
+        self.known_profiles.pop(websocket, None)
         if user_id in self.active_connections:
             if websocket in self.active_connections[user_id]:
                 self.active_connections[user_id].remove(websocket)
+                self.connection_count -= 1
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
     
+    def get_event_log(self, user_id: int) -> UserEventLog:
+        """Get (or create) the event log of a user, evicting the least recently used"""
+        log = self.event_logs.get(user_id)
+        if log is None:
+            log = UserEventLog()
+            self.event_logs[user_id] = log
+            if len(self.event_logs) > EVENT_LOG_MAX_USERS:
+                self.event_logs.popitem(last=False)
+        else:
+            self.event_logs.move_to_end(user_id)
+        return log
+    
+    async def send_session_info(self, websocket: WebSocket, user_id: int):
+        """Tell a freshly connected socket where the user's event stream currently is"""
+        log = self.get_event_log(user_id)
+        await websocket.send_json({
+            "type": "session",
+            "data": {"epoch": log.epoch, "seq": log.seq}
+        })
+    
+    async def resume(self, websocket: WebSocket, user_id: int, epoch: Optional[str], last_seq: Optional[int]):
+        """Replay the events a reconnecting socket missed since last_seq
+        
+        If the events are no longer buffered (gap too large, server restarted or log
+        evicted) or last_seq is missing, a resync_required event is sent instead and
+        the client must refetch. Events emitted while the replay is in flight may
+        arrive twice; clients dedupe by seq.
+        """
+        log = self.get_event_log(user_id)
+        missed = log.since(epoch, last_seq) if last_seq is not None else None
+        if missed is None:
+            await websocket.send_json({
+                "type": "resync_required",
+                "data": {"epoch": log.epoch, "seq": log.seq}
+            })
+            return
+        for event in missed:
+            await websocket.send_json(event)
+    
+    async def send_user_directory(self, websocket: WebSocket, user_id: int):
+        """Send a fresh connection the profiles of the user and everyone they chat with
+        
+        Message events only carry sender_id; clients resolve it against this directory.
+        """
+        profiles = db.get_user_profiles([user_id] + db.get_contact_ids(user_id))
+        await websocket.send_json({"type": "user_directory", "data": {"users": profiles}})
+        self.known_profiles[websocket] = {p['id']: p['profile_version'] for p in profiles}
+    
+    async def ensure_profiles(self, user_id: int, profiles: List[dict]):
+        """Send the connections of a user the profiles (or versions) they haven't seen yet"""
+        for connection in list(self.active_connections.get(user_id, [])):
+            known = self.known_profiles.setdefault(connection, {})
+            missing = [p for p in profiles if known.get(p['id']) != p['profile_version']]
+            if not missing:
+                continue
+            try:
+                await connection.send_json({"type": "user_directory", "data": {"users": missing}})
+            except Exception as e:
+                print(f"❌ Failed to send user directory: {e}")
+                continue
+            for profile in missing:
+                known[profile['id']] = profile['profile_version']
+    
+    async def publish_profile(self, user_id: int):
+        """Notify the user's devices and chat partners that the profile changed"""
+        user = db.get_user_by_id(user_id)
+        if not user:
+            return
+        profile = public_profile(user)
+        for recipient_id in [user_id] + db.get_contact_ids(user_id):
+            await self.broadcast_to_user(recipient_id, "user_updated", profile)
+            for connection in self.active_connections.get(recipient_id, []):
+                self.known_profiles.setdefault(connection, {})[user_id] = profile['profile_version']
+    
     async def send_personal_message(self, message: dict, user_id: int):
         """Send message to all connections of a specific user"""
+        message = self.get_event_log(user_id).append(message)
+        await self.send_unlogged(message, user_id)
+    
+    async def send_unlogged(self, message: dict, user_id: int):
+        """Send to all connections of a user without recording it in the event log
+        
+        For content that must not outlive delivery (ephemeral chats): it gets no seq
+        and is never replayed on resume.
+        """
         print(f"📤 Attempting to send to user {user_id}")
         print(f"📊 Active connections: {list(self.active_connections.keys())}")
         
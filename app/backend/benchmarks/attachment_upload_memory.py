@@ -0,0 +1,95 @@
+"""
+Server memory while uploading a large attachment. Starts uvicorn in a separate
+process, uploads SIZE_MB in two resumable PATCH requests (the second resuming
+from the offset reported by HEAD), downloads a range back and reports the
+server's peak RSS (VmHWM, Linux only) before and after.
+
+Usage (from app/backend):
+    python -m benchmarks.attachment_upload_memory --size-mb 200
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+CHUNK = 1024 * 1024
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def body(start: int, end: int):
+    """Deterministic payload generated on the fly, never held in memory whole"""
+    for offset in range(start, end, CHUNK):
+        size = min(CHUNK, end - offset)
+        yield bytes([(offset // CHUNK) % 251]) * size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-mb', type=int, default=200)
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+    size = args.size_mb * CHUNK
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'ATTACHMENTS_ROOT': os.path.join(tmp, 'attachments'),
+            'ATTACHMENT_MAX_BYTES': str(size),
+        }
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(args.port), '--log-level', 'warning'],
+            env=env, stdout=subprocess.DEVNULL
+        )
+        base = f'http://127.0.0.1:{args.port}'
+        try:
+            for _ in range(100):
+                try:
+                    httpx.get(f'{base}/healthz')
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+
+            with httpx.Client(base_url=base, timeout=300) as client:
+                alice = client.post('/auth/register', json={'email': 'alice@example.com', 'password': 'pw'}).json()
+                bob = client.post('/auth/register', json={'email': 'bob@example.com', 'password': 'pw'}).json()
+                ha = {'Authorization': f"Bearer {alice['token']}"}
+                hb = {'Authorization': f"Bearer {bob['token']}"}
+                request_id = client.post('/chat/request', headers=ha, json={
+                    'to_user_id': bob['user']['id'], 'verification_code': 'abcd'}).json()['request_id']
+                chat_id = client.post('/chat/accept', headers=hb, json={
+                    'request_id': request_id, 'verification_code': 'efgh'}).json()['chat_id']
+
+                baseline = peak_rss_mb(server.pid)
+                upload = client.post('/attachments', headers=ha, json={'chat_id': chat_id, 'size': size}).json()
+                url = f"/attachments/{upload['attachment_id']}/upload"
+
+                started = time.perf_counter()
+                # First request stops at 60%, as if the connection dropped there
+                first_part = (size * 6 // 10) // CHUNK * CHUNK
+                client.patch(url, headers={**ha, 'Upload-Offset': '0'}, content=body(0, first_part))
+                offset = int(client.head(url, headers=ha).headers['upload-offset'])
+                response = client.patch(url, headers={**ha, 'Upload-Offset': str(offset)}, content=body(offset, size))
+                elapsed = time.perf_counter() - started
+                assert response.headers['upload-complete'] == 'true', response.text
+
+                ranged = client.get(f"/attachments/{upload['attachment_id']}", headers={**hb, 'Range': 'bytes=0-1023'})
+                assert ranged.status_code == 206 and len(ranged.content) == 1024
+
+                peak = peak_rss_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"uploaded {args.size_mb} MB in {elapsed:.1f}s ({args.size_mb / elapsed:.0f} MB/s), resumed at {offset} bytes")
+    print(f"server peak RSS: {baseline:.0f} MB before upload, {peak:.0f} MB after (+{peak - baseline:.0f} MB)")
+
+if __name__ == '__main__':
+    main()
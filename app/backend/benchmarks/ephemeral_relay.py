@@ -0,0 +1,111 @@
+"""
+Server-side processing time per message for a stored chat (create_message,
+then fan-out to both participants) against an ephemeral chat (relay only),
+plus the SQL statements each message costs.
+
+Both participants are connected through fake WebSockets, so this measures the
+server's own work rather than the network. Uses a temporary SQLite database.
+
+Usage (from app/backend):
+    python -m benchmarks.ephemeral_relay --messages 2000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+class FakeWebSocket:
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        pass
+
+def setup():
+    from app.database import db
+
+    db.create_user('alice@example.com', 'x', 'alice')
+    db.create_user('bob@example.com', 'x', 'bob')
+    stored = db.create_chat(1, 2, 'abcdabcd')
+    db.create_user('carol@example.com', 'x', 'carol')
+    ephemeral = db.create_chat(1, 3, 'efghefgh')
+    db.set_chat_ephemeral(ephemeral, True)
+    return stored, ephemeral
+
+async def stored_message(chat_id: int, content: str):
+    """The /chat/ws message path of a stored chat"""
+    from app.database import db
+    from app.services.ephemeral import ephemeral_relay
+    from app.websocket_manager import manager
+
+    chat = ephemeral_relay.get_chat(chat_id)
+    created = db.create_message(chat_id, 1, content, 'text')
+    message = {"type": "message", "data": {
+        "id": created['id'], "chat_id": chat_id, "seq": created['seq'], "sender_id": 1,
+        "encrypted_content": content, "message_type": 'text', "created_at": created['created_at']
+    }}
+    for user_id in (chat['user1_id'], chat['user2_id']):
+        await manager.send_personal_message(message, user_id)
+
+async def ephemeral_message(chat_id: int, content: str):
+    """The /chat/ws message path of an ephemeral chat"""
+    from app.services.ephemeral import ephemeral_relay
+
+    chat = ephemeral_relay.get_chat(chat_id)
+    message = ephemeral_relay.new_message(chat_id, 1, 'text', encrypted_content=content)
+    await ephemeral_relay.relay(chat, 1, {"type": "message", "data": message})
+
+async def measure(func, chat_id: int, messages: int, statements: list) -> tuple:
+    content = 'U2FsdGVkX1' + 'a' * 120
+    await func(chat_id, content)  # warm up caches
+    statements.clear()
+    timings = []
+    for _ in range(messages):
+        started = time.perf_counter()
+        await func(chat_id, content)
+        timings.append(time.perf_counter() - started)
+    return timings, len(statements) / messages
+
+async def run(args):
+    from sqlalchemy import event
+    from app.database import engine
+    from app.websocket_manager import manager
+
+    stored, ephemeral = setup()
+    for user_id in (1, 2, 3):
+        await manager.connect(FakeWebSocket(), user_id)
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+    print(f"{args.messages} messages per path")
+    results = {}
+    for name, func, chat_id in (('stored', stored_message, stored), ('ephemeral', ephemeral_message, ephemeral)):
+        # The manager logs every send; keep that cost but not the terminal's
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings, per_message = await measure(func, chat_id, args.messages, statements)
+        median = statistics.median(timings)
+        p99 = sorted(timings)[int(len(timings) * 0.99)]
+        results[name] = median
+        print(f"  {name:9s} median {median * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us   {per_message:4.1f} SQL statements/message")
+    print(f"  speedup {results['stored'] / results['ephemeral']:.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=2000)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+
+    from app.migrations import run_migrations
+    run_migrations()
+    asyncio.run(run(args))
+    tmp.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Local stand-in for the FCM HTTP v1 API, for benchmarks and offline testing.
+
+Tokens starting with "invalid" are answered like FCM answers unregistered
+devices (404 UNREGISTERED); everything else succeeds after FAKE_FCM_LATENCY_MS.
+
+Run: uvicorn benchmarks.fake_fcm:app --port 9099
+Then point the backend at it:
+    PUSH_BACKEND=fcm_http FCM_API_URL=http://127.0.0.1:9099 FCM_PROJECT_ID=fake FCM_ACCESS_TOKEN=fake
+"""
+import os
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LATENCY_MS = float(os.getenv('FAKE_FCM_LATENCY_MS', '20'))
+
+app = FastAPI(title='Fake FCM')
+app.state.sent = 0
+app.state.rejected = 0
+
+@app.post('/v1/projects/{project_id}/messages:send')
+async def send(project_id: str, request: Request):
+    if not request.headers.get('authorization', '').startswith('Bearer '):
+        return JSONResponse(status_code=401, content={
+            'error': {'code': 401, 'status': 'UNAUTHENTICATED', 'message': 'Missing bearer token'}
+        })
+
+    body = await request.json()
+    token = body.get('message', {}).get('token', '')
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+
+    if token.startswith('invalid'):
+        app.state.rejected += 1
+        return JSONResponse(status_code=404, content={
+            'error': {
+                'code': 404,
+                'message': 'Requested entity was not found.',
+                'status': 'NOT_FOUND',
+                'details': [{
+                    '@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError',
+                    'errorCode': 'UNREGISTERED'
+                }]
+            }
+        })
+
+    app.state.sent += 1
+    return {'name': f'projects/{project_id}/messages/{app.state.sent}'}
+
+@app.get('/stats')
+async def stats():
+    return {'sent': app.state.sent, 'rejected': app.state.rejected}
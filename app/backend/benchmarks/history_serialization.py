@@ -0,0 +1,104 @@
+"""
+Rows/sec for loading and serializing a 1,000-message chat history: the ORM path
+(hydrate Message objects, copy into dicts with isoformat, jsonable_encoder,
+stdlib JSONResponse) against the Core path used by GET /chat/messages (cached
+select, row mappings, FastJSONResponse).
+
+Uses a temporary SQLite database.
+
+Usage (from app/backend):
+    python -m benchmarks.history_serialization --messages 1000 --runs 200
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+def seed(messages: int) -> int:
+    from app.database import db, Message
+
+    db.create_user('alice@example.com', 'x', 'alice')
+    db.create_user('bob@example.com', 'x', 'bob')
+    chat_id = db.create_chat(1, 2, 'abcdabcd')
+    now = datetime.utcnow()
+    session = db.get_session()
+    try:
+        session.bulk_insert_mappings(Message, [{
+            'chat_id': chat_id, 'seq': i, 'sender_id': 1 + i % 2,
+            'encrypted_content': 'U2FsdGVkX1' + 'a' * 120, 'message_type': 'text',
+            'created_at': now - timedelta(seconds=messages - i)
+        } for i in range(1, messages + 1)])
+        session.commit()
+    finally:
+        session.close()
+    return chat_id
+
+def orm_path(chat_id: int, limit: int) -> bytes:
+    """The read path before Core: ORM objects -> dicts -> jsonable_encoder -> json"""
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from app.database import db, Message
+
+    session = db.get_session()
+    try:
+        rows = session.query(Message).filter(Message.chat_id == chat_id) \
+            .order_by(Message.seq.desc()).limit(limit).all()
+        messages = [{
+            'id': msg.id,
+            'chat_id': msg.chat_id,
+            'sender_id': msg.sender_id,
+            'seq': msg.seq,
+            'encrypted_content': msg.encrypted_content,
+            'message_type': msg.message_type,
+            'attachment_id': msg.attachment_id,
+            'created_at': msg.created_at.isoformat() if msg.created_at else None
+        } for msg in reversed(rows)]
+    finally:
+        session.close()
+    return JSONResponse(jsonable_encoder({'messages': messages})).body
+
+def core_path(chat_id: int, limit: int) -> bytes:
+    from app.database import db
+    from app.responses import FastJSONResponse
+
+    return FastJSONResponse({'messages': db.get_chat_messages(chat_id, limit)}).body
+
+def measure(func, chat_id: int, limit: int, runs: int) -> list:
+    func(chat_id, limit)  # warm up caches
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func(chat_id, limit)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+
+    from app.migrations import run_migrations
+    run_migrations()
+    chat_id = seed(args.messages)
+
+    import orjson
+    assert orjson.loads(orm_path(chat_id, args.messages)) == orjson.loads(core_path(chat_id, args.messages))
+
+    print(f"{args.messages} messages, {args.runs} runs")
+    results = {}
+    for name, func in (('orm', orm_path), ('core', core_path)):
+        timings = measure(func, chat_id, args.messages, args.runs)
+        median = statistics.median(timings)
+        results[name] = median
+        print(f"  {name:5s} median {median * 1000:7.2f} ms   {args.messages / median:10,.0f} rows/s")
+    print(f"  speedup {results['orm'] / results['core']:.1f}x")
+    tmp.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Pushes per second through FCMHttpPushService against the local fake FCM server.
+
+The fake server runs in its own process so it doesn't compete with the client
+for the GIL. It speaks cleartext HTTP/1.1, so this measures the client's
+pooling and concurrency limits rather than HTTP/2 multiplexing.
+
+Usage (from app/backend):
+    python -m benchmarks.push_throughput --pushes 5000 --concurrency 100 --invalid-ratio 0.05
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+import httpx
+
+from app.services.fcm_http import FCMHttpPushService
+
+def start_fake_fcm(port: int) -> subprocess.Popen:
+    process = subprocess.Popen([
+        sys.executable, '-m', 'uvicorn', 'benchmarks.fake_fcm:app',
+        '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'
+    ])
+    for _ in range(100):
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/stats')
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('Fake FCM server did not start')
+
+async def run(args):
+    service = FCMHttpPushService(
+        project_id='fake',
+        api_url=f'http://127.0.0.1:{args.port}',
+        access_token='fake',
+        max_concurrency=args.concurrency,
+        max_connections=args.connections
+    )
+    invalid_every = int(1 / args.invalid_ratio) if args.invalid_ratio > 0 else 0
+    tokens = [
+        f'invalid-{i}' if invalid_every and i % invalid_every == 0 else f'device-{i}'
+        for i in range(args.pushes)
+    ]
+
+    started = time.perf_counter()
+    success = failure = invalid = 0
+    for offset in range(0, args.pushes, args.batch_size):
+        result = await service.send_batch_notifications(tokens[offset:offset + args.batch_size], unread_count=3)
+        success += result['success']
+        failure += result['failure']
+        invalid += len(result['invalid_tokens'])
+    elapsed = time.perf_counter() - started
+    await service.close()
+
+    print(f"{args.pushes} pushes in {elapsed:.2f}s -> {args.pushes / elapsed:.0f} pushes/s")
+    print(f"success={success} failure={failure} invalid_tokens={invalid}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pushes', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--connections', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--invalid-ratio', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=9099)
+    args = parser.parse_args()
+
+    server = start_fake_fcm(args.port)
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    main()
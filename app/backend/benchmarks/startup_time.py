@@ -0,0 +1,73 @@
+"""
+Cold start timings: importing app.main, and spawning uvicorn until the first
+request is answered. Each run uses a fresh interpreter and a fresh SQLite file.
+
+Usage (from app/backend):
+    python -m benchmarks.startup_time --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - t)"
+)
+
+def measure_import(env: dict) -> float:
+    out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+def measure_first_request(env: dict, port: int) -> tuple:
+    """Seconds from spawn until /healthz answers, and the latency of that first answer"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'warning'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError('uvicorn exited during startup')
+            request_started = time.perf_counter()
+            try:
+                httpx.get(f'http://127.0.0.1:{port}/healthz', timeout=5)
+            except httpx.TransportError:
+                time.sleep(0.01)
+                continue
+            now = time.perf_counter()
+            return now - started, now - request_started
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    imports, ready, first = [], [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, 'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'bench.db')}"}
+            imports.append(measure_import(env))
+            to_ready, latency = measure_first_request(env, args.port)
+            ready.append(to_ready)
+            first.append(latency)
+
+    def fmt(values):
+        return f"median {statistics.median(values) * 1000:.0f} ms (min {min(values) * 1000:.0f}, max {max(values) * 1000:.0f})"
+
+    print(f"import app.main:        {fmt(imports)}")
+    print(f"spawn to first answer:  {fmt(ready)}")
+    print(f"first request latency:  {fmt(first)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""
+Range parsing for resumable downloads.
+
+Run from app/backend:
+    python -m pytest -q tests
+"""
+import pytest
+
+from app.downloads import parse_range
+
+@pytest.mark.parametrize('header, size, expected', [
+    ('bytes=0-99', 1000, (0, 99)),
+    ('bytes=900-', 1000, (900, 999)),
+    ('bytes=990-2000', 1000, (990, 999)),
+    ('bytes=-100', 1000, (900, 999)),
+    ('bytes=-5000', 1000, (0, 999)),
+    ('bytes=0-1,5-9', 1000, None),
+    ('items=0-9', 1000, None),
+    ('bytes=abc', 1000, None),
+])
+def test_parse_range(header, size, expected):
+    assert parse_range(header, size) == expected
+
+@pytest.mark.parametrize('header, size', [
+    ('bytes=1000-', 1000),
+    ('bytes=-0', 1000),
+    ('bytes=-10', 0),
+    ('bytes=0-', 0),
+])
+def test_unsatisfiable_range(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
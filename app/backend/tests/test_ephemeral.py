@@ -0,0 +1,120 @@
+"""
+Ephemeral chat messages are relayed but never kept: not in the database and
+not in the per-user event log that reconnecting clients resume from.
+
+Run from app/backend:
+    python -m pytest -q tests
+"""
+import os
+import tempfile
+
+import pytest
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp.name, 'test.db')}"
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+
+from fastapi.testclient import TestClient
+
+from app.database import db
+from app.main import app
+from app.migrations import run_migrations
+from app.services.ephemeral import ephemeral_relay
+from app.websocket_manager import manager
+
+SECRET = 'U2FsdGVkX1-ephemeral-secret'
+
+@pytest.fixture(scope='module')
+def client():
+    run_migrations()
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture(scope='module')
+def users(client):
+    tokens = {}
+    for name in ('alice', 'bob'):
+        client.post('/auth/register', json={'email': f'{name}@example.com', 'password': 'secretpw1', 'username': name})
+        response = client.post('/auth/login', json={'email': f'{name}@example.com', 'password': 'secretpw1'})
+        tokens[name] = response.json()['token']
+    alice = db.get_token(tokens['alice'])['user_id']
+    bob = db.get_token(tokens['bob'])['user_id']
+    chat_id = db.create_chat(alice, bob, 'abcdabcd')
+    db.set_chat_ephemeral(chat_id, True)
+    return tokens, chat_id, bob
+
+def connect(client, token):
+    websocket = client.websocket_connect(f'/chat/ws?token={token}')
+    session = websocket.__enter__().receive_json()
+    assert session['type'] == 'session'
+    assert websocket.receive_json()['type'] == 'user_directory'
+    return websocket, session['data']
+
+def receive_until(websocket, message_type):
+    while True:
+        message = websocket.receive_json()
+        if message['type'] == message_type:
+            return message
+
+def assert_resume_replays_nothing(websocket, epoch):
+    """Resume from the start of the log; a bogus-epoch resume right after marks the end of the replay"""
+    websocket.send_json({'type': 'resume', 'epoch': epoch, 'last_seq': 0})
+    websocket.send_json({'type': 'resume', 'epoch': 'end-of-replay', 'last_seq': 0})
+    while True:
+        message = websocket.receive_json()
+        if message['type'] == 'resync_required':
+            return
+        assert SECRET not in str(message), f"ephemeral message replayed: {message}"
+
+def test_live_relay_is_not_replayed(client, users):
+    tokens, chat_id, bob = users
+    bob_ws, bob_session = connect(client, tokens['bob'])
+    alice_ws, _ = connect(client, tokens['alice'])
+    try:
+        alice_ws.send_json({'type': 'message', 'chat_id': chat_id, 'encrypted_content': SECRET})
+        received = receive_until(bob_ws, 'message')['data']
+        assert received['encrypted_content'] == SECRET
+        assert received['ephemeral'] is True
+        assert 'seq' not in received
+
+        assert_resume_replays_nothing(bob_ws, bob_session['epoch'])
+        assert all(SECRET not in str(event) for event in manager.get_event_log(bob).events)
+    finally:
+        alice_ws.__exit__(None, None, None)
+        bob_ws.__exit__(None, None, None)
+
+def test_held_message_is_not_replayed(client, users):
+    tokens, chat_id, bob = users
+    response = client.post(
+        '/chat/send',
+        json={'chat_id': chat_id, 'content': SECRET},
+        headers={'Authorization': f"Bearer {tokens['alice']}"}
+    )
+    assert response.json()['status'] == 'held'
+
+    # Delivered once, on connect
+    bob_ws, bob_session = connect(client, tokens['bob'])
+    try:
+        assert receive_until(bob_ws, 'new_message')['data']['content'] == SECRET
+        assert_resume_replays_nothing(bob_ws, bob_session['epoch'])
+        assert all(SECRET not in str(event) for event in manager.get_event_log(bob).events)
+    finally:
+        bob_ws.__exit__(None, None, None)
+
+def test_stale_cached_mode_does_not_store(client, users):
+    """A chat switched to ephemeral on another worker is relayed, not stored, even while this worker's cache says stored"""
+    tokens, chat_id, bob = users
+    headers = {'Authorization': f"Bearer {tokens['alice']}"}
+    db.set_chat_ephemeral(chat_id, False)
+    ephemeral_relay.forget_chat(chat_id)
+    assert ephemeral_relay.get_chat(chat_id)['ephemeral'] is False
+
+    # The other worker's switch: the database changes, this worker's cache doesn't
+    db.set_chat_ephemeral(chat_id, True)
+    last_seq = db.get_chat(chat_id)['last_seq']
+    response = client.post('/chat/send', json={'chat_id': chat_id, 'content': SECRET}, headers=headers)
+
+    assert response.status_code == 200
+    assert str(response.json()['message_id']).startswith('e')
+    assert db.get_chat(chat_id)['last_seq'] == last_seq
+    assert ephemeral_relay.get_chat(chat_id)['ephemeral'] is True
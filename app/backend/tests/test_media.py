@@ -0,0 +1,53 @@
+"""
+Avatar uploads: images that would decode past the pixel cap are refused
+before Pillow decodes them.
+
+Run from app/backend:
+    python -m pytest -q tests
+"""
+import io
+import os
+import tempfile
+
+import pytest
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp.name, 'test.db')}"
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+
+Image = pytest.importorskip('PIL.Image')
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.migrations import run_migrations
+from app.services.media import MEDIA_MAX_BYTES, MEDIA_MAX_PIXELS, media_store
+
+def png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('1', (width, height)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+@pytest.fixture(scope='module')
+def client():
+    # The store may have been created by an earlier test module, before any MEDIA_ROOT was set
+    media_root, media_store.root = media_store.root, os.path.join(_tmp.name, 'media')
+    run_migrations()
+    with TestClient(app) as client:
+        client.post('/auth/register', json={'email': 'dave@example.com', 'password': 'secretpw1', 'username': 'dave'})
+        token = client.post('/auth/login', json={'email': 'dave@example.com', 'password': 'secretpw1'}).json()['token']
+        client.headers['Authorization'] = f'Bearer {token}'
+        yield client
+    media_store.root = media_root
+
+def test_avatar_is_stored_with_thumbnails(client):
+    response = client.post('/media/avatar', files={'file': ('avatar.png', png(300, 200), 'image/png')})
+    assert response.status_code == 200
+    assert set(response.json()['thumbnails']) == {'64', '256'}
+
+def test_decompression_bomb_is_refused(client):
+    side = int(MEDIA_MAX_PIXELS ** 0.5) + 1
+    bomb = png(side, side)
+    assert len(bomb) < MEDIA_MAX_BYTES
+    response = client.post('/media/avatar', files={'file': ('avatar.png', bomb, 'image/png')})
+    assert response.status_code == 413
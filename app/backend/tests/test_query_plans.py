@@ -0,0 +1,178 @@
+"""
+EXPLAIN audit of the hot queries in Database: with the tables seeded at
+realistic sizes, each of them must use an index rather than a sequential scan.
+
+Needs a Postgres database; everything is created in a throwaway schema that is
+dropped afterwards. Skipped unless TEST_POSTGRES_URL is set. Run from app/backend:
+    TEST_POSTGRES_URL=postgresql://localhost/synerchat_test python -m pytest -q tests/test_query_plans.py
+"""
+import os
+import random
+import secrets
+from datetime import datetime, timedelta
+
+import pytest
+
+# The app modules are imported lazily: app.database builds its engine from
+# DATABASE_URL at import, which other test modules set before importing it
+TEST_POSTGRES_URL = os.getenv('TEST_POSTGRES_URL', '')
+if TEST_POSTGRES_URL.startswith('postgres://'):
+    TEST_POSTGRES_URL = TEST_POSTGRES_URL.replace('postgres://', 'postgresql://', 1)
+
+pytestmark = pytest.mark.skipif(not TEST_POSTGRES_URL, reason='TEST_POSTGRES_URL not set')
+
+HOT_QUERIES = (
+    'get_token', 'get_user_by_email', 'chat_exists_between', 'get_user_chats', 'get_chat_requests',
+    'get_chat_messages', 'get_chat_messages_after_seq', 'get_unread_message_count', 'get_last_messages',
+    'get_recent_messages', 'get_unread_counts', 'get_inbox', 'get_user_fcm_tokens', 'request_chat_deletion',
+    'clear_messages',
+)
+
+SIZES = {
+    'users': 5000,
+    'chats': 20000,
+    'messages': 300000,
+    'chat_requests': 20000,
+    'fcm_tokens': 8000,
+    'chat_deletion_requests': 500,
+}
+
+def seed(engine):
+    from app.database import (User, Chat, Message, ChatRequest, FCMToken, ChatDeletionRequest, AuthToken,
+                              ChatSummary, Base)
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    users = SIZES['users']
+    pairs = set()
+    while len(pairs) < SIZES['chats']:
+        a, b = rng.sample(range(1, users + 1), 2)
+        if (b, a) not in pairs:
+            pairs.add((a, b))
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'id': i, 'email': f'user{i}@example.com', 'password_hash': 'x', 'username': f'user{i}'}
+            for i in range(1, users + 1)
+        ])
+        conn.execute(AuthToken.__table__.insert(), [
+            {'user_id': i, 'token': f'token-{i}', 'expires_at': now + timedelta(days=7)}
+            for i in range(1, users + 1)
+        ])
+        conn.execute(Chat.__table__.insert(), [
+            {'id': i, 'user1_id': a, 'user2_id': b, 'user_low_id': min(a, b), 'user_high_id': max(a, b),
+             'shared_secret': 'abcdabcd'}
+            for i, (a, b) in enumerate(pairs, start=1)
+        ])
+        conn.execute(ChatSummary.__table__.insert(), [
+            {'user_id': user_id, 'chat_id': i, 'other_user_id': other_id,
+             'last_activity': now - timedelta(seconds=rng.randint(0, 86400 * 30)), 'unread_count': rng.randint(0, 3)}
+            for i, (a, b) in enumerate(pairs, start=1) for user_id, other_id in ((a, b), (b, a))
+        ])
+        conn.execute(ChatRequest.__table__.insert(), [
+            {'from_user_id': rng.randint(1, users), 'to_user_id': rng.randint(1, users),
+             'status': rng.choice(['pending', 'accepted', 'accepted', 'accepted', 'rejected']),
+             'verification_code': 'abcd', 'code_expires_at': now, 'created_at': now}
+            for _ in range(SIZES['chat_requests'])
+        ])
+        conn.execute(FCMToken.__table__.insert(), [
+            {'user_id': rng.randint(1, users), 'token': f'fcm-{i}', 'device_type': 'android'}
+            for i in range(SIZES['fcm_tokens'])
+        ])
+        conn.execute(ChatDeletionRequest.__table__.insert(), [
+            {'chat_id': rng.randint(1, SIZES['chats']), 'requester_id': rng.randint(1, users), 'created_at': now}
+            for _ in range(SIZES['chat_deletion_requests'])
+        ])
+        batch = []
+        last_seq = {}
+        for i in range(SIZES['messages']):
+            chat_id = rng.randint(1, SIZES['chats'])
+            last_seq[chat_id] = last_seq.get(chat_id, 0) + 1
+            batch.append({
+                'chat_id': chat_id, 'seq': last_seq[chat_id], 'sender_id': rng.randint(1, users),
+                'encrypted_content': 'ciphertext', 'message_type': 'text',
+                'created_at': now - timedelta(seconds=SIZES['messages'] - i)
+            })
+            if len(batch) == 10000:
+                conn.execute(Message.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(Message.__table__.insert(), batch)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in Base.metadata.sorted_tables:
+            conn.exec_driver_sql(f'ANALYZE {table.name}')
+
+def hot_queries():
+    """The statements Database issues on hot paths, with representative parameters"""
+    from sqlalchemy import select, func, and_, tuple_
+    from app.database import (User, Chat, Message, ChatRequest, FCMToken, ChatDeletionRequest, AuthToken,
+                              ChatSummary)
+
+    user_id, chat_id = 42, 4242
+    return {
+        'get_token': select(AuthToken).where(AuthToken.token == 'token-42'),
+        'get_user_by_email': select(User).where(User.email == 'user42@example.com'),
+        'chat_exists_between': select(Chat.id).where(Chat.user_low_id == 7, Chat.user_high_id == user_id),
+        'get_user_chats': select(Chat).where((Chat.user1_id == user_id) | (Chat.user2_id == user_id)),
+        'get_chat_requests': select(ChatRequest).where(
+            ChatRequest.to_user_id == user_id, ChatRequest.status == 'pending'),
+        'get_chat_messages': select(Message).where(Message.chat_id == chat_id)
+            .order_by(Message.seq.desc()).limit(100),
+        'get_chat_messages_after_seq': select(Message).where(Message.chat_id == chat_id, Message.seq > 5)
+            .order_by(Message.seq).limit(100),
+        'get_unread_message_count': select(func.sum(ChatSummary.unread_count)).where(
+            ChatSummary.user_id == user_id),
+        'get_last_messages': select(Message).join(
+            Chat, and_(Chat.id == Message.chat_id, Chat.last_seq == Message.seq)).where(Chat.id.in_([1, 2, 4242])),
+        'get_recent_messages': select(Message).join(Chat, Chat.id == Message.chat_id).where(
+            Chat.id.in_([1, 2, 4242]), Message.seq > Chat.last_seq - 20).order_by(Message.chat_id, Message.seq),
+        'get_unread_counts': select(ChatSummary.chat_id, ChatSummary.unread_count).where(
+            ChatSummary.user_id == user_id, ChatSummary.unread_count > 0),
+        'get_inbox': select(ChatSummary, Chat.ephemeral, User, Message)
+            .join(Chat, Chat.id == ChatSummary.chat_id)
+            .join(User, User.id == ChatSummary.other_user_id)
+            .outerjoin(Message, Message.id == ChatSummary.last_message_id)
+            .where(ChatSummary.user_id == user_id,
+                   tuple_(ChatSummary.last_activity, ChatSummary.chat_id) < tuple_(datetime.utcnow(), 10**9))
+            .order_by(ChatSummary.last_activity.desc(), ChatSummary.chat_id.desc()).limit(50),
+        'get_user_fcm_tokens': select(FCMToken).where(FCMToken.user_id == user_id),
+        'request_chat_deletion': select(ChatDeletionRequest).where(
+            ChatDeletionRequest.chat_id == chat_id, ChatDeletionRequest.requester_id != user_id),
+        'clear_messages': select(Message.id).where(Message.chat_id == chat_id),
+    }
+
+def explain(conn, statement) -> str:
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    rows = conn.exec_driver_sql('EXPLAIN ' + str(compiled), compiled.params).fetchall()
+    return '\n'.join(row[0] for row in rows)
+
+@pytest.fixture(scope='module')
+def plans():
+    """Query plan of every hot query, on a freshly migrated and seeded schema"""
+    from sqlalchemy import create_engine, text
+    from app import migrations
+
+    schema = f'plan_audit_{secrets.token_hex(4)}'
+    admin = create_engine(TEST_POSTGRES_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA {schema}'))
+    engine = create_engine(TEST_POSTGRES_URL, connect_args={'options': f'-csearch_path={schema}'})
+    app_engine = migrations.engine
+    migrations.engine = engine
+    try:
+        migrations.run_migrations()
+        seed(engine)
+        with engine.connect() as conn:
+            yield {name: explain(conn, statement) for name, statement in hot_queries().items()}
+    finally:
+        migrations.engine = app_engine
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA {schema} CASCADE'))
+        admin.dispose()
+
+def test_every_hot_query_is_audited(plans):
+    assert set(plans) == set(HOT_QUERIES)
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_uses_an_index(plans, name):
+    assert 'Seq Scan' not in plans[name], f"{name} falls back to a sequential scan:\n{plans[name]}"
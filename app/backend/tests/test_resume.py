@@ -0,0 +1,43 @@
+"""
+Resuming the WebSocket event stream: a malformed resume frame gets a
+resync_required answer and the connection keeps working.
+
+Run from app/backend:
+    python -m pytest -q tests
+"""
+import os
+import tempfile
+
+import pytest
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp.name, 'test.db')}"
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.migrations import run_migrations
+
+@pytest.fixture(scope='module')
+def token():
+    run_migrations()
+    with TestClient(app) as client:
+        client.post('/auth/register', json={'email': 'carol@example.com', 'password': 'secretpw1', 'username': 'carol'})
+        response = client.post('/auth/login', json={'email': 'carol@example.com', 'password': 'secretpw1'})
+        yield client, response.json()['token']
+
+@pytest.mark.parametrize('last_seq', [None, 'abc', '²', -1, 1.5, True, [], {}])
+def test_malformed_last_seq_requires_a_resync(token, last_seq):
+    client, token = token
+    with client.websocket_connect(f'/chat/ws?token={token}') as websocket:
+        session = websocket.receive_json()['data']
+        assert websocket.receive_json()['type'] == 'user_directory'
+
+        websocket.send_json({'type': 'resume', 'epoch': session['epoch'], 'last_seq': last_seq})
+        assert websocket.receive_json()['type'] == 'resync_required'
+
+        # Still connected: a valid resume is answered (with nothing to replay)
+        websocket.send_json({'type': 'resume', 'epoch': session['epoch'], 'last_seq': str(session['seq'])})
+        websocket.send_json({'type': 'resume', 'epoch': 'end-of-replay', 'last_seq': 0})
+        assert websocket.receive_json()['type'] == 'resync_required'
@@ -38,6 +38,14 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
   const activeChatRef = useRef<any>(null);
   const reconnectTimeoutRef = useRef<any>(null);
   const isConnectingRef = useRef<boolean>(false);
+  // Set when the server asked for a reconnect and the client already waited its delay
+  const reconnectNowRef = useRef<boolean>(false);
+  // user_id -> profile, filled from user_directory / user_updated events
+  const usersRef = useRef<Map<number, any>>(new Map());
+  // Highest message seq seen in the active chat, to detect missed messages
+  const lastSeqRef = useRef<number>(0);
+  // Position in this user's server event stream, to resume from after a reconnect
+  const eventCursorRef = useRef<{ epoch: string; seq: number } | null>(null);
 
   useEffect(() => {
     activeChatRef.current = activeChat;
@@ -57,6 +65,13 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
     };
   }, [user]);
 
+  useEffect(() => {
+    document.addEventListener('visibilitychange', sendPresence);
+    return () => {
+      document.removeEventListener('visibilitychange', sendPresence);
+    };
+  }, []);
+
   useEffect(() => {
     if (activeChat) {
       loadMessages(activeChat.id);
@@ -104,13 +119,21 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
         isConnectingRef.current = false;
         wsRef.current = null;
         
-        // Reconnect after 2 seconds if user is still logged in
+        // Replaced by a newer connection of this user: reconnecting would just evict that one
+        if (event.code === 4001) {
+          return;
+        }
+
+        // Reconnect if user is still logged in; a busy or restarting server says when to come back
         if (user) {
-          console.log('🔄 Scheduling reconnect in 2 seconds...');
+          const retryAfter = event.code === 1012 || event.code === 1013 ? /retry_after=([\d.]+)/.exec(event.reason) : null;
+          const delay = reconnectNowRef.current ? 0 : retryAfter ? parseFloat(retryAfter[1]) * 1000 : 2000;
+          reconnectNowRef.current = false;
+          console.log(`🔄 Scheduling reconnect in ${delay / 1000} seconds...`);
           reconnectTimeoutRef.current = setTimeout(() => {
             console.log('🔄 Attempting to reconnect...');
             connectWebSocket();
-          }, 2000);
+          }, delay);
         }
       };
 
@@ -128,6 +151,16 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
     }
   };
 
+  // Tell the server whether the app is on screen; it only sends push notifications when it isn't
+  const sendPresence = () => {
+    if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({
+        type: 'presence',
+        state: document.hidden ? 'background' : 'foreground'
+      }));
+    }
+  };
+
   const disconnectWebSocket = () => {
     console.log('🔌 Disconnecting WebSocket...');
     
@@ -144,11 +177,43 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
     }
     
     isConnectingRef.current = false;
+    eventCursorRef.current = null;
   };
 
   const handleWebSocketMessage = (data: any) => {
     console.log('🔔 WebSocket message received:', data);
+    // Events kept in the server's event log carry their position in the stream
+    if (data.epoch && typeof data.seq === 'number') {
+      eventCursorRef.current = { epoch: data.epoch, seq: data.seq };
+    }
     switch (data.type) {
+      case 'session':
+        // The server counts a new connection as in the foreground
+        if (document.hidden) {
+          sendPresence();
+        }
+        // First frame of a connection: after a reconnect, ask for the events missed meanwhile
+        if (eventCursorRef.current) {
+          wsRef.current?.send(JSON.stringify({
+            type: 'resume',
+            epoch: eventCursorRef.current.epoch,
+            last_seq: eventCursorRef.current.seq
+          }));
+        } else {
+          eventCursorRef.current = { epoch: data.data.epoch, seq: data.data.seq };
+        }
+        break;
+
+      case 'resync_required':
+        // The missed events are no longer buffered (server restarted or gap too large): reload
+        eventCursorRef.current = { epoch: data.data.epoch, seq: data.data.seq };
+        refreshChats();
+        refreshRequests();
+        if (activeChatRef.current) {
+          loadMessages(activeChatRef.current.id);
+        }
+        break;
+
       case 'message':
       case 'new_message':
         console.log('📨 New message event:', data.data);
@@ -160,17 +225,26 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
         const newMessage = {
           id: data.data.id,
           chat_id: data.data.chat_id,
+          seq: data.data.seq,
           sender_id: data.data.sender_id,
           encrypted_content: data.data.content,
           message_type: data.data.message_type || 'text',
           created_at: data.data.created_at || new Date().toISOString(),
-          username: data.data.sender?.username || (data.data.sender_id === user?.id ? user?.username : currentActiveChat?.other_user?.username) || '',
-          email: data.data.sender?.email || (data.data.sender_id === user?.id ? user?.email : currentActiveChat?.other_user?.email) || ''
+          username: usersRef.current.get(data.data.sender_id)?.username || (data.data.sender_id === user?.id ? user?.username : currentActiveChat?.other_user?.username) || '',
+          email: usersRef.current.get(data.data.sender_id)?.email || (data.data.sender_id === user?.id ? user?.email : currentActiveChat?.other_user?.email) || ''
         };
         
         // Always add message to state if it's for the active chat
         if (currentActiveChat && data.data.chat_id === currentActiveChat.id) {
           console.log('✅ Adding message to active chat');
+          // A jump in seq means messages were missed: fetch exactly that range
+          if (newMessage.seq && lastSeqRef.current && newMessage.seq > lastSeqRef.current + 1) {
+            loadMissingMessages(currentActiveChat.id, lastSeqRef.current, newMessage.seq);
+          }
+          lastSeqRef.current = Math.max(lastSeqRef.current, newMessage.seq || 0);
+          if (newMessage.sender_id !== user?.id) {
+            api.markChatRead(currentActiveChat.id).catch(() => {});
+          }
           setMessages(prev => {
             // Check if message already exists by ID
             const exists = prev.some(msg => msg.id === newMessage.id);
@@ -189,6 +263,17 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
         refreshChats();
         break;
 
+      case 'user_directory':
+        // Profiles of the users we chat with, sent once per connection
+        data.data.users.forEach((profile: any) => usersRef.current.set(profile.id, profile));
+        break;
+
+      case 'user_updated':
+        // A profile changed: update the directory and the chat list
+        usersRef.current.set(data.data.id, data.data);
+        refreshChats();
+        break;
+
       case 'chat_request':
         // Refresh requests
         refreshRequests();
@@ -219,6 +304,21 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
         refreshChats();
         break;
 
+      case 'reconnect':
+        // The server is restarting: move to another one after the delay it picked for this client
+        setTimeout(() => {
+          if (wsRef.current) {
+            reconnectNowRef.current = true;
+            wsRef.current.close(1000);
+          }
+        }, data.data.retry_after * 1000);
+        break;
+
+      case 'chat_mode':
+        // A participant switched the chat between stored and ephemeral
+        refreshChats();
+        break;
+
       case 'chat_cleared':
         // Clear messages
         if (activeChat && activeChat.id === data.data.chat_id) {
@@ -246,8 +346,14 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
 
   const refreshChats = async () => {
     try {
-      const response = await api.getActiveChats();
-      setChats(response.chats);
+      // The list is paginated: follow next_cursor so older chats aren't left out
+      let response = await api.getActiveChats();
+      const all: Chat[] = [...response.chats];
+      while (response.next_cursor) {
+        response = await api.getActiveChats(response.next_cursor);
+        all.push(...response.chats);
+      }
+      setChats(all);
     } catch (error) {
       console.error('Failed to refresh chats:', error);
     }
@@ -265,12 +371,36 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
   const loadMessages = async (chatId: number) => {
     try {
       const response = await api.getMessages(chatId);
-      setMessages(response.messages);
+      // Messages only carry sender_id; attach names from the users listed alongside
+      (response.users || []).forEach((profile: any) => usersRef.current.set(profile.id, profile));
+      lastSeqRef.current = response.last_seq || 0;
+      setMessages(response.messages.map(withSender));
+      api.markChatRead(chatId).catch(() => {});
     } catch (error) {
       console.error('Failed to load messages:', error);
     }
   };
 
+  const withSender = (msg: Message) => ({
+    ...msg,
+    username: usersRef.current.get(msg.sender_id)?.username || '',
+    email: usersRef.current.get(msg.sender_id)?.email || ''
+  });
+
+  const loadMissingMessages = async (chatId: number, afterSeq: number, beforeSeq: number) => {
+    try {
+      const response = await api.getMessages(chatId, { after_seq: afterSeq, before_seq: beforeSeq });
+      setMessages(prev => {
+        const known = new Set(prev.map(msg => msg.id));
+        const missing = response.messages.filter(msg => !known.has(msg.id)).map(withSender);
+        // Unsent optimistic messages have no seq yet and stay at the end
+        return [...prev, ...missing].sort((a, b) => (a.seq ?? Infinity) - (b.seq ?? Infinity));
+      });
+    } catch (error) {
+      console.error('Failed to load missing messages:', error);
+    }
+  };
+
   const sendMessage = async (message: string, messageType: string = 'text') => {
     if (!activeChat || !user) return;
 
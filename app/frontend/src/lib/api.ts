@@ -47,12 +47,28 @@ export interface Chat {
   next_verification: string;
   verification_pending: boolean;
   created_at: string;
+  last_message?: Message | null;
+  last_activity?: string;
+  unread_count?: number;
+  // Messages are relayed only, never stored by the server
+  ephemeral?: boolean;
 }
 
-export interface Message {
+export interface UserProfile {
   id: number;
+  email: string;
+  username?: string;
+  profile_picture?: string;
+  public_key?: string;
+  profile_version: number;
+}
+
+export interface Message {
+  // Ephemeral messages have string ids and no seq
+  id: number | string;
   chat_id: number;
   sender_id: number;
+  seq?: number;
   encrypted_content: string;
   created_at: string;
   email: string;
@@ -162,15 +178,37 @@ class ApiClient {
     });
   }
 
-  async getActiveChats(): Promise<{ chats: Chat[] }> {
-    return this.request('/chat/active');
+  async getActiveChats(cursor?: string | null, limit: number = 200): Promise<{ chats: Chat[]; next_cursor: string | null }> {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) params.set('cursor', cursor);
+    return this.request(`/chat/active?${params}`);
   }
 
-  async getMessages(chat_id: number): Promise<{ messages: Message[] }> {
-    return this.request(`/chat/messages/${chat_id}`);
+  async getMessages(
+    chat_id: number,
+    range: { after_seq?: number; before_seq?: number } = {}
+  ): Promise<{ messages: Message[]; users?: UserProfile[]; last_seq?: number }> {
+    const params = new URLSearchParams();
+    if (range.after_seq !== undefined) params.set('after_seq', String(range.after_seq));
+    if (range.before_seq !== undefined) params.set('before_seq', String(range.before_seq));
+    const query = params.toString();
+    return this.request(`/chat/messages/${chat_id}${query ? `?${query}` : ''}`);
+  }
+
+  async markChatRead(chat_id: number): Promise<{ status: string }> {
+    return this.request(`/chat/read/${chat_id}`, {
+      method: 'POST',
+    });
+  }
+
+  async setChatMode(chat_id: number, ephemeral: boolean): Promise<{ chat_id: number; ephemeral: boolean }> {
+    return this.request(`/chat/mode/${chat_id}`, {
+      method: 'POST',
+      body: JSON.stringify({ ephemeral }),
+    });
   }
 
-  async sendMessage(chat_id: number, content: string, message_type: string = 'text'): Promise<{ message_id: number; status: string }> {
+  async sendMessage(chat_id: number, content: string, message_type: string = 'text'): Promise<{ message_id: number | string; status: string }> {
     return this.request('/chat/send', {
       method: 'POST',
       body: JSON.stringify({ chat_id, content, message_type }),